@@ -1,9 +1,52 @@
-import os, shutil, json
-from flask import Flask, request, jsonify, render_template
+import os, json, threading, time, uuid
+from flask import Flask, Response, request, jsonify, render_template, g
 from rdbms.executor import Executor
+from rdbms.sort import SORT_MEMORY_BYTES
 
 app = Flask(__name__)
-executor = Executor()
+# set RDBMS_RESULT_CACHE_BYTES to cache SELECT results within that many bytes,
+# RDBMS_SLOW_QUERY_MS to log slower statements to RDBMS_SLOW_QUERY_LOG,
+# RDBMS_SORT_MEMORY_BYTES to change the memory ORDER BY sorts in before spilling to disk, and
+# RDBMS_IMPORT_DIR to let COPY read files from that directory instead of the data directory
+slow_query_ms = os.environ.get("RDBMS_SLOW_QUERY_MS")
+executor = Executor(result_cache_bytes=int(os.environ.get("RDBMS_RESULT_CACHE_BYTES", "0")),
+                    slow_query_ms=float(slow_query_ms) if slow_query_ms else None,
+                    slow_query_log=os.environ.get("RDBMS_SLOW_QUERY_LOG", "slow_queries.log"),
+                    sort_memory_bytes=int(os.environ.get("RDBMS_SORT_MEMORY_BYTES", SORT_MEMORY_BYTES)),
+                    import_dir=os.environ.get("RDBMS_IMPORT_DIR"))
+
+# every browser gets its own session, found by a cookie, so its transaction is
+# its own; sessions idle for SESSION_IDLE_SECONDS are closed, rolling back
+# whatever transaction they left open
+SESSION_COOKIE = "rdbms_session"
+SESSION_IDLE_SECONDS = 600
+sessions = {}  # client id -> [session, last used]
+sessions_lock = threading.Lock()
+
+def client_session():
+    now = time.monotonic()
+    client = request.cookies.get(SESSION_COOKIE)
+    with sessions_lock:
+        idle = [key for key, (_, used) in sessions.items()
+                if key != client and now - used > SESSION_IDLE_SECONDS]
+        expired = [sessions.pop(key)[0] for key in idle]
+        entry = sessions.get(client)
+        if entry is None:
+            client = g.new_session = uuid.uuid4().hex
+            entry = sessions[client] = [executor.session(), now]
+        entry[1] = now
+    for session in expired:
+        try:
+            session.close()
+        except Exception:
+            pass
+    return entry[0]
+
+@app.after_request
+def set_session_cookie(response):
+    if "new_session" in g:
+        response.set_cookie(SESSION_COOKIE, g.new_session, httponly=True, samesite="Strict")
+    return response
 
 @app.route("/")
 def index():
@@ -14,15 +57,40 @@ def run():
     cmd = request.json.get("command", "").strip()
     try:
         if cmd.upper() == "RESET DATABASE":
-            if os.path.exists("data"):
-                shutil.rmtree("data")
-            os.makedirs("data")
-            executor.tables.clear()
-            return jsonify({"success": True, "result": "Database reset successfully."})
+            return jsonify({"success": True, "result": executor.reset()})
         
-        result = executor.execute(cmd)
+        result = client_session().execute(cmd)
         return jsonify({"success": True, "result": result})
     except Exception as e:
         return jsonify({"success": False, "result": str(e)})
+
+@app.route("/stream", methods=["POST"])
+def stream():
+    # SELECT rows are sent as newline-delimited JSON while they are produced
+    cmd = request.json.get("command", "").strip()
+    try:
+        cursor = client_session().cursor(cmd)
+    except Exception as e:
+        return jsonify({"success": False, "result": str(e)})
+    if not cursor.is_query:
+        return jsonify({"success": True, "result": cursor.result})
+
+    def generate():
+        try:
+            for row in cursor:
+                yield json.dumps(row) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+@app.route("/metrics")
+def metrics():
+    return jsonify(executor.metrics_report())
+
+@app.route("/cache")
+def cache():
+    return jsonify(executor.cache_stats() or {"enabled": False})
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
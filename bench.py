@@ -0,0 +1,289 @@
+# bench.py
+# Reproducible benchmark of the engine on synthetic users / orders tables.
+#
+#   python bench.py                              1k and 100k rows, Executor and /run
+#   python bench.py --sizes 1000,100000,1000000  full run
+#   python bench.py --save-baseline              store the results as the baseline
+#   python bench.py --baseline bench_baseline.json   compare, exit 1 on regressions
+#
+# Every (api, size) pair runs in its own process on a fresh temporary data
+# directory. The operations of a run share that process, and the OS only keeps
+# its peak RSS, so each operation reports how far it raised that peak
+# (peak_rss_growth_kb, 0 when it stayed below what earlier ones reached) and
+# every row also carries the peak of the whole run (run_peak_rss_kb).
+# Results are written as JSON.
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CITIES = ["Nairobi", "Lagos", "Cairo", "Accra", "Kigali", "Dakar", "Tunis", "Lusaka"]
+STATUSES = ["new", "paid", "shipped", "delivered", "cancelled"]
+DEFAULT_OUTPUT = "bench_results.json"
+DEFAULT_BASELINE = "bench_baseline.json"
+
+
+# ----------------- DATA -----------------
+def generate_users(n, rng):
+    for i in range(n):
+        yield {"id": i, "name": f"user{i}", "email": f"user{i}@example.com",
+               "age": rng.randint(18, 90), "city": rng.choice(CITIES)}
+
+
+def generate_orders(n, users, rng):
+    for i in range(n):
+        yield {"id": i, "user_id": rng.randrange(users), "total": round(rng.uniform(1, 1000), 2),
+               "status": rng.choice(STATUSES)}
+
+
+def write_csv(path, rows, columns):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# ----------------- CLIENTS -----------------
+class ExecutorClient:
+    name = "executor"
+
+    def __init__(self):
+        from rdbms.executor import Executor
+        self.executor = Executor()
+
+    def run(self, sql):
+        return self.executor.execute(sql)
+
+    def load(self, table, rows, csv_path):
+        self.executor.insert_many(table, rows)
+
+
+class HttpClient:
+    # POST /run through the Flask test client: request parsing, JSON encoding
+    # and the route itself, without a network socket
+    name = "http"
+
+    def __init__(self):
+        import app
+        self.client = app.app.test_client()
+
+    def run(self, sql):
+        body = self.client.post("/run", json={"command": sql}).get_json()
+        if not body["success"]:
+            raise ValueError(body["result"])
+        return body["result"]
+
+    def load(self, table, rows, csv_path):
+        self.run(f"COPY {table} FROM '{csv_path}'")
+
+
+# ----------------- MEASUREMENT -----------------
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KiB elsewhere
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def measure(op, statements, client):
+    # statements yields SQL text; rows counts what each one returned or changed
+    latencies, rows = [], 0
+    rss_before = peak_rss_kb()
+    start = time.perf_counter()
+    for sql in statements:
+        t = time.perf_counter()
+        result = client.run(sql)
+        latencies.append(time.perf_counter() - t)
+        rows += len(result) if isinstance(result, list) else 1
+    return summarize(op, latencies, rows, time.perf_counter() - start, rss_before)
+
+
+def summarize(op, latencies, rows, seconds, rss_before):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "op": op,
+        "count": len(latencies),
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "ops_per_sec": round(len(latencies) / seconds, 1) if seconds else None,
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "peak_rss_growth_kb": peak_rss_kb() - rss_before if rss_before is not None else None,
+    }
+
+
+def run_one(api, size, args):
+    from rdbms import table as table_module
+    rng = random.Random(args.seed)
+    data_dir = tempfile.mkdtemp(prefix="rdbms-bench-")
+    table_module.DATA_DIR = data_dir  # before the app module opens its catalog
+    client = ExecutorClient() if api == "executor" else HttpClient()
+    storage = args.storage
+    queries = args.queries
+    results = []
+
+    client.run(f"CREATE TABLE users id:INT name:TEXT email:TEXT age:INT city:TEXT "
+               f"PRIMARY_KEY=id UNIQUE=email STORAGE={storage}")
+    client.run(f"CREATE TABLE orders id:INT user_id:INT total:FLOAT status:TEXT PRIMARY_KEY=id STORAGE={storage}")
+    client.run("CREATE INDEX ON orders(user_id)")
+    client.run("CREATE INDEX ON orders(total) USING ORDERED")
+
+    # ingest: insert_many through the executor, COPY from a CSV file over /run
+    for name, rows, columns in (
+            ("users", list(generate_users(size, rng)), ["id", "name", "email", "age", "city"]),
+            ("orders", list(generate_orders(size, size, rng)), ["id", "user_id", "total", "status"])):
+        csv_path = os.path.join(data_dir, f"{name}.csv")
+        if api == "http":
+            write_csv(csv_path, rows, columns)
+        rss_before = peak_rss_kb()
+        start = time.perf_counter()
+        client.load(name, rows, csv_path)
+        seconds = time.perf_counter() - start
+        results.append(summarize(f"ingest_{name}", [seconds], len(rows), seconds, rss_before))
+        del rows
+
+    n = min(queries, 200)
+    results.append(measure("insert", (
+        f"INSERT users id={size + i} name=new{i} email=new{i}@example.com age=30 city=Nairobi"
+        for i in range(n)), client))
+    results.append(measure("point_lookup", (
+        f"SELECT * FROM users WHERE id={rng.randrange(size)}" for _ in range(queries)), client))
+    results.append(measure("index_lookup", (
+        f"SELECT id, total FROM orders WHERE user_id={rng.randrange(size)}" for _ in range(queries)), client))
+    # range scan through the ordered index, first 100 matches
+    results.append(measure("range_lookup", (
+        f"SELECT id, total FROM orders WHERE total>={round(rng.uniform(1, 999), 2)} LIMIT 100"
+        for _ in range(queries)), client))
+    results.append(measure("join_lookup", (
+        f"SELECT users.name, orders.total FROM users JOIN orders ON users.id=orders.user_id "
+        f"WHERE users.id={rng.randrange(size)}" for _ in range(queries)), client))
+    repeats = max(1, min(queries // 100, 1000000 // size))
+    results.append(measure("group_by", (
+        "SELECT status, COUNT(*), SUM(total) FROM orders GROUP BY status" for _ in range(repeats)), client))
+    results.append(measure("join_aggregate", (
+        "SELECT users.city, COUNT(*) FROM users JOIN orders ON users.id=orders.user_id GROUP BY users.city"
+        for _ in range(repeats)), client))
+    results.append(measure("update", (
+        f"UPDATE orders SET status=paid WHERE id={rng.randrange(size)}" for _ in range(n)), client))
+    deleted = rng.sample(range(size), min(size, max(1, queries // 50)))
+    results.append(measure("delete", (f"DELETE FROM orders WHERE id={i}" for i in deleted), client))
+
+    run_peak = peak_rss_kb()
+    for row in results:
+        row.update({"api": api, "size": size, "run_peak_rss_kb": run_peak})
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+# ----------------- REPORTING -----------------
+def compare(results, baseline, tolerance):
+    # a regression is a p50 latency or throughput worse than the baseline by more than tolerance
+    previous = {(row["api"], row["size"], row["op"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = previous.get((row["api"], row["size"], row["op"]))
+        if old is None:
+            continue
+        if old.get("p50_ms") and row["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+            regressions.append((row, "p50_ms", old["p50_ms"], row["p50_ms"]))
+        if old.get("rows_per_sec") and row["rows_per_sec"] < old["rows_per_sec"] / (1 + tolerance):
+            regressions.append((row, "rows_per_sec", old["rows_per_sec"], row["rows_per_sec"]))
+    return regressions
+
+
+def print_table(results):
+    header = f"{'api':<9}{'size':>9}  {'op':<16}{'count':>7}{'rows/s':>13}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'+rss MiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        rss = row["peak_rss_growth_kb"] / 1024 if row["peak_rss_growth_kb"] else 0
+        print(f"{row['api']:<9}{row['size']:>9}  {row['op']:<16}{row['count']:>7}{row['rows_per_sec'] or 0:>13.1f}"
+              f"{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}{rss:>10.1f}")
+    runs = {(row["api"], row["size"]): row["run_peak_rss_kb"] for row in results}
+    for (api, size), peak in runs.items():
+        if peak:
+            print(f"peak RSS of {api} at {size} rows: {peak / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MiniRDBMS benchmark")
+    parser.add_argument("--sizes", default="1000,100000", help="comma separated row counts per table")
+    parser.add_argument("--apis", default="executor,http", help="executor, http or both")
+    parser.add_argument("--storage", default="ROW", choices=["ROW", "COLUMN"])
+    parser.add_argument("--queries", type=int, default=500, help="statements per lookup benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also write the results to {DEFAULT_BASELINE}")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a regression is reported")
+    parser.add_argument("--worker", nargs=2, metavar=("API", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        api, size = args.worker
+        json.dump(run_one(api, int(size), args), sys.stdout)
+        return 0
+
+    results = []
+    passthrough = ["--storage", args.storage, "--queries", str(args.queries), "--seed", str(args.seed)]
+    for api in args.apis.split(","):
+        for size in args.sizes.split(","):
+            print(f"running {api} at {size} rows ...", file=sys.stderr)
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", api, size] + passthrough,
+                                  stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if proc.returncode:
+                print(f"{api} at {size} rows failed", file=sys.stderr)
+                return proc.returncode
+            results.extend(json.loads(proc.stdout))
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "storage": args.storage, "queries": args.queries, "seed": args.seed,
+                 "date": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    print_table(results)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for row, metric, old, new in regressions:
+            print(f"REGRESSION {row['api']} {row['size']} {row['op']}: {metric} {old} -> {new}")
+        if regressions:
+            return 1
+        print("no regressions against", args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
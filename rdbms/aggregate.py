@@ -0,0 +1,172 @@
+# aggregate.py
+# Hash aggregation for GROUP BY and COUNT / SUM / AVG / MIN / MAX. Input arrives
+# as column batches ({column: values}, row count); each aggregate consumes the
+# values of a whole batch (or of one group within it) through the builtin
+# sum/min/max, so numeric columns are reduced without a Python loop per row.
+# Partitions are aggregated separately and their accumulators merged.
+
+
+def _non_null(values):
+    return [v for v in values if v is not None] if None in values else values
+
+
+class Count:
+    def __init__(self):
+        self.value = 0
+
+    def update(self, values, n):
+        # values is None for COUNT(*)
+        self.value += n if values is None else len(_non_null(values))
+
+    def merge(self, other):
+        self.value += other.value
+
+    def result(self):
+        return self.value
+
+
+class Sum:
+    def __init__(self):
+        self.value = None
+
+    def update(self, values, n):
+        values = _non_null(values)
+        if len(values):
+            self.value = sum(values, self.value or 0)
+
+    def merge(self, other):
+        if other.value is not None:
+            self.value = other.value if self.value is None else self.value + other.value
+
+    def result(self):
+        return self.value
+
+
+class Avg:
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def update(self, values, n):
+        values = _non_null(values)
+        self.total += sum(values)
+        self.count += len(values)
+
+    def merge(self, other):
+        self.total += other.total
+        self.count += other.count
+
+    def result(self):
+        return self.total / self.count if self.count else None
+
+
+class Min:
+    pick = staticmethod(min)
+
+    def __init__(self):
+        self.value = None
+
+    def update(self, values, n):
+        values = _non_null(values)
+        if len(values):
+            best = self.pick(values)
+            self.value = best if self.value is None else self.pick(self.value, best)
+
+    def merge(self, other):
+        if other.value is not None:
+            self.update([other.value], 1)
+
+    def result(self):
+        return self.value
+
+
+class Max(Min):
+    pick = staticmethod(max)
+
+
+AGGREGATES = {"COUNT": Count, "SUM": Sum, "AVG": Avg, "MIN": Min, "MAX": Max}
+
+
+def hash_aggregate(batches, items, group_by, aggregates):
+    # items is the SELECT list: group column names and Aggregate nodes
+    return finish_groups(partial_aggregate(batches, group_by, aggregates), items, group_by, aggregates)
+
+
+def partial_aggregate(batches, group_by, aggregates):
+    groups = {}  # group key tuple -> [accumulators]
+    try:
+        for batch, n in batches:
+            if group_by:
+                members = {}
+                for i, key in enumerate(zip(*(batch[col] for col in group_by))):
+                    members.setdefault(key, []).append(i)
+            else:
+                members = {(): None}  # the whole batch is one group
+            for key, idx in members.items():
+                accs = groups.get(key)
+                if accs is None:
+                    accs = groups[key] = [AGGREGATES[agg.func]() for agg in aggregates]
+                for acc, agg in zip(accs, aggregates):
+                    values = None
+                    if agg.column is not None:
+                        values = batch[agg.column]
+                        if idx is not None:
+                            values = [values[i] for i in idx]
+                    acc.update(values, n if idx is None else len(idx))
+    except TypeError:
+        raise ValueError("Aggregate applied to values of the wrong type")
+    return groups
+
+
+def merge_groups(partials):
+    # combine the groups of partial_aggregate over several partitions
+    groups = {}
+    try:
+        for partial in partials:
+            for key, accs in partial.items():
+                mine = groups.get(key)
+                if mine is None:
+                    groups[key] = accs
+                else:
+                    for acc, other in zip(mine, accs):
+                        acc.merge(other)
+    except TypeError:
+        raise ValueError("Aggregate applied to values of the wrong type")
+    return groups
+
+
+def finish_groups(groups, items, group_by, aggregates):
+    if not groups and not group_by:
+        groups[()] = [AGGREGATES[agg.func]() for agg in aggregates]
+    result = []
+    for key, accs in groups.items():
+        group = dict(zip(group_by, key))
+        values = {agg.name: acc.result() for agg, acc in zip(aggregates, accs)}
+        result.append({item if isinstance(item, str) else item.name:
+                       group[item] if isinstance(item, str) else values[item.name] for item in items})
+    return result
+
+
+def from_metadata(table, path, aggregates):
+    # COUNT(*) from the row count or an exact index lookup, MIN/MAX from the
+    # ends of an ordered index; None when some aggregate still needs a scan
+    values = {}
+    for agg in aggregates:
+        if agg.func == "COUNT" and agg.column is None:
+            if path is None:
+                values[agg.name] = len(table)
+            elif path.kind != "scan" and not path.residual:
+                values[agg.name] = path.estimate
+            else:
+                return None
+        elif (agg.func in ("MIN", "MAX") and path is None and agg.column in table.indexes
+              and table.indexes[agg.column].kind == "ORDERED"):
+            # a hash index would have to look at every distinct value, no cheaper than a scan
+            idx = table.indexes[agg.column]
+            try:
+                values[agg.name] = idx.min_value() if agg.func == "MIN" else idx.max_value()
+            except TypeError:
+                return None
+        else:
+            return None
+    return values
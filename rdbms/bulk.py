@@ -0,0 +1,81 @@
+# bulk.py
+# Row readers for COPY table FROM 'file.csv' | 'file.jsonl'. Files are only
+# read from the import directory, and errors name the line and column of a
+# bad value but never repeat the file's content.
+import csv
+import json
+import os
+
+from .storage import coerce
+
+CONVERTERS = {"INT": int, "FLOAT": float, "TEXT": str}
+
+
+def _invalid(columns, col, line):
+    return ValueError(f"Invalid {columns[col]} value for column '{col}' on line {line}")
+
+
+def _convert(columns, col, text, line):
+    if text == "":
+        return None
+    converter = CONVERTERS.get(columns.get(col))
+    if converter is None:
+        return text
+    try:
+        return converter(text)
+    except ValueError:
+        raise _invalid(columns, col, line)
+
+
+def _coerce(columns, col, value, line):
+    # unknown columns are reported by the table
+    if col not in columns:
+        return value
+    try:
+        return coerce(columns, col, value)
+    except (ValueError, TypeError):
+        raise _invalid(columns, col, line)
+
+
+def read_csv(path, columns):
+    # the first line holds the column names
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield {col: _convert(columns, col, text, reader.line_num) for col, text in record.items()}
+
+
+def read_jsonl(path, columns):
+    with open(path) as f:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError:
+                raise ValueError(f"Invalid JSON on line {line}")
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {line} is not a JSON object")
+            yield {col: _coerce(columns, col, value, line) for col, value in record.items()}
+
+
+def import_path(path, directory):
+    # path is relative to the import directory, and may not leave it through
+    # .. or a symbolic link
+    root = os.path.realpath(directory)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root:
+        raise ValueError("COPY can only read files in the import directory")
+    return full
+
+
+def read_rows(path, columns, directory):
+    full = import_path(path, directory)
+    if not os.path.isfile(full):
+        raise ValueError(f"File '{path}' does not exist")
+    ext = os.path.splitext(full)[1].lower()
+    if ext == ".csv":
+        return list(read_csv(full, columns))
+    if ext in (".jsonl", ".ndjson"):
+        return list(read_jsonl(full, columns))
+    raise ValueError("COPY supports .csv and .jsonl files")
@@ -0,0 +1,63 @@
+# cache.py
+# Opt-in cache of SELECT results. Entries are keyed by the normalized statement,
+# its parameter values and the versions of the tables it read; every write to a
+# table gives it a new version, so a stale entry is simply never looked up again
+# and ages out of the LRU order.
+import sys
+import threading
+from collections import OrderedDict
+
+
+def result_size(rows):
+    # rough number of bytes held by a list of row dicts
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(val) for val in row.values())
+    return size
+
+
+class ResultCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (rows, size)
+        self._mutex = threading.Lock()
+
+    def get(self, key):
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(row) for row in entry[0]]
+
+    def put(self, key, rows):
+        rows = [dict(row) for row in rows]  # callers may change the rows they were given
+        size = result_size(rows)
+        if size > self.max_bytes:
+            return
+        with self._mutex:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (rows, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._mutex:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._mutex:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,130 @@
+# catalog.py
+# Persistent catalog of table definitions (data/catalog.json). Tables listed in
+# the catalog are opened lazily, the first time they are looked up.
+import json
+import os
+import threading
+
+from . import table as table_module
+from .table import Table
+from .partition import PartitionedTable
+
+
+class Catalog:
+    def __init__(self):
+        self.definitions = {}  # name -> schema, constraints and index definitions
+        self._open = {}  # name -> Table
+        self._mutex = threading.RLock()  # two threads must not open the same table twice
+        self.load()
+
+    @property
+    def path(self):
+        return os.path.join(table_module.DATA_DIR, "catalog.json")
+
+    def load(self):
+        self.definitions = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.definitions = json.load(f)
+
+    def save(self):
+        if not os.path.exists(table_module.DATA_DIR):
+            os.makedirs(table_module.DATA_DIR)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.definitions, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def register(self, table):
+        # record (or refresh) the definition of an open table
+        with self._mutex:
+            self._register(table)
+
+    def _register(self, table):
+        self.definitions[table.name] = {
+            "columns": table.columns,
+            "primary_key": table.primary_key,
+            "unique": table.unique,
+            "storage": table.storage,
+            "format": table.file_format,
+            "indexes": table.index_definitions(),
+        }
+        if isinstance(table, PartitionedTable):
+            self.definitions[table.name]["partition"] = table.partition_spec()
+        self.save()
+
+    def _open_table(self, name):
+        spec = self.definitions[name]
+        args = (name, spec["columns"], spec.get("primary_key"), spec.get("unique"),
+                spec.get("storage", "ROW"), spec.get("format", "JSON"))
+        if spec.get("partition"):
+            table = PartitionedTable(*args, partition=spec["partition"])
+        else:
+            table = Table(*args)
+        for col, kind in spec.get("indexes", {}).items():
+            table.create_index(col, kind)
+        self._open[name] = table
+        return table
+
+    def opened(self):
+        return list(self._open.values())
+
+    def __contains__(self, name):
+        return name in self.definitions
+
+    def __getitem__(self, name):
+        table = self._open.get(name)
+        if table is not None:
+            return table
+        with self._mutex:
+            if name in self._open:
+                return self._open[name]
+            if name not in self.definitions:
+                raise KeyError(name)
+            return self._open_table(name)
+
+    def __setitem__(self, name, table):
+        with self._mutex:
+            old = self._open.get(name)
+            if old is not None and old is not table:
+                old.close()
+            self._open[name] = table
+            self._register(table)
+
+    def __delitem__(self, name):
+        with self._mutex:
+            table = self._open.pop(name, None)
+            if table is not None:
+                table.close()
+            del self.definitions[name]
+            self.save()
+
+    def __iter__(self):
+        return iter(list(self.definitions))
+
+    def __len__(self):
+        return len(self.definitions)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def keys(self):
+        return list(self.definitions)
+
+    def values(self):
+        return [self[name] for name in self.definitions]
+
+    def items(self):
+        return [(name, self[name]) for name in self.definitions]
+
+    def close(self):
+        for table in self._open.values():
+            table.close()
+
+    def clear(self):
+        with self._mutex:
+            self.close()
+            self._open.clear()
+            self.definitions = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,298 @@
+# chunked.py
+# Containers split into chunks that copies share until one side changes them.
+# copy() only copies the list of chunks; whichever side writes to a chunk
+# afterwards copies that one chunk first, so a write costs the same however
+# large the container is.
+#   ChunkedSequence - a list, array or bytearray addressed by position
+#   ChunkedBag      - items in the order they were added, any of them removable
+#   ChunkedDict     - a dict split into buckets by hash (ChunkedSet: a set)
+from itertools import chain, islice
+
+CHUNK_BITS = 10
+CHUNK = 1 << CHUNK_BITS  # items per chunk, the same as a scan batch
+MASK = CHUNK - 1
+BUCKET_SIZE = 1024  # average entries per bucket before a ChunkedDict doubles its buckets
+
+
+class ChunkedSequence:
+    __slots__ = ("empty", "chunks", "owned", "length")
+
+    def __init__(self, empty, items=()):
+        self.empty = empty  # an empty chunk of the right type: [], array(typecode) or bytearray()
+        self.chunks = []
+        self.owned = []  # per chunk: False while a copy may still share it
+        self.length = 0
+        self.extend(items)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return chain.from_iterable(self.chunks)
+
+    def __getitem__(self, pos):
+        return self.chunks[pos >> CHUNK_BITS][pos & MASK]
+
+    def __setitem__(self, pos, value):
+        self._own(pos >> CHUNK_BITS)[pos & MASK] = value
+
+    def _own(self, c):
+        if not self.owned[c]:
+            self.chunks[c] = self.chunks[c][:]
+            self.owned[c] = True
+        return self.chunks[c]
+
+    def append(self, value):
+        if self.length & MASK:
+            self._own(len(self.chunks) - 1).append(value)
+        else:
+            chunk = self.empty[:]
+            chunk.append(value)
+            self.chunks.append(chunk)
+            self.owned.append(True)
+        self.length += 1
+
+    def extend(self, items):
+        items = iter(items)
+        while True:
+            room = CHUNK - (self.length & MASK)
+            part = list(islice(items, room))
+            if not part:
+                return
+            if room == CHUNK:
+                chunk = self.empty[:]
+                chunk.extend(part)
+                self.chunks.append(chunk)
+                self.owned.append(True)
+            else:
+                self._own(len(self.chunks) - 1).extend(part)
+            self.length += len(part)
+
+    def take(self, positions):
+        # the items at positions; a contiguous range comes back as one chunk-typed slice
+        if isinstance(positions, range) and positions.step == 1:
+            return self.slice(positions.start, positions.stop)
+        chunks = self.chunks
+        return [chunks[pos >> CHUNK_BITS][pos & MASK] for pos in positions]
+
+    def slice(self, start, stop):
+        stop = min(stop, self.length)
+        if start >= stop:
+            return self.empty[:]
+        first, last = start >> CHUNK_BITS, (stop - 1) >> CHUNK_BITS
+        if first == last:
+            return self.chunks[first][start & MASK:stop - (first << CHUNK_BITS)]
+        result = self.empty[:]
+        for c in range(first, last + 1):
+            base = c << CHUNK_BITS
+            result.extend(self.chunks[c][max(start - base, 0):stop - base])
+        return result
+
+    def truncate(self, length):
+        if length >= self.length:
+            return
+        count = (length + MASK) >> CHUNK_BITS
+        del self.chunks[count:]
+        del self.owned[count:]
+        if length & MASK:
+            del self._own(count - 1)[length & MASK:]
+        self.length = length
+
+    def copy(self):
+        other = ChunkedSequence.__new__(ChunkedSequence)
+        other.empty = self.empty
+        other.chunks = list(self.chunks)
+        other.length = self.length
+        other.owned = [False] * len(self.chunks)
+        self.owned = [False] * len(self.chunks)
+        return other
+
+
+class ChunkedBag:
+    __slots__ = ("chunks", "owned", "length")
+
+    def __init__(self, items=()):
+        items = list(items)
+        self.chunks = [items[i:i + CHUNK] for i in range(0, len(items), CHUNK)]
+        self.owned = [True] * len(self.chunks)
+        self.length = len(items)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return chain.from_iterable(self.chunks)
+
+    def _own(self, c):
+        if not self.owned[c]:
+            self.chunks[c] = self.chunks[c][:]
+            self.owned[c] = True
+        return self.chunks[c]
+
+    def append(self, item):
+        if self.chunks and len(self.chunks[-1]) < CHUNK:
+            self._own(len(self.chunks) - 1).append(item)
+        else:
+            self.chunks.append([item])
+            self.owned.append(True)
+        self.length += 1
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def remove(self, item):
+        for c, chunk in enumerate(self.chunks):
+            if item in chunk:
+                chunk = self._own(c)
+                chunk.remove(item)
+                if not chunk:
+                    del self.chunks[c]
+                    del self.owned[c]
+                self.length -= 1
+                return
+        raise ValueError(f"{item!r} is not in the bag")
+
+    def copy(self):
+        other = ChunkedBag.__new__(ChunkedBag)
+        other.chunks = list(self.chunks)
+        other.length = self.length
+        other.owned = [False] * len(self.chunks)
+        self.owned = [False] * len(self.chunks)
+        return other
+
+
+class ChunkedDict:
+    __slots__ = ("buckets", "owned", "size")
+    bucket_type = dict
+
+    def __init__(self, items=()):
+        entries = self.bucket_type(items)
+        count = 1
+        while count * BUCKET_SIZE < len(entries):
+            count *= 2
+        self._fill(count, entries)
+
+    def _fill(self, count, entries):
+        self.buckets = [self.bucket_type() for _ in range(count)]
+        self.owned = [True] * count
+        self.size = len(entries)
+        if count == 1:
+            self.buckets[0] = entries
+            return
+        mask = count - 1
+        buckets = self.buckets
+        for key, value in entries.items():
+            buckets[hash(key) & mask][key] = value
+
+    def _own(self, key):
+        b = hash(key) & (len(self.buckets) - 1)
+        if not self.owned[b]:
+            self.buckets[b] = self.bucket_type(self.buckets[b])
+            self.owned[b] = True
+        return self.buckets[b]
+
+    def _grow(self):
+        count = len(self.buckets)
+        while count * BUCKET_SIZE < self.size:
+            count *= 2
+        entries = self.bucket_type()
+        for bucket in self.buckets:
+            entries.update(bucket)
+        self._fill(count, entries)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return chain.from_iterable(self.buckets)
+
+    def __contains__(self, key):
+        return key in self.buckets[hash(key) & (len(self.buckets) - 1)]
+
+    def __getitem__(self, key):
+        return self.buckets[hash(key) & (len(self.buckets) - 1)][key]
+
+    def get(self, key, default=None):
+        return self.buckets[hash(key) & (len(self.buckets) - 1)].get(key, default)
+
+    def __setitem__(self, key, value):
+        bucket = self._own(key)
+        if key in bucket:
+            bucket[key] = value
+            return
+        bucket[key] = value
+        self.size += 1
+        if self.size > len(self.buckets) * BUCKET_SIZE:
+            self._grow()
+
+    def update(self, items):
+        own = self._own
+        for key, value in items:
+            bucket = own(key)
+            if key not in bucket:
+                self.size += 1
+            bucket[key] = value
+        if self.size > len(self.buckets) * BUCKET_SIZE:
+            self._grow()
+
+    def __delitem__(self, key):
+        del self._own(key)[key]
+        self.size -= 1
+
+    def pop(self, key, *default):
+        if key in self:
+            self.size -= 1
+            return self._own(key).pop(key)
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def items(self):
+        return chain.from_iterable(bucket.items() for bucket in self.buckets)
+
+    def copy(self):
+        other = type(self).__new__(type(self))
+        other.buckets = list(self.buckets)
+        other.size = self.size
+        other.owned = [False] * len(self.buckets)
+        self.owned = [False] * len(self.buckets)
+        return other
+
+
+class ChunkedSet(ChunkedDict):
+    __slots__ = ()
+    bucket_type = set
+
+    def _fill(self, count, entries):
+        self.buckets = [set() for _ in range(count)]
+        self.owned = [True] * count
+        self.size = len(entries)
+        if count == 1:
+            self.buckets[0] = entries
+            return
+        mask = count - 1
+        buckets = self.buckets
+        for key in entries:
+            buckets[hash(key) & mask].add(key)
+
+    def add(self, key):
+        bucket = self._own(key)
+        if key not in bucket:
+            bucket.add(key)
+            self.size += 1
+            if self.size > len(self.buckets) * BUCKET_SIZE:
+                self._grow()
+
+    def discard(self, key):
+        if key in self:
+            self._own(key).discard(key)
+            self.size -= 1
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def difference_update(self, keys):
+        for key in keys:
+            self.discard(key)
@@ -1,8 +1,10 @@
 from .table import Table
+from .catalog import Catalog
+from .join import join_tables
 
 class Database:
     def __init__(self):
-        self.tables = {}
+        self.tables = Catalog()
 
     def create_table(self, name, columns, primary_key=None, unique_keys=None):
         if name in self.tables:
@@ -19,14 +21,13 @@ class Database:
         left_table = self.get_table(left_table_name)
         right_table = self.get_table(right_table_name)
 
+        _, pairs = join_tables(left_table, right_table, left_column, right_column)
         result = []
-        for l_row in left_table.select_all():
-            for r_row in right_table.select_all():
-                if l_row[left_column] == r_row[right_column]:
-                    combined = {}
-                    for k, v in l_row.items():
-                        combined[f"{left_table_name}.{k}"] = v
-                    for k, v in r_row.items():
-                        combined[f"{right_table_name}.{k}"] = v
-                    result.append(combined)
+        for l_row, r_row in pairs:
+            combined = {}
+            for k, v in l_row.items():
+                combined[f"{left_table_name}.{k}"] = v
+            for k, v in r_row.items():
+                combined[f"{right_table_name}.{k}"] = v
+            result.append(combined)
         return result
@@ -1,208 +1,779 @@
 # executor.py
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from . import table as table_module
 from .table import Table
+from .partition import PartitionedTable
+from .locks import RWLock
+from .cache import ResultCache
+from .metrics import Metrics, Profile
+from .catalog import Catalog
+from .planner import choose_access_path, choose_order_path, describe_where
+from .predicate import conjuncts, conjoin
+from .join import join_tables, choose_join_strategy
+from . import operators
+from .bulk import read_rows
+from .aggregate import hash_aggregate, from_metadata
+from .sort import Sorter, SORT_MEMORY_BYTES, describe_order
+from .parser import (tokenize, normalize, parse, bind, DML, USER_PARAM,
+                     CreateTable, CreateIndex, Insert, Select, Update, Delete, Aggregate,
+                     Copy, Explain, Begin, Commit, Rollback)
+
+PLAN_CACHE_SIZE = 256  # parsed statements kept, keyed by normalized text
+
+
+class PreparedStatement:
+    def __init__(self, sql, stmt, literals, key=None):
+        self.sql = sql
+        self.stmt = stmt
+        self.key = key  # normalized statement text, None for statements that are not cached
+        self.literals = literals  # embedded literals, USER_PARAM where a "?" was written
+        self.param_count = literals.count(USER_PARAM)
+
+    def bind(self, params):
+        params = list(params or ())
+        if len(params) != self.param_count:
+            raise ValueError(f"Statement expects {self.param_count} parameters, got {len(params)}")
+        if not self.param_count:
+            return self.literals
+        supplied = iter(params)
+        return [next(supplied) if lit is USER_PARAM else lit for lit in self.literals]
+
+    def __repr__(self):
+        return f"PreparedStatement({self.sql!r})"
+
+
+class Cursor:
+    # rows of a SELECT are produced lazily as they are fetched; other
+    # statements run immediately and leave their message in result
+    def __init__(self, rows=None, result=None):
+        self.is_query = rows is not None
+        self.result = result
+        self._rows = iter(rows if rows is not None else ())
+
+    def __iter__(self):
+        return self._rows
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=100):
+        return list(islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        # closing the generator releases the table snapshots it reads
+        if hasattr(self._rows, "close"):
+            self._rows.close()
+        self._rows = iter(())
+
+
+class Session:
+    # one client of a shared executor. Its transaction is its own: tables it
+    # writes after BEGIN can only be written by it until COMMIT or ROLLBACK,
+    # and other sessions keep reading them as they were at BEGIN. A session
+    # runs one statement at a time.
+    def __init__(self, executor):
+        self.executor = executor
+        self.transaction = None  # {table name: (table, snapshot of its committed rows)} since BEGIN
+        self._mutex = threading.Lock()
+
+    def execute(self, cmd, params=None):
+        with self._mutex:
+            return self.executor.execute(cmd, params, self)
+
+    def cursor(self, cmd, params=None):
+        with self._mutex:
+            return self.executor.cursor(cmd, params, self)
+
+    def insert_many(self, table_name, rows):
+        with self._mutex:
+            return self.executor.insert_many(table_name, rows, self)
+
+    def close(self):
+        # an open transaction is rolled back
+        if self.transaction is not None:
+            self.execute("ROLLBACK")
+
 
 class Executor:
-    def __init__(self):
-        self.tables = {}
+    def __init__(self, result_cache_bytes=0, slow_query_ms=None, slow_query_log=None,
+                 sort_memory_bytes=SORT_MEMORY_BYTES, import_dir=None):
+        self.tables = Catalog()
+        # statements slower than slow_query_ms are appended to slow_query_log
+        self.metrics = Metrics(slow_query_ms, slow_query_log)
+        # SELECT results are cached only when given a memory budget
+        self.result_cache = ResultCache(result_cache_bytes) if result_cache_bytes else None
+        # ORDER BY without LIMIT spills sorted runs to disk beyond this many bytes
+        self.sort_memory_bytes = sort_memory_bytes
+        # COPY only reads files in import_dir, the data directory when None
+        self.import_dir = import_dir
+        self._plan_cache = OrderedDict()
+        self._plan_lock = threading.Lock()
+        self._owners = {}  # table name -> Session whose open transaction has written it
+        self._owners_lock = threading.Lock()
+        # statements share this lock; CREATE TABLE and reset() take it exclusively
+        self._lock = RWLock()
 
-    def execute(self, cmd):
-        tokens = cmd.strip().split()
+    def prepare(self, cmd):
+        tokens = tokenize(cmd)
         if not tokens:
-            return None
-        action = tokens[0].upper()
-
-        if action == "CREATE":
-            if tokens[1].upper() == "TABLE":
-                return self._create_table(tokens[2:])
-            elif tokens[1].upper() == "INDEX":
-                return self._create_index(tokens[2:])
-        elif action == "INSERT":
-            return self._insert(tokens[1:])
-        elif action == "SELECT":
-            return self._select(tokens)
-        elif action == "UPDATE":
-            return self._update(tokens[1:])
-        elif action == "DELETE":
-            return self._delete(tokens[1:])
+            raise ValueError("Cannot prepare an empty command")
+        if tokens[0][1] not in DML:
+            # not cached, and only its "?" placeholders are parameters
+            stmt, param_count = parse(tokens)
+            return PreparedStatement(cmd, stmt, [USER_PARAM] * param_count)
+        key, normalized, literals = normalize(tokens)
+        with self._plan_lock:
+            stmt = self._plan_cache.get(key)
+            if stmt is not None:
+                self._plan_cache.move_to_end(key)
+        if stmt is None:
+            stmt, _ = parse(normalized)
+            with self._plan_lock:
+                self._plan_cache[key] = stmt
+                if len(self._plan_cache) > PLAN_CACHE_SIZE:
+                    self._plan_cache.popitem(last=False)
+        return PreparedStatement(cmd, stmt, literals, key)
+
+    def session(self):
+        # statements run without a session commit on their own; BEGIN needs one
+        return Session(self)
+
+    def execute(self, cmd, params=None, session=None):
+        if isinstance(cmd, PreparedStatement):
+            handle = cmd
         else:
-            raise ValueError(f"Unknown command: {cmd}")
-
-    def _create_table(self, tokens):
-        name = tokens[0]
-        columns = {}
-        primary_key = None
-        unique = []
-
-        for token in tokens[1:]:
-            if ":" in token:
-                col, typ = token.split(":")
-                columns[col] = typ
-            elif token.startswith("PRIMARY_KEY="):
-                primary_key = token.split("=")[1]
-            elif token.startswith("UNIQUE="):
-                unique = token.split("=")[1].split(",")
-
-        table = Table(name, columns, primary_key, unique)
-        self.tables[name] = table
-        return f"Table '{name}' created."
-
-    def _create_index(self, tokens):
-        if tokens[0].upper() != "ON":
-            raise ValueError("Syntax: CREATE INDEX ON table(column)")
-        table_name, col = tokens[1].split("(")
-        col = col.rstrip(")")
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        return self.tables[table_name].create_index(col)
-
-    def _insert(self, tokens):
-        table_name = tokens[0]
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        row = {}
-        for token in tokens[1:]:
-            col, val = token.split("=")
-            # convert numeric types automatically
+            if not cmd.strip():
+                return None
+            handle = self.prepare(cmd)
+        params = handle.bind(params)
+        profile = Profile()
+        start = time.perf_counter()
+        try:
+            with self._statement_lock(handle.stmt):
+                if isinstance(handle.stmt, Select):
+                    result = list(self._select(handle.stmt, params, self._cache_key(handle, params), profile,
+                                               session))
+                else:
+                    result = self._run(handle.stmt, params, profile, session)
+        except Exception:
+            self._record(handle, start, profile, error=True)
+            raise
+        self._record(handle, start, profile, len(result) if isinstance(handle.stmt, Select) else 0)
+        return result
+
+    def cursor(self, cmd, params=None, session=None):
+        # a SELECT cursor reads table snapshots, so fetching holds no lock
+        handle = cmd if isinstance(cmd, PreparedStatement) else self.prepare(cmd)
+        params = handle.bind(params)
+        profile = Profile()
+        start = time.perf_counter()
+        try:
+            with self._statement_lock(handle.stmt):
+                result = self._run(handle.stmt, params, profile, session)
+        except Exception:
+            self._record(handle, start, profile, error=True)
+            raise
+        if isinstance(handle.stmt, Select):
+            return Cursor(rows=self._recorded(result, handle, start, profile))
+        self._record(handle, start, profile)
+        return Cursor(result=result)
+
+    def _recorded(self, rows, handle, start, profile):
+        # a streamed SELECT is recorded once its cursor is exhausted or closed
+        returned = 0
+        try:
+            for row in rows:
+                returned += 1
+                yield row
+        finally:
+            if hasattr(rows, "close"):
+                rows.close()
+            self._record(handle, start, profile, returned)
+
+    def _record(self, handle, start, profile, returned=0, error=False):
+        self.metrics.record(type(handle.stmt).__name__, handle.sql, time.perf_counter() - start,
+                            profile, returned, error)
+
+    def metrics_report(self):
+        report = self.metrics.report()
+        report["tables"] = {table.name: dict(table.io_stats) for table in self.tables.opened()}
+        report["result_cache"] = self.cache_stats()
+        return report
+
+    def reset(self):
+        # drop every table and its files once running statements have finished
+        with self._lock.write():
+            self.tables.close()
+            if os.path.exists(table_module.DATA_DIR):
+                shutil.rmtree(table_module.DATA_DIR)
+            os.makedirs(table_module.DATA_DIR)
+            self.tables.clear()
+            # open transactions end with the tables they wrote
+            with self._owners_lock:
+                for session in set(self._owners.values()):
+                    session.transaction = None
+                self._owners.clear()
+            if self.result_cache is not None:
+                self.result_cache.clear()
+        return "Database reset successfully."
+
+    def cache_stats(self):
+        return self.result_cache.stats() if self.result_cache is not None else None
+
+    def _cache_key(self, handle, params):
+        if self.result_cache is None or handle.key is None:
+            return None
+        key = (handle.key, tuple(params))
+        try:
+            hash(key)
+        except TypeError:
+            return None  # unhashable parameter values are not cached
+        return key
+
+    def _statement_lock(self, stmt):
+        return self._lock.write() if isinstance(stmt, CreateTable) else self._lock.read()
+
+    def _run(self, stmt, params, profile=None, session=None):
+        if isinstance(stmt, CreateTable):
+            return self._create_table(stmt, session)
+        if isinstance(stmt, CreateIndex):
+            return self._create_index(stmt)
+        if isinstance(stmt, Insert):
+            return self._insert(stmt, params, profile, session)
+        if isinstance(stmt, Select):
+            return self._select(stmt, params, profile=profile, session=session)
+        if isinstance(stmt, Update):
+            return self._update(stmt, params, profile, session)
+        if isinstance(stmt, Delete):
+            return self._delete(stmt, params, profile, session)
+        if isinstance(stmt, Copy):
+            return self._copy(stmt, profile, session)
+        if isinstance(stmt, Explain):
+            return self._explain(stmt, params, profile, session)
+        if isinstance(stmt, Begin):
+            return self._begin(session)
+        if isinstance(stmt, Commit):
+            return self._commit(session)
+        if isinstance(stmt, Rollback):
+            return self._rollback(session)
+        raise ValueError(f"Unknown command: {stmt}")
+
+    def _table(self, name):
+        if name not in self.tables:
+            raise ValueError(f"Table '{name}' does not exist")
+        return self.tables[name]
+
+    def _write_table(self, name, session=None):
+        # the table, once no other session's transaction holds it; inside a
+        # transaction its first write keeps a snapshot for the other sessions
+        table = self._table(name)
+        with self._owners_lock:
+            owner = self._owners.get(name)
+            if owner is not None and owner is not session:
+                raise ValueError(f"Table '{name}' is being changed by another transaction")
+            joining = owner is None and session is not None and session.transaction is not None
+            if joining:
+                self._owners[name] = session
+        if joining:
             try:
-                if '.' in val:
-                    val = float(val)
+                committed = table.snapshot(decoded=True)
+            except Exception:
+                with self._owners_lock:
+                    del self._owners[name]
+                raise
+            session.transaction[name] = (table, committed)
+            with table.lock.write():
+                table.begin()
+        return table
+
+    def _where(self, where, params):
+        # the WHERE tree with its placeholders bound, compiled by the tables that evaluate it
+        if where is None:
+            return None
+        return where.map(value=lambda value: bind(value, params))
+
+    def _create_table(self, stmt, session=None):
+        if session is not None and session.transaction is not None:
+            raise ValueError("CREATE TABLE is not allowed inside a transaction")
+        args = (stmt.name, stmt.columns, stmt.primary_key, stmt.unique, stmt.storage, stmt.file_format)
+        table = PartitionedTable(*args, partition=stmt.partition) if stmt.partition else Table(*args)
+        self.tables[stmt.name] = table
+        return f"Table '{stmt.name}' created."
+
+    def _create_index(self, stmt):
+        table = self._table(stmt.table)
+        with table.lock.write():
+            result = table.create_index(stmt.column, stmt.kind)
+        self.tables.register(table)
+        return result
+
+    def _insert(self, stmt, params, profile=None, session=None):
+        table = self._write_table(stmt.table, session)
+        row = {col: bind(val, params) for col, val in stmt.values.items()}
+        with table.lock.write():
+            result = table.insert(row)
+        if profile is not None:
+            profile.written += 1
+        return result
+
+    def _count(self, value, params, clause):
+        value = bind(value, params)
+        if value is None:
+            return None
+        if not isinstance(value, int) or value < 0:
+            raise ValueError(f"{clause} must be a non-negative integer")
+        return value
+
+    def _select(self, stmt, params, cache_key=None, profile=None, session=None):
+        # returns a generator; rows are produced as the caller consumes them
+        # from snapshots of the tables, released once it is exhausted or closed.
+        # With a cache_key the rows are read at once, from the result cache
+        # when the tables still have the versions they had when it was filled.
+        profile = profile or Profile()
+        limit = self._count(stmt.limit, params, "LIMIT")
+        offset = self._count(stmt.offset, params, "OFFSET") or 0
+        snapshots = self._snapshots(self._tables_read(stmt), session)
+        try:
+            if cache_key is not None:
+                cache_key += tuple(snap.version for snap in snapshots.values())
+                rows = self.result_cache.get(cache_key)
+                if rows is None:
+                    rows = list(self._select_rows(stmt, params, snapshots, limit, offset, profile))
+                    self.result_cache.put(cache_key, rows)
                 else:
-                    val = int(val)
-            except:
-                pass
-            row[col] = val
-        return self.tables[table_name].insert(row)
+                    profile.stage("cache", "result cache hit", len(rows))
+                self._release(snapshots)
+                return iter(rows)
+            rows = self._select_rows(stmt, params, snapshots, limit, offset, profile)
+        except Exception:
+            self._release(snapshots)
+            raise
+        return self._released(rows, snapshots)
+
+    def _snapshots(self, names, session=None):
+        # tables in another session's open transaction are read as they were at its BEGIN
+        snapshots = {}
+        try:
+            for name in names:
+                table = self._table(name)
+                with self._owners_lock:
+                    owner = self._owners.get(name)
+                    # until the owner's first write the live table is still the committed one
+                    if owner is not None and owner is not session and name in (owner.transaction or {}):
+                        snapshots[name] = owner.transaction[name][1].snapshot()
+                if name not in snapshots:
+                    snapshots[name] = table.snapshot()
+        except Exception:
+            self._release(snapshots)
+            raise
+        return snapshots
+
+    def _tables_read(self, stmt):
+        if stmt.join:
+            return list(dict.fromkeys([stmt.join.left.split(".")[0], stmt.join.right.split(".")[0]]))
+        return [stmt.table]
 
-    def _select(self, tokens):
-        # SELECT col1, col2 FROM table [JOIN table2 ON ...] [WHERE ...]
-        if "FROM" not in tokens:
-            raise ValueError("Syntax error in SELECT")
+    def _released(self, rows, snapshots):
+        try:
+            yield from rows
+        finally:
+            self._release(snapshots)
 
-        idx_from = tokens.index("FROM")
-        cols = tokens[1:idx_from]
-        columns = [c.strip(",") for c in cols] or None
+    def _release(self, snapshots):
+        for snap in snapshots.values():
+            snap.release()
 
-        table_name = tokens[idx_from + 1]
+    def _select_rows(self, stmt, params, snapshots, limit, offset, profile):
+        columns = stmt.columns
+        if stmt.group_by or any(isinstance(col, Aggregate) for col in columns):
+            names = [col.name if isinstance(col, Aggregate) else col for col in columns]
+            for col, _ in stmt.order_by:
+                if col not in names:
+                    raise ValueError(f"ORDER BY column '{col}' must appear in the SELECT list")
+            rows = self._aggregate(stmt, params, snapshots, profile)
+            if stmt.order_by:
+                return self._sort(rows, stmt.order_by, limit, offset, profile)
+            return operators.limit(iter(rows), limit, offset)
 
         # Handle JOIN
-        if "JOIN" in tokens:
-            idx_join = tokens.index("JOIN")
-            join_table_name = tokens[idx_join + 1]
-            on_idx = tokens.index("ON")
-            left_col, right_col = tokens[on_idx + 1].split("=")
-            left_table_name, left_field = left_col.split(".")
-            right_table_name, right_field = right_col.split(".")
-            left_rows = self.tables[left_table_name].rows
-            right_rows = self.tables[right_table_name].rows
-            result = []
-            for lr in left_rows:
-                for rr in right_rows:
-                    if lr[left_field] == rr[right_field]:
-                        row = {}
-                        if columns == ["*"]:
-                            # include all columns from both tables
-                            for c in self.tables[left_table_name].columns:
-                                row[f"{left_table_name}.{c}"] = lr[c]
-                            for c in self.tables[right_table_name].columns:
-                                row[f"{right_table_name}.{c}"] = rr[c]
-                        else:
-                            for col in columns:
-                                tname, cname = col.split(".")
-                                if tname == left_table_name:
-                                    row[col] = lr[cname]
-                                else:
-                                    row[col] = rr[cname]
-                        result.append(row)
-            return result
+        if stmt.join:
+            left_table_name, left_field = stmt.join.left.split(".")
+            right_table_name, right_field = stmt.join.right.split(".")
+            left_table = snapshots[left_table_name]
+            right_table = snapshots[right_table_name]
+            left_where, right_where, joined_where = self._split_join_where(stmt.where, params, left_table,
+                                                                           right_table)
+            _, pairs = join_tables(left_table, right_table, left_field, right_field, left_where, right_where,
+                                   profile)
+            if joined_where is not None:
+                pairs = profile.track(self._filter_pairs(pairs, joined_where, left_table), "filter",
+                                      describe_where(joined_where))
+            if stmt.order_by:
+                # sort the joined rows, with the ORDER BY columns written as table.column
+                order_by = []
+                for col, desc in stmt.order_by:
+                    tname, cname = self._join_column(col, left_table, right_table)
+                    if cname not in snapshots[tname].columns:
+                        raise ValueError(f"Column '{col}' does not exist")
+                    order_by.append((f"{tname}.{cname}", desc))
+                needed = self._sort_columns(columns, order_by)
+                rows = profile.track(self._project_join(pairs, needed, left_table, right_table), "project",
+                                     ", ".join(needed))
+                return self._without(self._sort(rows, order_by, limit, offset, profile), columns, needed)
+            pairs = operators.limit(pairs, limit, offset)
+            if limit is not None or offset:
+                pairs = profile.track(pairs, "limit", f"LIMIT {limit} OFFSET {offset}")
+            rows = self._project_join(pairs, columns, left_table, right_table)
+            return profile.track(rows, "project", ", ".join(columns))
 
         # Regular select
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-
-        where = None
-        if "WHERE" in tokens:
-            idx_where = tokens.index("WHERE")
-            where = {}
-            conditions = tokens[idx_where + 1:]
-            for cond in conditions:
-                for op in ["!=", ">=", "<=", "=", ">", "<"]:
-                    if op in cond:
-                        c, v = cond.split(op)
-                        try:
-                            if '.' in v:
-                                v = float(v)
-                            else:
-                                v = int(v)
-                        except:
-                            pass
-                        where[c] = (op, v)
-                        break
-        return self.tables[table_name].select(columns or ["*"], where)
-
-    def _update(self, tokens):
-        table_name = tokens[0]
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        if "SET" not in tokens:
-            raise ValueError("Syntax: UPDATE table SET col=val [WHERE ...]")
-        idx_set = tokens.index("SET")
-        if "WHERE" in tokens:
-            idx_where = tokens.index("WHERE")
-            set_tokens = tokens[idx_set + 1:idx_where]
-            where_tokens = tokens[idx_where + 1:]
+        table = snapshots[stmt.table]
+        where = self._where(stmt.where, params)
+        if stmt.order_by:
+            for col, _ in stmt.order_by:
+                if col not in table.columns:
+                    raise ValueError(f"Column '{col}' does not exist")
+            path = choose_order_path(table, where, stmt.order_by)
+            if path is not None:
+                # the ordered index returns the rows sorted, so LIMIT can stop the scan early
+                return table.scan(columns, where, path, limit, offset, profile)
+            needed = self._sort_columns(columns, stmt.order_by)
+            rows = self._sort(table.scan(needed, where, profile=profile), stmt.order_by, limit, offset, profile)
+            return self._without(rows, columns, needed)
+        path = choose_access_path(table, where) if where else None
+        return table.scan(columns, where, path, limit, offset, profile)
+
+    def _sort(self, rows, order_by, limit, offset, profile):
+        # ORDER BY, then LIMIT / OFFSET: with a LIMIT a bounded heap keeps the
+        # first offset+limit rows, otherwise every row is sorted, spilling to
+        # the data directory beyond sort_memory_bytes
+        start = time.perf_counter()
+        sorter = Sorter(order_by, self.sort_memory_bytes, table_module.DATA_DIR)
+        if limit is None:
+            rows = operators.limit(sorter.sort(rows), None, offset)
+        else:
+            rows = iter(sorter.top(rows, offset + limit)[offset:])
+        profile.stage("sort", sorter.describe(), sorter.rows, time.perf_counter() - start if profile.timed else None)
+        if limit is not None or offset:
+            rows = profile.track(rows, "limit", f"LIMIT {limit} OFFSET {offset}")
+        return rows
+
+    def _sort_columns(self, columns, order_by):
+        # the selected columns plus the ones only ORDER BY reads
+        if columns == ["*"]:
+            return columns
+        return list(dict.fromkeys(columns + [col for col, _ in order_by]))
+
+    def _without(self, rows, columns, needed):
+        # drop the columns that were only read for ORDER BY
+        if needed == columns:
+            return rows
+        return ({col: row.get(col) for col in columns} for row in rows)
+
+    def _project_join(self, pairs, columns, left_table, right_table):
+        for lr, rr in pairs:
+            row = {}
+            if columns == ["*"]:
+                # include all columns from both tables
+                for c in left_table.columns:
+                    row[f"{left_table.name}.{c}"] = lr.get(c)
+                for c in right_table.columns:
+                    row[f"{right_table.name}.{c}"] = rr.get(c)
+            else:
+                for col in columns:
+                    tname, cname = col.split(".")
+                    if tname == left_table.name:
+                        row[col] = lr.get(cname)
+                    else:
+                        row[col] = rr.get(cname)
+            yield row
+
+    def _aggregate(self, stmt, params, snapshots, profile):
+        aggregates = [col for col in stmt.columns if isinstance(col, Aggregate)]
+        for col in stmt.columns:
+            if isinstance(col, str) and col not in stmt.group_by:
+                raise ValueError(f"Column '{col}' must appear in GROUP BY or be aggregated")
+        needed = list(dict.fromkeys(stmt.group_by + [agg.column for agg in aggregates if agg.column]))
+
+        if stmt.join:
+            left_table = snapshots[stmt.join.left.split(".")[0]]
+            right_table = snapshots[stmt.join.right.split(".")[0]]
+            left_where, right_where, joined_where = self._split_join_where(stmt.where, params, left_table,
+                                                                           right_table)
+            _, pairs = join_tables(left_table, right_table, stmt.join.left.split(".")[1],
+                                   stmt.join.right.split(".")[1], left_where, right_where, profile)
+            if joined_where is not None:
+                pairs = profile.track(self._filter_pairs(pairs, joined_where, left_table), "filter",
+                                      describe_where(joined_where))
+            # GROUP BY and aggregate columns may be written without their table
+            resolved = []
+            for col in needed:
+                tname, cname = self._join_column(col, left_table, right_table)
+                if cname not in snapshots[tname].columns:
+                    raise ValueError(f"Column '{col}' does not exist")
+                resolved.append((col, f"{tname}.{cname}"))
+            projected = self._project_join(pairs, list(dict.fromkeys(q for _, q in resolved)), left_table, right_table)
+            rows = ({col: row[qualified] for col, qualified in resolved} for row in projected)
+            return self._timed_aggregate(profile, operators.row_batches(rows, needed), stmt, aggregates)
+
+        table = snapshots[stmt.table]
+        where = self._where(stmt.where, params)
+        path = choose_access_path(table, where) if where else None
+        if not stmt.group_by:
+            values = from_metadata(table, path, aggregates)
+            if values is not None:
+                profile.stage("aggregate", "from table metadata", 1)
+                return [{agg.name: values[agg.name] for agg in aggregates}]
+        for col in needed:
+            if col not in table.columns:
+                raise ValueError(f"Column '{col}' does not exist")
+        if isinstance(table, PartitionedTable):
+            # partitions are aggregated separately, on worker processes when large, then merged
+            start = time.perf_counter()
+            result = table.aggregate(where, stmt.columns, stmt.group_by, aggregates, needed, profile)
+            profile.stage("aggregate", self._aggregate_detail(stmt) + " over partitions", len(result),
+                          time.perf_counter() - start if profile.timed else None)
+            return result
+        batches = profile.scan(operators.scan(table, path), f"{table.name} by {path.describe() if path else 'full scan'}")
+        if path and path.residual:
+            batches = profile.track(operators.filter_batches(table, batches, path.residual), "filter",
+                                    describe_where(path.residual), batches=True)
+        return self._timed_aggregate(profile, operators.column_batches(table, batches, needed), stmt, aggregates)
+
+    def _timed_aggregate(self, profile, batches, stmt, aggregates):
+        start = time.perf_counter()
+        result = hash_aggregate(batches, stmt.columns, stmt.group_by, aggregates)
+        profile.stage("aggregate", self._aggregate_detail(stmt), len(result),
+                      time.perf_counter() - start if profile.timed else None)
+        return result
+
+    def _aggregate_detail(self, stmt):
+        return "hash aggregate" + (" GROUP BY " + ", ".join(stmt.group_by) if stmt.group_by else "")
+
+    def _split_join_where(self, where, params, left_table, right_table):
+        # push each condition of the top-level AND down to the side of the join
+        # it refers to; conditions on columns of both sides are checked on the
+        # joined rows, with every column written as table.column
+        qualify = lambda col: ".".join(self._join_column(col, left_table, right_table))
+        unqualify = lambda col: self._join_column(col, left_table, right_table)[1]
+        left, right, joined = [], [], []
+        for item in conjuncts(self._where(where, params)):
+            tables = {self._join_column(col, left_table, right_table)[0] for col in item.columns()}
+            if tables == {left_table.name}:
+                left.append(item.map(column=unqualify))
+            elif tables == {right_table.name}:
+                right.append(item.map(column=unqualify))
+            else:
+                joined.append(item.map(column=qualify))
+        return conjoin(left), conjoin(right), conjoin(joined)
+
+    def _join_column(self, col, left_table, right_table):
+        # (table name, column name) of a column named in the WHERE clause of a join
+        if "." in col:
+            tname, col = col.split(".")
+            if tname not in (left_table.name, right_table.name):
+                raise ValueError(f"Table '{tname}' is not part of the join")
+            return tname, col
+        if col in left_table.columns and col in right_table.columns:
+            raise ValueError(f"Column '{col}' is ambiguous")
+        return (left_table.name if col in left_table.columns else right_table.name), col
+
+    def _filter_pairs(self, pairs, where, left_table):
+        test = where.compiled()
+        refs = [(col, col.split(".")) for col in where.columns()]
+        try:
+            for lr, rr in pairs:
+                if test({col: (lr if tname == left_table.name else rr).get(c) for col, (tname, c) in refs}):
+                    yield lr, rr
+        except TypeError:
+            raise ValueError(f"Cannot compare the values in WHERE {describe_where(where)}")
+
+    def _update(self, stmt, params, profile=None, session=None):
+        table = self._write_table(stmt.table, session)
+        set_values = {col: bind(val, params) for col, val in stmt.values.items()}
+        where = self._where(stmt.where, params)
+        with table.lock.write():
+            return table.update(set_values, where, profile)
+
+    def _delete(self, stmt, params, profile=None, session=None):
+        table = self._write_table(stmt.table, session)
+        where = self._where(stmt.where, params)
+        with table.lock.write():
+            return table.delete(where, profile)
+
+    # ----------------- EXPLAIN -----------------
+    def _explain(self, stmt, params, profile=None, session=None):
+        if not stmt.analyze:
+            return self._plan(stmt.stmt, params, session)
+        # run the statement and report the rows and time of every stage;
+        # stage times include the stages feeding them. The statement's own
+        # profile is used, so its rows scanned and written reach the metrics.
+        if profile is None:
+            profile = Profile()
+        profile.timed = True
+        start = time.perf_counter()
+        if isinstance(stmt.stmt, Select):
+            rows = self._select(stmt.stmt, params, profile=profile, session=session)
+            detail = f"{sum(1 for _ in rows)} rows returned"
         else:
-            set_tokens = tokens[idx_set + 1:]
-            where_tokens = []
+            detail = self._run(stmt.stmt, params, profile, session)
+        total = {"stage": "total", "detail": detail, "rows": None,
+                 "time_ms": round((time.perf_counter() - start) * 1000, 3)}
+        return profile.report() + [total]
+
+    def _plan(self, stmt, params, session=None):
+        # the stages the statement would run, with estimated row counts
+        plan = []
+        add = lambda stage, detail, estimate=None: plan.append(
+            {"stage": stage, "detail": detail, "estimated_rows": estimate})
+        names = self._tables_read(stmt) if isinstance(stmt, Select) else [stmt.table]
+        snapshots = self._snapshots(names, session)
+        try:
+            if isinstance(stmt, Select):
+                self._plan_select(stmt, params, snapshots, add)
+            else:
+                table = snapshots[stmt.table]
+                self._plan_scan(table, self._where(stmt.where, params), add)
+                add(type(stmt).__name__.lower(), ", ".join(stmt.values) if isinstance(stmt, Update) else table.name)
+        finally:
+            self._release(snapshots)
+        return plan
+
+    def _plan_scan(self, table, where, add):
+        if isinstance(table, PartitionedTable):
+            parts = table.prune(where)
+            add("partitions", table.describe(parts), sum(len(part) for part in parts))
+            for part in parts:
+                self._plan_scan(part, where, add)
+            return None
+        path = choose_access_path(table, where)
+        add("scan", f"{table.name} by {path.describe()}", path.estimate)
+        if path.residual:
+            add("filter", describe_where(path.residual))
+        return path
 
-        set_values = {}
-        for token in set_tokens:
-            col, val = token.split("=")
+    def _plan_select(self, stmt, params, snapshots, add):
+        limit = self._count(stmt.limit, params, "LIMIT")
+        offset = self._count(stmt.offset, params, "OFFSET") or 0
+        aggregates = [col for col in stmt.columns if isinstance(col, Aggregate)]
+        order_path = None
+        if stmt.join:
+            left_table, left_field = stmt.join.left.split(".")
+            right_table, right_field = stmt.join.right.split(".")
+            left, right = snapshots[left_table], snapshots[right_table]
+            left_where, right_where, joined_where = self._split_join_where(stmt.where, params, left, right)
+            strategy = choose_join_strategy(left, right, left_field, right_field, left_where, right_where)
+            if strategy == "merge":
+                add("merge", f"ordered indexes on {stmt.join.left} and {stmt.join.right}")
+            else:
+                # index joins read the outer side and probe the other one's index
+                if strategy != "index:left":
+                    self._plan_scan(left, left_where, add)
+                if strategy != "index:right":
+                    self._plan_scan(right, right_where, add)
+            add("join", f"{strategy} {stmt.join.left} = {stmt.join.right}")
+            if joined_where is not None:
+                add("filter", describe_where(joined_where))
+        else:
+            table = snapshots[stmt.table]
+            where = self._where(stmt.where, params)
+            path = choose_access_path(table, where) if where else None
+            if aggregates and not stmt.group_by and from_metadata(table, path, aggregates) is not None:
+                add("aggregate", "from table metadata", 1)
+                return
+            if stmt.order_by and not aggregates and not stmt.group_by:
+                order_path = choose_order_path(table, where, stmt.order_by)
+            if order_path is not None:
+                add("scan", f"{table.name} by {order_path.describe()}", order_path.estimate)
+                if order_path.residual:
+                    add("filter", describe_where(order_path.residual))
+                add("sort", "none, rows read in index order")
+            else:
+                self._plan_scan(table, where, add)
+        if stmt.group_by or aggregates:
+            add("aggregate", self._aggregate_detail(stmt))
+        if stmt.order_by and order_path is None:
+            if limit is not None:
+                add("sort", f"top-{limit + offset} heap by {describe_order(stmt.order_by)}")
+            else:
+                add("sort", f"sort by {describe_order(stmt.order_by)}, "
+                            f"spilling to disk beyond {self.sort_memory_bytes} bytes")
+        if limit is not None or offset:
+            add("limit", f"LIMIT {limit} OFFSET {offset}", limit)
+        if not aggregates and not stmt.group_by:
+            add("project", ", ".join(stmt.columns))
+
+    # ----------------- BULK LOAD -----------------
+    def insert_many(self, table_name, rows, session=None):
+        # recorded in the metrics like a statement
+        profile = Profile()
+        start = time.perf_counter()
+        sql = f"insert_many({table_name})"
+        try:
+            with self._lock.read():
+                result = self._insert_many(table_name, rows, profile, session)
+        except Exception:
+            self.metrics.record("InsertMany", sql, time.perf_counter() - start, profile, error=True)
+            raise
+        self.metrics.record("InsertMany", sql, time.perf_counter() - start, profile)
+        return result
+
+    def _insert_many(self, table_name, rows, profile=None, session=None):
+        table = self._write_table(table_name, session)
+        rows = list(rows)
+        with table.lock.write():
+            result = table.insert_many(rows)
+        if profile is not None:
+            profile.written += len(rows)
+        return result
+
+    def _copy(self, stmt, profile=None, session=None):
+        table = self._table(stmt.table)
+        directory = self.import_dir or table_module.DATA_DIR
+        return self._insert_many(stmt.table, read_rows(stmt.path, table.columns, directory), profile, session)
+
+    # ----------------- TRANSACTIONS -----------------
+    def _begin(self, session):
+        if session is None:
+            raise ValueError("BEGIN needs a session of its own: use executor.session()")
+        if session.transaction is not None:
+            raise ValueError("Transaction already in progress")
+        session.transaction = {}
+        return "Transaction started."
+
+    def _commit(self, session):
+        return self._end(session, "commit", "Transaction committed.")
+
+    def _rollback(self, session):
+        return self._end(session, "rollback", "Transaction rolled back.")
+
+    def _end(self, session, action, message):
+        # the other sessions go on reading the committed snapshot until the
+        # table has been committed or rolled back, and every table is let go
+        # even if one of them fails
+        if session is None or session.transaction is None:
+            raise ValueError("No transaction in progress")
+        error = None
+        for name, (table, committed) in session.transaction.items():
             try:
-                if '.' in val:
-                    val = float(val)
-                else:
-                    val = int(val)
-            except:
-                pass
-            set_values[col] = val
-
-        where = {}
-        for cond in where_tokens:
-            for op in ["!=", ">=", "<=", "=", ">", "<"]:
-                if op in cond:
-                    c, v = cond.split(op)
-                    try:
-                        if '.' in v:
-                            v = float(v)
-                        else:
-                            v = int(v)
-                    except:
-                        pass
-                    where[c] = (op, v)
-                    break
-
-        return self.tables[table_name].update(set_values, where or None)
-
-    def _delete(self, tokens):
-        table_name = tokens[0]
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        where = None
-        if "WHERE" in tokens:
-            idx_where = tokens.index("WHERE")
-            where_tokens = tokens[idx_where + 1:]
-            where = {}
-            for cond in where_tokens:
-                for op in ["!=", ">=", "<=", "=", ">", "<"]:
-                    if op in cond:
-                        c, v = cond.split(op)
-                        try:
-                            if '.' in v:
-                                v = float(v)
-                            else:
-                                v = int(v)
-                        except:
-                            pass
-                        where[c] = (op, v)
-                        break
-        return self.tables[table_name].delete(where)
+                with table.lock.write():
+                    getattr(table, action)()
+            except Exception as e:
+                error = error or e
+            with self._owners_lock:
+                if self._owners.get(name) is session:
+                    del self._owners[name]
+                committed.release()
+        session.transaction = None
+        if error is not None:
+            raise error
+        return message
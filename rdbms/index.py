@@ -0,0 +1,259 @@
+# index.py
+# Indexes are copied whenever a write follows a snapshot, so their data is
+# kept in chunks that copies share (see chunked.py): a write copies only the
+# chunks it changes.
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate, chain
+
+from .chunked import CHUNK, ChunkedBag, ChunkedDict
+
+
+class HashIndex:
+    kind = "HASH"
+    ops = ("=",)
+
+    def __init__(self, column):
+        self.column = column
+        self.map = ChunkedDict()  # value -> [positions], a ChunkedBag once they outgrow a chunk
+        self._owned = None  # values whose positions no copy shares, None for all of them
+
+    def build(self, values):
+        groups = {}
+        for pos, value in enumerate(values):
+            if value is not None:
+                groups.setdefault(value, []).append(pos)
+        self.map = ChunkedDict((value, positions if len(positions) <= CHUNK else ChunkedBag(positions))
+                               for value, positions in groups.items())
+        self._owned = None
+
+    def _positions(self, value):
+        # the positions of value, copied first while a copy of the index shares them
+        positions = self.map.get(value)
+        if positions is not None and self._owned is not None and value not in self._owned:
+            positions = self.map[value] = positions.copy()
+            self._owned.add(value)
+        return positions
+
+    def add(self, value, pos):
+        if value is None:
+            return
+        positions = self._positions(value)
+        if positions is None:
+            self.map[value] = [pos]
+            if self._owned is not None:
+                self._owned.add(value)
+        elif isinstance(positions, list) and len(positions) == CHUNK:
+            self.map[value] = ChunkedBag(positions + [pos])
+        else:
+            positions.append(pos)
+
+    def add_many(self, entries):
+        groups = {}
+        for value, pos in entries:
+            if value is not None:
+                groups.setdefault(value, []).append(pos)
+        for value, added in groups.items():
+            positions = self._positions(value)
+            if positions is None:
+                self.map[value] = added if len(added) <= CHUNK else ChunkedBag(added)
+                if self._owned is not None:
+                    self._owned.add(value)
+            elif isinstance(positions, list) and len(positions) + len(added) > CHUNK:
+                self.map[value] = ChunkedBag(positions + added)
+            else:
+                positions.extend(added)
+
+    def check(self, values):
+        # any value can be hashed into the map
+        pass
+
+    def remove(self, value, pos):
+        positions = self._positions(value)
+        if positions:
+            positions.remove(pos)
+            if not positions:
+                del self.map[value]
+
+    def estimate(self, op, value):
+        return len(self.map.get(value, ()))
+
+    def lookup(self, op, value):
+        return list(self.map.get(value, ()))
+
+    def copy(self):
+        other = HashIndex(self.column)
+        other.map = self.map.copy()
+        other._owned, self._owned = set(), set()
+        return other
+
+
+class OrderedIndex:
+    kind = "ORDERED"
+    ops = ("=", ">", "<", ">=", "<=", "BETWEEN")
+
+    # The sorted (value, position) entries are kept in parts of CHUNK to
+    # 2 * CHUNK entries; lasts holds the last entry of each part.
+    def __init__(self, column):
+        self.column = column
+        self._load([])
+
+    def _load(self, entries):
+        self.parts = [entries[i:i + CHUNK] for i in range(0, len(entries), CHUNK)]
+        self.lasts = [part[-1] for part in self.parts]
+        self.owned = [True] * len(self.parts)  # False while a copy may still share the part
+        self.size = len(entries)
+        self._starts = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def entries(self):
+        # every entry, in order
+        return list(chain.from_iterable(self.parts))
+
+    def _own(self, p):
+        if not self.owned[p]:
+            self.parts[p] = list(self.parts[p])
+            self.owned[p] = True
+        return self.parts[p]
+
+    def _offsets(self):
+        # position of the first entry of each part
+        if self._starts is None:
+            self._starts = [0] + list(accumulate(len(part) for part in self.parts))[:-1]
+        return self._starts
+
+    def build(self, values):
+        try:
+            self._load(sorted((value, pos) for pos, value in enumerate(values) if value is not None))
+        except TypeError:
+            raise ValueError(f"Cannot build an ordered index on mixed-type column '{self.column}'")
+
+    def add(self, value, pos):
+        if value is None:
+            return
+        entry = (value, pos)
+        if not self.parts:
+            self._load([entry])
+            return
+        p = min(bisect_left(self.lasts, entry), len(self.parts) - 1)
+        part = self._own(p)
+        insort(part, entry)
+        if len(part) > 2 * CHUNK:
+            self.parts.insert(p + 1, part[CHUNK:])
+            self.owned.insert(p + 1, True)
+            del part[CHUNK:]
+            self.lasts.insert(p + 1, self.parts[p + 1][-1])
+        self.lasts[p] = part[-1]
+        self.size += 1
+        self._starts = None
+
+    def check(self, values):
+        # raises ValueError, before anything is changed, when a value cannot be
+        # ordered with the ones in the index (or the others given)
+        first = self.min_value()
+        for value in values:
+            if value is None:
+                continue
+            if first is None:
+                first = value
+                continue
+            try:
+                value < first
+            except TypeError:
+                raise ValueError(f"Cannot mix value types in ordered index on '{self.column}'")
+
+    def add_many(self, entries):
+        merged = self.entries
+        merged.extend(entry for entry in entries if entry[0] is not None)
+        try:
+            merged.sort()
+        except TypeError:
+            raise ValueError(f"Cannot mix value types in ordered index on '{self.column}'")
+        self._load(merged)
+
+    def remove(self, value, pos):
+        if value is None:
+            return
+        entry = (value, pos)
+        p = bisect_left(self.lasts, entry)
+        if p == len(self.parts):
+            return
+        i = bisect_left(self.parts[p], entry)
+        if i < len(self.parts[p]) and self.parts[p][i] == entry:
+            part = self._own(p)
+            del part[i]
+            if part:
+                self.lasts[p] = part[-1]
+            else:
+                del self.parts[p], self.lasts[p], self.owned[p]
+            self.size -= 1
+            self._starts = None
+
+    def _locate(self, key, right=False):
+        # the position key would be inserted at in the whole sorted sequence
+        find = bisect_right if right else bisect_left
+        p = find(self.lasts, key)
+        if p == len(self.parts):
+            return self.size
+        return self._offsets()[p] + find(self.parts[p], key)
+
+    def _bounds(self, op, value):
+        # (value,) sorts before and (value, inf) after every entry holding value
+        if op == "BETWEEN":
+            # value is (low, high), both included
+            low = self._bounds(">=", value[0])[0]
+            return low, max(low, self._bounds("<=", value[1])[1])
+        low, high = 0, self.size
+        if op in ("=", ">="):
+            low = self._locate((value,))
+        elif op == ">":
+            low = self._locate((value, float("inf")), right=True)
+        if op in ("=", "<="):
+            high = self._locate((value, float("inf")), right=True)
+        elif op == "<":
+            high = self._locate((value,))
+        return low, max(low, high)
+
+    def _range(self, low, high, descending=False):
+        # entries low to high - 1, one part at a time
+        if low >= high:
+            return
+        starts, parts = self._offsets(), self.parts
+        first, last = bisect_right(starts, low) - 1, bisect_right(starts, high - 1) - 1
+        for p in (range(last, first - 1, -1) if descending else range(first, last + 1)):
+            chunk = parts[p][max(low - starts[p], 0):high - starts[p]]
+            yield from (reversed(chunk) if descending else chunk)
+
+    def estimate(self, op, value):
+        low, high = self._bounds(op, value)
+        return high - low
+
+    def min_value(self):
+        return self.parts[0][0][0] if self.parts else None
+
+    def max_value(self):
+        return self.parts[-1][-1][0] if self.parts else None
+
+    def lookup(self, op, value):
+        low, high = self._bounds(op, value)
+        return sorted(pos for _, pos in self._range(low, high))
+
+    def ordered(self, op=None, value=None, descending=False):
+        # positions in the order of their values (only those satisfying op
+        # value when given), produced lazily
+        low, high = self._bounds(op, value) if op else (0, self.size)
+        return (pos for _, pos in self._range(low, high, descending))
+
+    def copy(self):
+        other = OrderedIndex.__new__(OrderedIndex)
+        other.column = self.column
+        other.parts, other.lasts = list(self.parts), list(self.lasts)
+        other.size, other._starts = self.size, self._starts
+        other.owned = [False] * len(self.parts)
+        self.owned = [False] * len(self.parts)
+        return other
+
+
+INDEX_TYPES = {"HASH": HashIndex, "ORDERED": OrderedIndex}
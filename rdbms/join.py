@@ -0,0 +1,144 @@
+# join.py
+# Equi-join operators. Each is a generator of (left_row, right_row) pairs.
+from .index import OrderedIndex
+from .planner import choose_access_path
+from .predicate import selectivity
+
+
+def _rows(table, where, profile=None):
+    if where:
+        return table.select(None, where, profile=profile)
+    rows = table.rows
+    if profile is not None:
+        profile.stage("scan", f"{table.name} by full scan", len(rows))
+        profile.scanned += len(rows)
+    return rows
+
+
+def _lookup(table, col):
+    # value -> [positions] through an existing key map or index, None if there is none
+    idx = table.indexes.get(col)
+    if idx is not None:
+        def lookup(value):
+            # a value an ordered index cannot compare with its own matches
+            # nothing, as it would in a hash join
+            try:
+                return idx.lookup("=", value)
+            except TypeError:
+                return []
+        return lookup
+    if col in table.keys:
+        keys = table.keys[col]
+        return lambda value: [keys[value]] if value in keys else []
+    return None
+
+
+def _comparable(a, b):
+    try:
+        a < b
+    except TypeError:
+        return False
+    return True
+
+
+def hash_join(left_rows, right_rows, left_col, right_col):
+    # build on the smaller input, probe with the larger one
+    build_left = len(left_rows) < len(right_rows)
+    build_rows, build_col = (left_rows, left_col) if build_left else (right_rows, right_col)
+    probe_rows, probe_col = (right_rows, right_col) if build_left else (left_rows, left_col)
+    table = {}
+    for row in build_rows:
+        value = row.get(build_col)
+        if value is not None:
+            table.setdefault(value, []).append(row)
+    for row in probe_rows:
+        for match in table.get(row.get(probe_col), ()):
+            yield (match, row) if build_left else (row, match)
+
+
+def index_join(outer_rows, outer_col, inner, inner_col, inner_where=None, outer_is_left=True):
+    # probe the inner table's existing index with every outer row
+    lookup = _lookup(inner, inner_col)
+    for row in outer_rows:
+        value = row.get(outer_col)
+        if value is None:
+            continue
+        for pos in lookup(value):
+            match = inner.row(pos)
+            if inner_where and not inner._match_where(match, inner_where):
+                continue
+            yield (row, match) if outer_is_left else (match, row)
+
+
+def merge_join(left, right, left_col, right_col):
+    # both sides are read in key order from their ordered indexes
+    l_entries = left.indexes[left_col].entries
+    r_entries = right.indexes[right_col].entries
+    i = j = 0
+    while i < len(l_entries) and j < len(r_entries):
+        l_value, r_value = l_entries[i][0], r_entries[j][0]
+        if l_value < r_value:
+            i += 1
+        elif l_value > r_value:
+            j += 1
+        else:
+            i_end, j_end = i, j
+            while i_end < len(l_entries) and l_entries[i_end][0] == l_value:
+                i_end += 1
+            while j_end < len(r_entries) and r_entries[j_end][0] == r_value:
+                j_end += 1
+            for _, l_pos in l_entries[i:i_end]:
+                for _, r_pos in r_entries[j:j_end]:
+                    yield left.row(l_pos), right.row(r_pos)
+            i, j = i_end, j_end
+
+
+def _estimate(table, where):
+    # rows one side of a join is expected to contribute
+    if not where:
+        return len(table)
+    path = choose_access_path(table, where)
+    return path.estimate * (selectivity(path.residual, table) if path.residual else 1)
+
+
+def choose_join_strategy(left, right, left_col, right_col, left_where=None, right_where=None):
+    if (not left_where and not right_where
+            and isinstance(left.indexes.get(left_col), OrderedIndex)
+            and isinstance(right.indexes.get(right_col), OrderedIndex)):
+        return "merge"
+    l_indexed = _lookup(left, left_col) is not None
+    r_indexed = _lookup(right, right_col) is not None
+    if l_indexed and r_indexed:
+        # probe the bigger side with the rows of the smaller one, after WHERE
+        return "index:right" if _estimate(left, left_where) <= _estimate(right, right_where) else "index:left"
+    if r_indexed:
+        return "index:right"
+    if l_indexed:
+        return "index:left"
+    return "hash"
+
+
+def join_tables(left, right, left_col, right_col, left_where=None, right_where=None, profile=None):
+    # WHERE predicates local to one side are applied before the join
+    strategy, pairs = _join(left, right, left_col, right_col, left_where, right_where, profile)
+    if profile is not None:
+        pairs = profile.track(pairs, "join", f"{strategy} {left.name}.{left_col} = {right.name}.{right_col}")
+    return strategy, pairs
+
+
+def _join(left, right, left_col, right_col, left_where, right_where, profile):
+    strategy = choose_join_strategy(left, right, left_col, right_col, left_where, right_where)
+    if strategy == "merge":
+        l_index, r_index = left.indexes[left_col], right.indexes[right_col]
+        if not len(l_index) or not len(r_index) or _comparable(l_index.min_value(), r_index.min_value()):
+            if profile is not None:
+                profile.scanned += len(l_index) + len(r_index)
+            return strategy, merge_join(left, right, left_col, right_col)
+        strategy = "hash"  # join keys of incomparable types
+    if strategy == "index:right":
+        return strategy, index_join(_rows(left, left_where, profile), left_col, right, right_col, right_where)
+    if strategy == "index:left":
+        return strategy, index_join(_rows(right, right_where, profile), right_col, left, left_col, left_where,
+                                    outer_is_left=False)
+    return strategy, hash_join(_rows(left, left_where, profile), _rows(right, right_where, profile),
+                               left_col, right_col)
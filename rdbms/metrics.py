@@ -0,0 +1,120 @@
+# metrics.py
+# Statement statistics for EXPLAIN ANALYZE, the slow-query log and /metrics.
+#   Profile - the stages (operators) one statement ran through, with the rows
+#             each produced and, when timed, the wall time spent up to it
+#   Metrics - counters and latency histograms over all statements
+import json
+import os
+import threading
+import time
+
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)  # upper bounds; slower statements go in "inf"
+
+
+class Stage:
+    def __init__(self, name, detail="", rows=None, seconds=None):
+        self.name = name
+        self.detail = detail
+        self.rows = rows
+        self.seconds = seconds  # includes the stages feeding this one
+
+
+class Profile:
+    def __init__(self, timed=False):
+        self.timed = timed
+        self.stages = []
+        self.scanned = 0  # candidate rows read by every scan of the statement
+        self.written = 0  # rows inserted, updated or deleted
+
+    def stage(self, name, detail="", rows=None, seconds=None):
+        stage = Stage(name, detail, rows, seconds)
+        self.stages.append(stage)
+        return stage
+
+    def scan(self, batches, detail):
+        # position batches of an access path; always counted
+        return self._count(batches, self.stage("scan", detail), batches=True, scanned=True)
+
+    def track(self, items, name, detail="", batches=False):
+        # other operators are only wrapped when the statement is timed
+        if not self.timed:
+            return items
+        return self._count(items, self.stage(name, detail), batches)
+
+    def _count(self, items, stage, batches=False, scanned=False):
+        clock = time.perf_counter if self.timed else None
+        stage.rows = 0
+        if clock:
+            stage.seconds = 0.0
+        items = iter(items)
+        while True:
+            start = clock() if clock else 0
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                if clock:
+                    stage.seconds += clock() - start
+            n = len(item) if batches else 1
+            stage.rows += n
+            if scanned:
+                self.scanned += n
+            yield item
+
+    def report(self):
+        return [{"stage": s.name, "detail": s.detail, "rows": s.rows,
+                 "time_ms": None if s.seconds is None else round(s.seconds * 1000, 3)} for s in self.stages]
+
+
+class Metrics:
+    def __init__(self, slow_query_ms=None, slow_query_log=None):
+        self.slow_query_ms = slow_query_ms  # None disables the slow-query log
+        self.slow_query_log = slow_query_log  # JSON lines file, e.g. "slow_queries.log"
+        self.statements = {}  # statement kind -> count
+        self.errors = 0
+        self.latency = {}  # statement kind -> bucket counts
+        self.rows_scanned = 0
+        self.rows_returned = 0
+        self.rows_written = 0
+        self._mutex = threading.Lock()
+
+    def record(self, kind, sql, seconds, profile=None, returned=0, error=False):
+        ms = seconds * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound), len(LATENCY_BUCKETS_MS))
+        scanned = profile.scanned if profile is not None else 0
+        written = profile.written if profile is not None else 0
+        with self._mutex:
+            self.statements[kind] = self.statements.get(kind, 0) + 1
+            counts = self.latency.setdefault(kind, [0] * (len(LATENCY_BUCKETS_MS) + 1))
+            counts[bucket] += 1
+            self.rows_scanned += scanned
+            self.rows_returned += returned
+            self.rows_written += written
+            if error:
+                self.errors += 1
+        if self.slow_query_ms is not None and ms >= self.slow_query_ms:
+            self._log_slow(sql, ms, profile, scanned, returned, written)
+
+    def _log_slow(self, sql, ms, profile, scanned, returned, written):
+        entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "ms": round(ms, 3), "sql": sql,
+                 "rows_scanned": scanned, "rows_returned": returned, "rows_written": written,
+                 "plan": [f"{s.name}: {s.detail}" for s in profile.stages] if profile is not None else []}
+        path = self.slow_query_log or "slow_queries.log"
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._mutex, open(path, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    def report(self):
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        with self._mutex:
+            return {
+                "statements": dict(self.statements),
+                "errors": self.errors,
+                "latency_ms": {kind: dict(zip(labels, counts)) for kind, counts in self.latency.items()},
+                "rows_scanned": self.rows_scanned,
+                "rows_returned": self.rows_returned,
+                "rows_written": self.rows_written,
+            }
@@ -0,0 +1,65 @@
+# operators.py
+# Generator operators a single-table SELECT is assembled from:
+#   scan -> filter -> limit -> project
+# Rows are only materialized by project, after LIMIT/OFFSET have been applied
+# to row positions, and the scan stops as soon as the limit is reached.
+# Aggregations read column batches instead of rows (scan -> filter -> columns).
+from itertools import islice
+
+BATCH_SIZE = 1024  # positions filtered per step
+
+
+def scan(table, path=None):
+    # candidate positions from the access path (all rows for a full scan), in batches
+    positions = path.positions(table) if path else None
+    if positions is None:
+        positions = table.store.live_positions()
+    if not hasattr(positions, "__len__"):
+        # produced lazily, e.g. in index order
+        positions = iter(positions)
+        while batch := list(islice(positions, BATCH_SIZE)):
+            yield batch
+        return
+    for start in range(0, len(positions), BATCH_SIZE):
+        yield positions[start:start + BATCH_SIZE]
+
+
+def filter_batches(table, batches, where=None):
+    for batch in batches:
+        batch = table.store.filter(where, batch) if where else batch
+        if len(batch):
+            yield batch
+
+
+def filter_positions(table, batches, where=None):
+    for batch in filter_batches(table, batches, where):
+        yield from batch
+
+
+def column_batches(table, batches, columns):
+    # ({column: values}, row count) for every batch of positions
+    for batch in batches:
+        yield {col: table.store.column_values(col, batch) for col in columns}, len(batch)
+
+
+def row_batches(rows, columns):
+    # the same column batches built from materialized rows, e.g. join output
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield {col: [r.get(col) for r in batch] for col in columns}, len(batch)
+            batch = []
+    if batch:
+        yield {col: [r.get(col) for r in batch] for col in columns}, len(batch)
+
+
+def limit(items, count=None, offset=0):
+    if count is None and not offset:
+        return items
+    return islice(items, offset, None if count is None else offset + count)
+
+
+def project(table, positions, columns=None):
+    for pos in positions:
+        yield table.row(pos, columns)
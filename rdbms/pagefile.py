@@ -0,0 +1,124 @@
+# pagefile.py
+# Binary page-based table file (<table>.pages), an alternative to the JSON base file.
+#
+#   header     magic, page size, page count, row count, schema length
+#   schema     JSON list of [column, type]
+#   directory  (offset, length, row count) for every page
+#   pages      rows packed back to back: a null bitmap, then every non-NULL
+#              value - INT as int64, FLOAT as float64, anything else as
+#              length-prefixed UTF-8 (JSON for columns of other types)
+#
+# The file is read through mmap; only the header and directory are parsed on
+# open and each page is decoded when it is asked for.
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b"RDBPAGE1"
+PAGE_SIZE = 64 * 1024  # target bytes of row data per page
+HEADER = struct.Struct("<8sIIQI")
+DIRECTORY_ENTRY = struct.Struct("<QII")
+INT = struct.Struct("<q")
+FLOAT = struct.Struct("<d")
+LENGTH = struct.Struct("<I")
+
+
+def _encode_row(row, schema):
+    bitmap = bytearray((len(schema) + 7) // 8)
+    parts = [bitmap]
+    for i, (col, typ) in enumerate(schema):
+        val = row.get(col)
+        if val is None:
+            bitmap[i >> 3] |= 1 << (i & 7)
+        elif typ == "INT":
+            parts.append(INT.pack(val))
+        elif typ == "FLOAT":
+            parts.append(FLOAT.pack(val))
+        else:
+            data = (val if typ == "TEXT" else json.dumps(val)).encode()
+            parts.append(LENGTH.pack(len(data)))
+            parts.append(data)
+    return b"".join(parts)
+
+
+def write_pages(path, columns, rows):
+    schema = list(columns.items())
+    schema_blob = json.dumps(schema).encode()
+    pages = []  # [(encoded bytes, row count)]
+    current, count, size = [], 0, 0
+    for row in rows:
+        try:
+            data = _encode_row(row, schema)
+        except struct.error:
+            raise ValueError(f"Row {row} does not match the column types of the table")
+        current.append(data)
+        count += 1
+        size += len(data)
+        if size >= PAGE_SIZE:
+            pages.append((b"".join(current), count))
+            current, count, size = [], 0, 0
+    if current:
+        pages.append((b"".join(current), count))
+
+    offset = HEADER.size + len(schema_blob) + DIRECTORY_ENTRY.size * len(pages)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, PAGE_SIZE, len(pages), sum(n for _, n in pages), len(schema_blob)))
+        f.write(schema_blob)
+        for data, n in pages:
+            f.write(DIRECTORY_ENTRY.pack(offset, len(data), n))
+            offset += len(data)
+        for data, _ in pages:
+            f.write(data)
+
+
+class PageFile:
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) == 0:
+            raise ValueError(f"'{path}' is empty")
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.page_size, self.page_count, self.row_count, schema_len = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a table page file")
+        self.schema = [tuple(entry) for entry in json.loads(self._map[HEADER.size:HEADER.size + schema_len])]
+        start = HEADER.size + schema_len
+        self.directory = [DIRECTORY_ENTRY.unpack_from(self._map, start + i * DIRECTORY_ENTRY.size)
+                          for i in range(self.page_count)]
+
+    def page(self, number):
+        offset, length, count = self.directory[number]
+        buf = self._map
+        end = offset + length
+        bitmap_len = (len(self.schema) + 7) // 8
+        rows = []
+        pos = offset
+        while pos < end and len(rows) < count:
+            bitmap = buf[pos:pos + bitmap_len]
+            pos += bitmap_len
+            row = {}
+            for i, (col, typ) in enumerate(self.schema):
+                if bitmap[i >> 3] & (1 << (i & 7)):
+                    row[col] = None
+                elif typ == "INT":
+                    row[col] = INT.unpack_from(buf, pos)[0]
+                    pos += INT.size
+                elif typ == "FLOAT":
+                    row[col] = FLOAT.unpack_from(buf, pos)[0]
+                    pos += FLOAT.size
+                else:
+                    (n,) = LENGTH.unpack_from(buf, pos)
+                    text = buf[pos + LENGTH.size:pos + LENGTH.size + n].decode()
+                    row[col] = text if typ == "TEXT" else json.loads(text)
+                    pos += LENGTH.size + n
+            rows.append(row)
+        return rows
+
+    def __iter__(self):
+        for number in range(self.page_count):
+            yield from self.page(number)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,110 @@
+# parallel.py
+# Runs one function over the partitions of a table on a pool of worker
+# processes. The workers are started with spawn, which is safe from any thread
+# (a forked child would inherit the locks other threads of a threaded server
+# hold, never to be released), and stay up from one call to the next. A
+# worker keeps the last version it was sent of every partition assigned to
+# it, so a partition is only pickled again after a write changed it; only the
+# results come back. One call uses the workers at a time: a call made while
+# they are busy, or over partitions too small to pay for the round trip, runs
+# in the caller.
+import multiprocessing
+import os
+import threading
+
+PROCESSES = os.cpu_count() or 1  # upper bound on worker processes
+PARALLEL_MIN_ROWS = 100000  # smaller scans run in the calling process
+
+_workers = []
+_workers_lock = threading.Lock()  # held by the call using the workers
+
+
+class Worker:
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.held = {}  # partition name -> version the worker holds
+
+    def submit(self, func, items):
+        # items are (partition name, version, snapshot); a snapshot the worker
+        # already holds is not sent again
+        tasks = [(name, version, None if self.held.get(name) == version else item)
+                 for name, version, item in items]
+        self.conn.send((func, tasks))
+        self.held.update((name, version) for name, version, _ in items)
+
+    def reply(self):
+        # (True, results) or (False, the exception func raised)
+        return self.conn.recv()
+
+    def stop(self):
+        self.conn.close()
+        self.process.terminate()
+        self.process.join()
+
+
+def _serve(conn):
+    # the worker loop: run func over the partitions of each request
+    held = {}  # partition name -> (version, snapshot)
+    while True:
+        try:
+            func, tasks = conn.recv()
+        except EOFError:
+            return
+        try:
+            results = []
+            for name, version, item in tasks:
+                if item is not None:
+                    held[name] = (version, item)
+                results.append(func(held[name][1]))
+            conn.send((True, results))
+        except Exception as e:
+            conn.send((False, e))
+
+
+def workers_for(items, rows):
+    # number of processes parallel_map uses when the workers are free, 1 when
+    # it runs in-process
+    if rows < PARALLEL_MIN_ROWS or PROCESSES < 2:
+        return 1
+    return min(PROCESSES, len(items))
+
+
+def _stop_workers():
+    while _workers:
+        _workers.pop().stop()
+
+
+def parallel_map(func, items, rows):
+    # ([func(item) for item in items], number of processes used); items are
+    # table snapshots, rows the total work, which decides whether the workers
+    # are worth it
+    processes = workers_for(items, rows)
+    if processes < 2 or not _workers_lock.acquire(blocking=False):
+        return [func(item) for item in items], 1
+    try:
+        # partition i always goes to the same worker, which keeps it
+        assigned = [list(range(i, len(items), processes)) for i in range(processes)]
+        try:
+            while len(_workers) < processes:
+                _workers.append(Worker())
+            for worker, positions in zip(_workers, assigned):
+                worker.submit(func, [(items[i].name, items[i].version, items[i]) for i in positions])
+            replies = [worker.reply() for worker in _workers[:processes]]
+        except Exception:
+            # a worker died or a snapshot could not be sent: the workers start
+            # afresh next time, and this call reads in-process
+            _stop_workers()
+            return [func(item) for item in items], 1
+        results = [None] * len(items)
+        for (ok, value), positions in zip(replies, assigned):
+            if not ok:
+                raise value
+            for i, result in zip(positions, value):
+                results[i] = result
+        return results, processes
+    finally:
+        _workers_lock.release()
@@ -0,0 +1,530 @@
+# parser.py
+# Lexer and recursive-descent parser shared by every command. Statements are
+# parsed into small AST classes; literals may be Param placeholders that are
+# bound at execution time, so one parsed statement serves many literal values.
+import re
+
+from .predicate import Compare, In, Between, IsNull, Like, Not, And, Or
+
+TOKEN_RE = re.compile(r"""
+    (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+  | (?P<op>!=|<>|>=|<=|=|<|>)
+  | (?P<punct>[(),*:?])
+  | (?P<word>[^\s=<>!(),*:?'"]+)
+""", re.VERBOSE)
+
+KEYWORDS = {
+    "CREATE", "TABLE", "INDEX", "ON", "USING", "INSERT", "INTO", "SELECT", "FROM", "JOIN",
+    "WHERE", "AND", "UPDATE", "SET", "DELETE", "NULL", "PRIMARY_KEY", "UNIQUE",
+    "BEGIN", "COMMIT", "ROLLBACK", "COPY", "STORAGE", "LIMIT", "OFFSET", "GROUP", "BY",
+    "FORMAT", "EXPLAIN", "ANALYZE", "PARTITION", "OR", "NOT", "IN", "BETWEEN", "IS", "LIKE",
+    "ORDER", "ASC", "DESC",
+}
+
+# keywords that cannot name a table or column; any other keyword can, wherever
+# a name is expected (SELECT order, desc FROM index ORDER BY order DESC)
+RESERVED = {"FROM", "WHERE", "AND", "OR", "NOT", "NULL", "INTO"}
+
+CLAUSES = ("GROUP", "ORDER", "LIMIT", "OFFSET")  # keywords that end a WHERE clause
+
+AGGREGATE_FUNCS = ("COUNT", "SUM", "AVG", "MIN", "MAX")
+
+DML = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+USER_PARAM = object()  # marks a literal slot that is filled from execute(..., params)
+
+
+class Param:
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f"Param({self.index})"
+
+
+def bind(value, params):
+    return params[value.index] if isinstance(value, Param) else value
+
+
+# ----------------- AST -----------------
+class CreateTable:
+    def __init__(self, name, columns, primary_key=None, unique=None, storage="ROW", file_format="JSON",
+                 partition=None):
+        self.name = name
+        self.columns = columns
+        self.primary_key = primary_key
+        self.unique = unique or []
+        self.storage = storage
+        self.file_format = file_format
+        self.partition = partition  # {"kind", "column", "count" or "bounds"}, None if not partitioned
+
+
+class CreateIndex:
+    def __init__(self, table, column, kind="HASH"):
+        self.table = table
+        self.column = column
+        self.kind = kind
+
+
+class Insert:
+    def __init__(self, table, values):
+        self.table = table
+        self.values = values  # {col: literal}
+
+
+class Aggregate:
+    def __init__(self, func, column=None):
+        self.func = func
+        self.column = column  # None for COUNT(*)
+
+    @property
+    def name(self):
+        return f"{self.func}({self.column or '*'})"
+
+
+class Join:
+    def __init__(self, table, left, right):
+        self.table = table
+        self.left = left  # "table.column"
+        self.right = right
+
+
+class Select:
+    def __init__(self, columns, table, join=None, where=None, limit=None, offset=None, group_by=None,
+                 order_by=None):
+        self.columns = columns  # ["*"] or column names / Aggregate nodes
+        self.table = table
+        self.join = join
+        self.where = where  # predicate tree, None without WHERE
+        self.group_by = group_by or []
+        self.order_by = order_by or []  # [(column or aggregate name, descending)]
+        self.limit = limit
+        self.offset = offset
+
+
+class Update:
+    def __init__(self, table, values, where=None):
+        self.table = table
+        self.values = values
+        self.where = where
+
+
+class Delete:
+    def __init__(self, table, where=None):
+        self.table = table
+        self.where = where
+
+
+class Copy:
+    def __init__(self, table, path):
+        self.table = table
+        self.path = path
+
+
+class Explain:
+    def __init__(self, stmt, analyze=False):
+        self.stmt = stmt  # Select, Update or Delete
+        self.analyze = analyze  # run the statement and report what it did
+
+
+class Begin:
+    pass
+
+
+class Commit:
+    pass
+
+
+class Rollback:
+    pass
+
+
+# ----------------- LEXER -----------------
+def _number(text):
+    # same coercion the REPL has always applied to unquoted values
+    try:
+        return float(text) if "." in text else int(text)
+    except ValueError:
+        return None
+
+
+def tokenize(sql):
+    tokens = []
+    pos = 0
+    length = len(sql)
+    while True:
+        while pos < length and sql[pos].isspace():
+            pos += 1
+        if pos >= length:
+            break
+        m = TOKEN_RE.match(sql, pos)
+        if not m:
+            raise ValueError(f"Unexpected character '{sql[pos]}' at position {pos}")
+        pos = m.end()
+        text = m.group()
+        if m.lastgroup == "string":
+            tokens.append(("STRING", text, text[1:-1].replace(text[0] * 2, text[0])))
+        elif m.lastgroup == "op":
+            tokens.append(("OP", "!=" if text == "<>" else text, None))
+        elif text == "?":
+            tokens.append(("PARAM", text, None))
+        elif m.lastgroup == "punct":
+            tokens.append(("PUNCT", text, None))
+        else:
+            number = _number(text)
+            if number is not None:
+                tokens.append(("NUMBER", text, number))
+            elif text.upper() in KEYWORDS:
+                tokens.append(("WORD", text.upper(), text))
+            else:
+                tokens.append(("WORD", text, text))
+    return tokens
+
+
+def normalize(tokens):
+    # replace every literal of a DML statement with "?" and return
+    # (cache key, normalized tokens, literal values in placeholder order);
+    # words are keyed as written, since a keyword may be a column name
+    out = []
+    literals = []
+    prev = None
+    for tok in tokens:
+        kind, text, value = tok
+        if kind in ("NUMBER", "STRING"):
+            out.append(("PARAM", "?", None))
+            literals.append(value)
+        elif kind == "WORD" and prev == "OP" and "." not in text and text != "NULL":
+            # bare word on the right of a comparison, e.g. name=Alice
+            out.append(("PARAM", "?", None))
+            literals.append(value)
+        elif kind == "PARAM":
+            out.append(tok)
+            literals.append(USER_PARAM)
+        else:
+            out.append(tok)
+        prev = kind
+    return " ".join(tok[2] if tok[0] == "WORD" else tok[1] for tok in out), out, literals
+
+
+# ----------------- PARSER -----------------
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.params = 0
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else ("END", "", None)
+
+    def next(self):
+        tok = self.peek()
+        self.pos += 1
+        return tok
+
+    def at(self, *texts):
+        return self.peek()[0] in ("WORD", "PUNCT", "OP") and self.peek()[1] in texts
+
+    def accept(self, *texts):
+        if self.at(*texts):
+            return self.next()
+        return None
+
+    def expect(self, text, syntax):
+        if not self.accept(text):
+            raise ValueError(f"Syntax: {syntax}")
+
+    def name(self, syntax):
+        kind, text, value = self.next()
+        if kind != "WORD" or text in RESERVED:
+            raise ValueError(f"Syntax: {syntax}")
+        return value
+
+    def option(self, text):
+        # OPTION= of CREATE TABLE; a column of the same name is followed by ":"
+        if self.at(text) and self.peek(1)[1] == "=":
+            self.pos += 2
+            return True
+        return False
+
+    def value(self):
+        kind, text, value = self.next()
+        if kind == "PARAM":
+            self.params += 1
+            return Param(self.params - 1)
+        if kind in ("NUMBER", "STRING"):
+            return value
+        if kind == "WORD":
+            return None if text == "NULL" else value
+        raise ValueError(f"Expected a value, got '{text or 'end of command'}'")
+
+    def done(self):
+        return self.peek()[0] == "END"
+
+    def parse(self):
+        kind, text, _ = self.peek()
+        if kind != "WORD":
+            raise ValueError(f"Unknown command: {text}")
+        method = getattr(self, "parse_" + text.lower(), None)
+        if method is None or text not in KEYWORDS:
+            raise ValueError(f"Unknown command: {text}")
+        stmt = method()
+        if not self.done():
+            raise ValueError(f"Unexpected '{self.peek()[1]}' at end of command")
+        return stmt
+
+    def parse_create(self):
+        self.next()
+        if self.accept("TABLE"):
+            return self.parse_create_table()
+        if self.accept("INDEX"):
+            return self.parse_create_index()
+        raise ValueError("Syntax: CREATE TABLE ... | CREATE INDEX ...")
+
+    def parse_create_table(self):
+        syntax = ("CREATE TABLE name col:TYPE ... [PRIMARY_KEY=col] [UNIQUE=col1,col2] "
+                  "[STORAGE=ROW|COLUMN] [FORMAT=JSON|PAGED] [PARTITION=HASH(col,n)|RANGE(col,bound,...)]")
+        name = self.name(syntax)
+        columns = {}
+        primary_key = None
+        unique = []
+        storage = "ROW"
+        file_format = "JSON"
+        partition = None
+        while not self.done():
+            if self.option("PARTITION"):
+                partition = self.partition_spec(syntax)
+            elif self.option("STORAGE"):
+                storage = self.name(syntax).upper()
+            elif self.option("FORMAT"):
+                file_format = self.name(syntax).upper()
+            elif self.option("PRIMARY_KEY"):
+                primary_key = self.name(syntax)
+            elif self.option("UNIQUE"):
+                unique.append(self.name(syntax))
+                while self.accept(","):
+                    unique.append(self.name(syntax))
+            else:
+                col = self.name(syntax)
+                self.expect(":", syntax)
+                columns[col] = self.name(syntax).upper()
+        return CreateTable(name, columns, primary_key, unique, storage, file_format, partition)
+
+    def partition_spec(self, syntax):
+        kind = self.name(syntax).upper()
+        self.expect("(", syntax)
+        spec = {"kind": kind, "column": self.name(syntax)}
+        values = []
+        while self.accept(","):
+            values.append(self.value())
+        self.expect(")", syntax)
+        if kind == "HASH":
+            if len(values) != 1:
+                raise ValueError("Syntax: PARTITION=HASH(col,n)")
+            spec["count"] = values[0]
+        else:
+            spec["bounds"] = values
+        return spec
+
+    def parse_create_index(self):
+        syntax = "CREATE INDEX ON table(column) [USING HASH|ORDERED]"
+        self.expect("ON", syntax)
+        table = self.name(syntax)
+        self.expect("(", syntax)
+        column = self.name(syntax)
+        self.expect(")", syntax)
+        kind = "HASH"
+        if self.accept("USING"):
+            kind = self.name(syntax).upper()
+        return CreateIndex(table, column, kind)
+
+    def assignments(self, syntax):
+        values = {}
+        while not self.done() and not self.at("WHERE"):
+            col = self.name(syntax)
+            self.expect("=", syntax)
+            values[col] = self.value()
+            self.accept(",")
+        return values
+
+    def parse_insert(self):
+        syntax = "INSERT [INTO] table col1=val1 col2=val2 ..."
+        self.next()
+        self.accept("INTO")
+        table = self.name(syntax)
+        return Insert(table, self.assignments(syntax))
+
+    def where(self):
+        if not self.accept("WHERE"):
+            return None
+        return self.disjunction("WHERE col<op>value | col [NOT] IN (v1, ...) | col [NOT] BETWEEN a AND b | "
+                                "col IS [NOT] NULL | col [NOT] LIKE pattern, combined with AND, OR, NOT, ( )")
+
+    def disjunction(self, syntax):
+        items = [self.conjunction(syntax)]
+        while self.accept("OR"):
+            items.append(self.conjunction(syntax))
+        return items[0] if len(items) == 1 else Or(items)
+
+    def conjunction(self, syntax):
+        # AND may be left out between two conditions
+        items = [self.negation(syntax)]
+        while self.accept("AND") or not (self.done() or self.at("OR", ")", *CLAUSES)):
+            items.append(self.negation(syntax))
+        items = [c for item in items for c in (item.items if isinstance(item, And) else [item])]
+        return items[0] if len(items) == 1 else And(items)
+
+    def negation(self, syntax):
+        if self.accept("NOT"):
+            return Not(self.negation(syntax))
+        if self.accept("("):
+            node = self.disjunction(syntax)
+            self.expect(")", syntax)
+            return node
+        return self.condition(syntax)
+
+    def condition(self, syntax):
+        col = self.name(syntax)
+        if self.accept("IS"):
+            negated = bool(self.accept("NOT"))
+            self.expect("NULL", syntax)
+            return Not(IsNull(col)) if negated else IsNull(col)
+        negated = bool(self.accept("NOT"))
+        if self.accept("IN"):
+            self.expect("(", syntax)
+            values = [self.value()]
+            while self.accept(","):
+                values.append(self.value())
+            self.expect(")", syntax)
+            node = In(col, values)
+        elif self.accept("BETWEEN"):
+            low = self.value()
+            self.expect("AND", syntax)
+            node = Between(col, low, self.value())
+        elif self.accept("LIKE"):
+            node = Like(col, self.value())
+        elif negated:
+            raise ValueError(f"Syntax: {syntax}")
+        else:
+            kind, op, _ = self.next()
+            if kind != "OP":
+                raise ValueError(f"Expected a comparison after '{col}'")
+            return Compare(col, op, self.value())
+        return Not(node) if negated else node
+
+    def parse_select(self):
+        syntax = ("SELECT col1, col2 | COUNT(*), SUM(col), ... FROM table [JOIN table2 ON a.col=b.col] "
+                  "[WHERE ...] [GROUP BY col, ...] [ORDER BY col [ASC|DESC], ...] [LIMIT n] [OFFSET m]")
+        self.next()
+        columns = []
+        while not self.at("FROM"):
+            if self.done():
+                raise ValueError("Syntax error in SELECT")
+            if self.accept("*"):
+                columns.append("*")
+            elif self.peek()[1].upper() in AGGREGATE_FUNCS and self.peek(1)[1] == "(":
+                columns.append(self.aggregate(syntax))
+            else:
+                columns.append(self.name(syntax))
+            self.accept(",")
+        self.next()
+        table = self.name(syntax)
+        join = None
+        if self.accept("JOIN"):
+            join_table = self.name(syntax)
+            self.expect("ON", syntax)
+            left = self.name(syntax)
+            self.expect("=", syntax)
+            right = self.name(syntax)
+            if "." not in left or "." not in right:
+                raise ValueError(f"Syntax: {syntax}")
+            join = Join(join_table, left, right)
+        where = self.where()
+        group_by = []
+        if self.accept("GROUP"):
+            self.expect("BY", syntax)
+            group_by.append(self.name(syntax))
+            while self.accept(","):
+                group_by.append(self.name(syntax))
+        order_by = []
+        if self.accept("ORDER"):
+            self.expect("BY", syntax)
+            order_by.append(self.sort_item(syntax))
+            while self.accept(","):
+                order_by.append(self.sort_item(syntax))
+        limit = offset = None
+        if self.accept("LIMIT"):
+            limit = self.value()
+        if self.accept("OFFSET"):
+            offset = self.value()
+        return Select(columns or ["*"], table, join, where, limit, offset, group_by, order_by)
+
+    def sort_item(self, syntax):
+        # (name, descending); aggregates are named like their result column, e.g. "COUNT(*)"
+        if self.peek()[1].upper() in AGGREGATE_FUNCS and self.peek(1)[1] == "(":
+            name = self.aggregate(syntax).name
+        else:
+            name = self.name(syntax)
+        descending = bool(self.accept("DESC"))
+        if not descending:
+            self.accept("ASC")
+        return name, descending
+
+    def aggregate(self, syntax):
+        func = self.next()[1].upper()
+        self.expect("(", syntax)
+        if func == "COUNT" and self.accept("*"):
+            column = None
+        else:
+            column = self.name(syntax)
+        self.expect(")", syntax)
+        return Aggregate(func, column)
+
+    def parse_update(self):
+        syntax = "UPDATE table SET col=val [WHERE ...]"
+        self.next()
+        table = self.name(syntax)
+        self.expect("SET", syntax)
+        values = self.assignments(syntax)
+        return Update(table, values, self.where())
+
+    def parse_delete(self):
+        self.next()
+        self.accept("FROM")
+        table = self.name("DELETE [FROM] table [WHERE ...]")
+        return Delete(table, self.where())
+
+
+    def parse_copy(self):
+        syntax = "COPY table FROM 'file.csv|file.jsonl'"
+        self.next()
+        table = self.name(syntax)
+        self.expect("FROM", syntax)
+        kind, _, path = self.next()
+        if kind != "STRING":
+            raise ValueError(f"Syntax: {syntax}")
+        return Copy(table, path)
+
+    def parse_explain(self):
+        self.next()
+        analyze = bool(self.accept("ANALYZE"))
+        if not self.at("SELECT", "UPDATE", "DELETE"):
+            raise ValueError("Syntax: EXPLAIN [ANALYZE] SELECT|UPDATE|DELETE ...")
+        return Explain(getattr(self, "parse_" + self.peek()[1].lower())(), analyze)
+
+    def parse_begin(self):
+        self.next()
+        return Begin()
+
+    def parse_commit(self):
+        self.next()
+        return Commit()
+
+    def parse_rollback(self):
+        self.next()
+        return Rollback()
+
+
+def parse(tokens):
+    parser = Parser(tokens)
+    return parser.parse(), parser.params
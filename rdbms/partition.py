@@ -0,0 +1,339 @@
+# partition.py
+# Tables split on one column into partitions. Every partition is an ordinary
+# Table with its own files (data/<name>.p<i>.json and data/<name>.p<i>.log).
+#   HASH(col,n)           - a row goes to partition hash(value) % n
+#   RANGE(col,b1,b2,...)  - partition 0 holds the values below b1, partition i
+#                           the values from b(i) up to b(i+1); NULLs go to 0
+# Statements only visit the partitions their WHERE clause can match. Filtered
+# scans and aggregations over large tables run on worker processes
+# (parallel.py), and their results are merged here.
+import copy
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from functools import partial
+from itertools import chain
+
+from . import operators
+from .table import Table
+from .aggregate import partial_aggregate, merge_groups, finish_groups
+from .planner import choose_access_path
+from .predicate import Compare, In, Between, IsNull, And, Or
+from .metrics import Profile
+from .parallel import parallel_map, workers_for
+from .storage import coerce
+from .locks import RWLock
+
+PARTITION_KINDS = ("HASH", "RANGE")
+
+
+def stable_hash(value):
+    # the same in every process and run, unlike hash() of a string
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, int):
+        return value
+    return zlib.crc32(str(value).encode())
+
+
+# ----------------- WORKERS -----------------
+# Run in the worker processes, on the partition snapshots they were sent.
+def _select_partition(columns, where, part):
+    profile = Profile()
+    rows = part.select(columns, where, profile=profile)
+    return rows, profile.scanned
+
+
+def _aggregate_partition(where, group_by, aggregates, columns, part):
+    profile = Profile()
+    path = choose_access_path(part, where) if where else None
+    batches = profile.scan(operators.scan(part, path), part.name)
+    if path and path.residual:
+        batches = operators.filter_batches(part, batches, path.residual)
+    groups = partial_aggregate(operators.column_batches(part, batches, columns), group_by, aggregates)
+    return groups, profile.scanned
+
+
+class PartitionedTable:
+    def __init__(self, name, columns, primary_key=None, unique=None, storage="ROW", file_format="JSON",
+                 partition=None):
+        kind, column = partition["kind"], partition["column"]
+        if kind not in PARTITION_KINDS:
+            raise ValueError(f"Unknown partitioning '{kind}'")
+        if column not in columns:
+            raise ValueError(f"Partition column '{column}' does not exist")
+        bounds = None
+        if kind == "HASH":
+            count = partition.get("count")
+            if not isinstance(count, int) or count < 1:
+                raise ValueError("HASH partitioning needs a positive number of partitions")
+        else:
+            bounds = [coerce(columns, column, bound) for bound in partition.get("bounds") or []]
+            try:
+                increasing = all(a < b for a, b in zip(bounds, bounds[1:]))
+            except TypeError:
+                increasing = False
+            if not bounds or None in bounds or not increasing:
+                raise ValueError("RANGE partition bounds must be increasing values")
+            count = len(bounds) + 1
+        self.name = name
+        self.columns = columns
+        self.primary_key = primary_key
+        self.unique = unique or []
+        self.storage = storage
+        self.file_format = file_format
+        self.kind = kind
+        self.column = column
+        self.bounds = bounds
+        self.partitions = [Table(f"{name}.p{i}", columns, primary_key, unique, storage, file_format)
+                           for i in range(count)]
+        self.lock = RWLock()  # writers hold it exclusively, snapshots of all partitions are taken under it
+
+    def partition_spec(self):
+        if self.kind == "HASH":
+            return {"kind": "HASH", "column": self.column, "count": len(self.partitions)}
+        return {"kind": "RANGE", "column": self.column, "bounds": self.bounds}
+
+    @property
+    def version(self):
+        return tuple(part.version for part in self.partitions)
+
+    @property
+    def io_stats(self):
+        stats = {}
+        for part in self.partitions:
+            for key, value in part.io_stats.items():
+                stats[key] = stats.get(key, 0) + value
+        return stats
+
+    # the key maps and indexes live in the partitions: the planner sees a
+    # full scan here and every partition picks its own access path
+    @property
+    def keys(self):
+        return {}
+
+    @property
+    def indexes(self):
+        return {}
+
+    @property
+    def rows(self):
+        return list(chain.from_iterable(part.rows for part in self.partitions))
+
+    def __len__(self):
+        return sum(len(part) for part in self.partitions)
+
+    def index_definitions(self):
+        return self.partitions[0].index_definitions()
+
+    def save(self):
+        self.checkpoint()
+
+    def checkpoint(self):
+        for part in self.partitions:
+            part.checkpoint()
+
+    def close(self):
+        for part in self.partitions:
+            part.close()
+
+    # ----------------- SNAPSHOTS -----------------
+    def snapshot(self, decoded=False):
+        # paged partitions are decoded here, so worker processes never have to
+        with self.lock.read():
+            parts = []
+            try:
+                for part in self.partitions:
+                    parts.append(part.snapshot(decoded=True))
+            except Exception:
+                for part in parts:
+                    part.release()
+                raise
+        snap = copy.copy(self)
+        snap.partitions = parts
+        return snap
+
+    def release(self):
+        for part in self.partitions:
+            part.release()
+
+    # ----------------- TRANSACTIONS -----------------
+    def begin(self):
+        for part in self.partitions:
+            part.begin()
+
+    def commit(self):
+        for part in self.partitions:
+            part.commit()
+
+    def rollback(self):
+        for part in self.partitions:
+            part.rollback()
+
+    # ----------------- ROUTING -----------------
+    def partition_of(self, value):
+        if value is None:
+            return 0
+        if self.kind == "HASH":
+            return stable_hash(value) % len(self.partitions)
+        try:
+            return bisect_right(self.bounds, value)
+        except TypeError:
+            raise ValueError(f"Cannot compare {value!r} with the partition bounds of '{self.column}'")
+
+    def prune(self, where):
+        # the partitions a WHERE clause can match
+        return [self.partitions[i] for i in sorted(self._matching(where))]
+
+    def _matching(self, node):
+        # numbers of the partitions that can hold rows satisfying node
+        everything = set(range(len(self.partitions)))
+        if isinstance(node, And):
+            return everything.intersection(*(self._matching(item) for item in node.items))
+        if isinstance(node, Or):
+            return set().union(*(self._matching(item) for item in node.items))
+        if getattr(node, "column", None) != self.column:
+            return everything
+        bounds = self.bounds
+        try:
+            if isinstance(node, IsNull):
+                return {0}
+            if isinstance(node, In):
+                return set().union(*(self._matching(Compare(self.column, "=", v)) for v in node.values))
+            if isinstance(node, Between):
+                if node.low is None or node.high is None:
+                    return set()
+                if self.kind == "RANGE":
+                    return set(range(bisect_right(bounds, node.low), bisect_right(bounds, node.high) + 1))
+            elif isinstance(node, Compare) and node.op != "!=":
+                op, val = node.op, node.value
+                if val is None:
+                    return {0} if op == "=" else set()
+                if op == "=":
+                    return {self.partition_of(val)}
+                if self.kind == "RANGE":
+                    if op in (">", ">="):
+                        return set(range(bisect_right(bounds, val), len(self.partitions)))
+                    if op == "<":
+                        return set(range(bisect_left(bounds, val) + 1))
+                    return set(range(bisect_right(bounds, val) + 1))
+        except (TypeError, ValueError):
+            pass  # not comparable with the bounds; the scan decides
+        return everything
+
+    def describe(self, parts):
+        return f"{self.name}: {len(parts)} of {len(self.partitions)} {self.kind} partitions on {self.column}"
+
+    def _pruned(self, where, profile=None):
+        parts = self.prune(where)
+        if profile is not None:
+            profile.stage("partitions", self.describe(parts))
+        return parts
+
+    # ----------------- KEY CONSTRAINTS -----------------
+    # A key on the partition column is checked by the partition holding the
+    # value. Equal values of the other key columns can land in different
+    # partitions, so they are checked against all of them.
+    def _global_keys(self):
+        return [col for col in self.partitions[0]._key_columns() if col != self.column]
+
+    def _check_global_keys(self, rows):
+        for col in self._global_keys():
+            seen = set()
+            for row in rows:
+                val = row.get(col)
+                if val is None:
+                    continue
+                if val in seen or any(val in part.keys[col] for part in self.partitions):
+                    raise self.partitions[0]._key_violation(col)
+                seen.add(val)
+
+    # ----------------- WRITES -----------------
+    def insert(self, row):
+        row = self.partitions[0].store.normalize(row)
+        part = self.partitions[self.partition_of(row.get(self.column))]
+        self._check_global_keys([row])
+        part.insert(row)
+        return f"Row inserted into '{self.name}'."
+
+    def insert_many(self, rows):
+        rows = [self.partitions[0].store.normalize(row) for row in rows]
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.partition_of(row.get(self.column)), []).append(row)
+        # every partition's batch is checked before the first one is written
+        self._check_global_keys(rows)
+        for i, group in groups.items():
+            self.partitions[i]._check_keys_many(group)
+            self.partitions[i]._check_indexes(group)
+        for i, group in groups.items():
+            self.partitions[i].insert_many(group)
+        return f"{len(rows)} rows inserted into '{self.name}'."
+
+    def update(self, set_values, where=None, profile=None):
+        if self.column in set_values:
+            raise ValueError(f"Cannot update partition column '{self.column}'")
+        set_values = self.partitions[0].store.normalize_values(set_values)
+        parts = self._pruned(where, profile)
+        changed = [col for col in self._global_keys() if set_values.get(col) is not None]
+        if changed:
+            matched = [(part, part._matching_positions(where)) for part in parts]
+            matched = [(part, positions) for part, positions in matched if positions]
+            if sum(len(positions) for _, positions in matched) > 1:
+                raise ValueError(f"Unique constraint violation on '{changed[0]}'")
+            if matched:
+                owner = matched[0][0]  # checks its own keys in update()
+                for col in changed:
+                    if any(set_values[col] in part.keys[col] for part in self.partitions if part is not owner):
+                        raise owner._key_violation(col)
+        count = sum(part._update_rows(set_values, where, profile) for part in parts)
+        return f"Updated {count} rows in '{self.name}'."
+
+    def delete(self, where=None, profile=None):
+        count = sum(part._delete_rows(where, profile) for part in self._pruned(where, profile))
+        return f"Deleted {count} rows from '{self.name}'."
+
+    def create_index(self, column, kind="HASH"):
+        for part in self.partitions:
+            result = part.create_index(column, kind)
+        return result
+
+    # ----------------- READS -----------------
+    def select(self, columns=None, where=None, path=None, profile=None):
+        return list(self.scan(columns, where, path, profile=profile))
+
+    def scan(self, columns=None, where=None, path=None, limit=None, offset=0, profile=None):
+        # path is ignored, each partition chooses its own. Without a LIMIT, a
+        # filtered scan of a large table runs on worker processes; otherwise
+        # the partitions are read one after the other, lazily.
+        parts = self._pruned(where, profile)
+        total = sum(len(part) for part in parts)
+        if where and limit is None and workers_for(parts, total) > 1:
+            start = time.perf_counter()
+            results, processes = parallel_map(partial(_select_partition, columns, where), parts, total)
+            if profile is not None:
+                self._record_workers(profile, parts, processes, results, start)
+            rows = chain.from_iterable(rows for rows, _ in results)
+        else:
+            rows = chain.from_iterable(part.scan(columns, where, profile=profile) for part in parts)
+        rows = operators.limit(rows, limit, offset)
+        if profile is not None and (limit is not None or offset):
+            rows = profile.track(rows, "limit", f"LIMIT {limit} OFFSET {offset}")
+        return rows
+
+    def aggregate(self, where, items, group_by, aggregates, columns, profile=None):
+        # partial aggregates per partition, merged into the final groups
+        parts = self._pruned(where, profile)
+        total = sum(len(part) for part in parts)
+        start = time.perf_counter()
+        results, processes = parallel_map(partial(_aggregate_partition, where, group_by, aggregates, columns),
+                                          parts, total)
+        if profile is not None:
+            self._record_workers(profile, parts, processes, results, start)
+        return finish_groups(merge_groups(groups for groups, _ in results), items, group_by, aggregates)
+
+    def _record_workers(self, profile, parts, processes, results, start):
+        scanned = sum(count for _, count in results)
+        profile.scanned += scanned
+        detail = f"{len(parts)} partitions on {processes} process{'es' if processes > 1 else ''}"
+        profile.stage("scan", detail, scanned, time.perf_counter() - start if profile.timed else None)
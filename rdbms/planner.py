@@ -0,0 +1,124 @@
+# planner.py
+# Picks the access path for a single-table WHERE clause: a key map or secondary
+# index lookup for the most selective indexed condition of the top-level AND,
+# or a full scan. The other conditions become the residual, ordered so that
+# the cheap and selective ones are checked first. An ORDER BY on a column with
+# an ordered index can read the rows in index order instead of sorting them.
+from itertools import chain
+
+from .predicate import Compare, In, Between, conjuncts, conjoin, estimate_rows, order
+
+
+class AccessPath:
+    def __init__(self, kind, predicate=None, estimate=0, residual=None):
+        self.kind = kind  # "scan", "key" or "index"
+        self.predicate = predicate  # the condition answered by the key map or index
+        self.estimate = estimate
+        self.residual = residual  # predicates still to check on each fetched row
+
+    @property
+    def column(self):
+        return self.predicate.column if self.predicate is not None else None
+
+    def positions(self, table):
+        pred = self.predicate
+        if self.kind == "key":
+            keys = table.keys[pred.column]
+            if isinstance(pred, In):
+                return sorted({keys[v] for v in pred.values if v in keys})
+            pos = keys.get(pred.value)
+            return [] if pos is None else [pos]
+        if self.kind == "index":
+            idx = table.indexes[pred.column]
+            if isinstance(pred, In):
+                return sorted(set(chain.from_iterable(idx.lookup("=", v) for v in set(pred.values))))
+            if isinstance(pred, Between):
+                return idx.lookup("BETWEEN", (pred.low, pred.high))
+            return idx.lookup(pred.op, pred.value)
+        return None
+
+    def describe(self):
+        if self.kind == "scan":
+            return "full scan"
+        source = "key" if self.kind == "key" else "index"
+        return f"{source} {self.predicate.describe()} (~{self.estimate} rows)"
+
+    def __repr__(self):
+        if self.kind == "scan":
+            return "AccessPath(scan)"
+        return f"AccessPath({self.kind} {self.predicate.describe()}, ~{self.estimate} rows)"
+
+
+class IndexOrder(AccessPath):
+    # walks an ordered index, so the rows come out sorted by its column. NULLs
+    # are not in the index; they follow the other rows (precede them when
+    # descending) unless the predicate on the column excludes them.
+    def __init__(self, column, descending=False, predicate=None, estimate=0, residual=None):
+        AccessPath.__init__(self, "order", predicate, estimate, residual)
+        self.order_column = column
+        self.descending = descending
+
+    def positions(self, table):
+        # lazily, so a LIMIT stops reading the index early
+        idx = table.indexes[self.order_column]
+        pred = self.predicate
+        if isinstance(pred, Between):
+            return idx.ordered("BETWEEN", (pred.low, pred.high), self.descending)
+        if pred is not None:
+            return idx.ordered(pred.op, pred.value, self.descending)
+        positions = idx.ordered(descending=self.descending)
+        if len(idx) == table.store.live_count():
+            return positions
+        nulls = self._nulls(table)
+        return chain(nulls, positions) if self.descending else chain(positions, nulls)
+
+    def _nulls(self, table):
+        live = table.store.live_positions()
+        values = table.store.column_values(self.order_column, live)
+        yield from (pos for pos, value in zip(live, values) if value is None)
+
+    def describe(self):
+        source = f"index order on {self.order_column}{' DESC' if self.descending else ''}"
+        if self.predicate is not None:
+            source += f", {self.predicate.describe()}"
+        return f"{source} (~{self.estimate} rows)"
+
+    def __repr__(self):
+        return f"IndexOrder({self.describe()})"
+
+
+def describe_where(where):
+    return where.describe()
+
+
+def choose_access_path(table, where):
+    best = AccessPath("scan", estimate=len(table))
+    items = conjuncts(where)
+    for item in items:
+        if not isinstance(item, (Compare, In, Between)):
+            continue
+        estimate = estimate_rows(table, item)
+        if estimate is not None and estimate < best.estimate:
+            keyed = isinstance(item, In) or (isinstance(item, Compare) and item.op == "=")
+            kind = "key" if keyed and item.column in table.keys else "index"
+            best = AccessPath(kind, item, estimate)
+    best.residual = order(conjoin([item for item in items if item is not best.predicate]), table)
+    return best
+
+
+def choose_order_path(table, where, order_by):
+    # an IndexOrder for ORDER BY on one column with an ordered index, None when
+    # the rows have to be sorted. A key or index lookup on another condition
+    # fetches few rows, which are cheaper to sort than walking the index.
+    if len(order_by) != 1:
+        return None
+    column, descending = order_by[0]
+    idx = table.indexes.get(column)
+    if idx is None or idx.kind != "ORDERED":
+        return None
+    path = choose_access_path(table, where)
+    if path.kind == "scan":
+        return IndexOrder(column, descending, estimate=path.estimate, residual=path.residual)
+    if path.kind == "index" and path.column == column and not isinstance(path.predicate, In):
+        return IndexOrder(column, descending, path.predicate, path.estimate, path.residual)
+    return None
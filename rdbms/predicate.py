@@ -0,0 +1,360 @@
+# predicate.py
+# WHERE clauses as expression trees:
+#   Compare(col, op, value)   col = != > < >= <= value
+#   In(col, values)           col IN (v1, v2, ...)
+#   Between(col, low, high)   col BETWEEN low AND high
+#   IsNull(col)               col IS NULL
+#   Like(col, pattern)        col LIKE 'A%'  (% any text, _ one character)
+#   Not(item), And(items), Or(items)
+# The parser leaves Param placeholders in the tree; the executor replaces them
+# through map(). compiled() turns a tree into one generated Python function
+# over a row dict. The generated code only depends on the shape of the tree,
+# so it is built once per statement shape and reused with other literals.
+# As everywhere else, NULL equals only NULL and never satisfies an ordering
+# comparison.
+import re
+import threading
+from collections import OrderedDict
+
+FACTORY_CACHE_SIZE = 256  # generated functions kept, keyed by their source
+
+# share of rows assumed to pass a condition no key map or index can estimate
+DEFAULT_SELECTIVITY = {"=": 0.05, "!=": 0.95, ">": 0.3, "<": 0.3, ">=": 0.3, "<=": 0.3,
+                       "IN": 0.05, "BETWEEN": 0.25, "NULL": 0.05, "LIKE": 0.25}
+
+_factories = OrderedDict()
+_factories_lock = threading.Lock()
+
+
+class Predicate:
+    _compiled = None
+    _value_test = None
+
+    def compiled(self):
+        # function(row) -> bool, generated on first use
+        if self._compiled is None:
+            self._compiled = compile_predicate(self)
+        return self._compiled
+
+    def value_test(self):
+        # function(value) -> bool for a condition on one column
+        if self._value_test is None:
+            self._value_test = compile_predicate(self, "value")
+        return self._value_test
+
+    def __getstate__(self):
+        # generated functions are not pickled; a worker process generates its own
+        state = dict(self.__dict__)
+        state.pop("_compiled", None)
+        state.pop("_value_test", None)
+        return state
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.describe()})"
+
+
+# ----------------- CONDITIONS -----------------
+class Compare(Predicate):
+    def __init__(self, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def columns(self):
+        return [self.column]
+
+    def map(self, column=None, value=None):
+        return Compare(column(self.column) if column else self.column, self.op,
+                       value(self.value) if value else self.value)
+
+    def describe(self):
+        return f"{self.column} {self.op} {self.value!r}"
+
+    def source(self, ref, const):
+        val = ref(self.column)
+        if self.value is None:
+            return {"=": f"({val} is None)", "!=": f"({val} is not None)"}.get(self.op, "False")
+        if self.op in ("=", "!="):
+            return f"({val} {'==' if self.op == '=' else '!='} {const(self.value)})"
+        return f"((x := {val}) is not None and x {self.op} {const(self.value)})"
+
+
+class In(Predicate):
+    def __init__(self, column, values):
+        self.column = column
+        self.values = values
+
+    def columns(self):
+        return [self.column]
+
+    def map(self, column=None, value=None):
+        return In(column(self.column) if column else self.column,
+                  [value(v) for v in self.values] if value else self.values)
+
+    def describe(self):
+        return f"{self.column} IN ({', '.join(repr(v) for v in self.values)})"
+
+    def source(self, ref, const):
+        try:
+            values = frozenset(self.values)
+        except TypeError:
+            values = tuple(self.values)
+        return f"({ref(self.column)} in {const(values)})"
+
+
+class Between(Predicate):
+    def __init__(self, column, low, high):
+        self.column = column
+        self.low = low
+        self.high = high
+
+    def columns(self):
+        return [self.column]
+
+    def map(self, column=None, value=None):
+        return Between(column(self.column) if column else self.column,
+                       value(self.low) if value else self.low, value(self.high) if value else self.high)
+
+    def describe(self):
+        return f"{self.column} BETWEEN {self.low!r} AND {self.high!r}"
+
+    def source(self, ref, const):
+        if self.low is None or self.high is None:
+            return "False"
+        return f"((x := {ref(self.column)}) is not None and {const(self.low)} <= x <= {const(self.high)})"
+
+
+class IsNull(Predicate):
+    def __init__(self, column):
+        self.column = column
+
+    def columns(self):
+        return [self.column]
+
+    def map(self, column=None, value=None):
+        return IsNull(column(self.column) if column else self.column)
+
+    def describe(self):
+        return f"{self.column} IS NULL"
+
+    def source(self, ref, const):
+        return f"({ref(self.column)} is None)"
+
+
+class Like(Predicate):
+    def __init__(self, column, pattern):
+        self.column = column
+        self.pattern = pattern
+
+    def columns(self):
+        return [self.column]
+
+    def map(self, column=None, value=None):
+        return Like(column(self.column) if column else self.column, value(self.pattern) if value else self.pattern)
+
+    def describe(self):
+        return f"{self.column} LIKE {self.pattern!r}"
+
+    def shape(self):
+        # ("equal" | "prefix" | "suffix" | "contains", text), or ("regex", compiled pattern)
+        pattern = str(self.pattern)
+        inner = pattern.strip("%")
+        if "_" not in pattern and "%" not in inner:
+            starts, ends = pattern.startswith("%"), pattern.endswith("%") and len(pattern) > 1
+            if starts and ends:
+                return "contains", inner
+            if starts:
+                return "suffix", inner
+            return ("prefix" if ends else "equal"), inner
+        regex = "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern)
+        return "regex", re.compile(regex, re.DOTALL)
+
+    def source(self, ref, const):
+        if self.pattern is None:
+            return "False"
+        kind, arg = self.shape()
+        test = {"equal": "str(x) == {}", "prefix": "str(x).startswith({})", "suffix": "str(x).endswith({})",
+                "contains": "{} in str(x)", "regex": "{}.fullmatch(str(x)) is not None"}[kind]
+        return f"((x := {ref(self.column)}) is not None and {test.format(const(arg))})"
+
+
+# ----------------- CONNECTIVES -----------------
+class Not(Predicate):
+    def __init__(self, item):
+        self.item = item
+
+    def columns(self):
+        return self.item.columns()
+
+    def map(self, column=None, value=None):
+        return Not(self.item.map(column, value))
+
+    def describe(self):
+        if isinstance(self.item, IsNull):
+            return f"{self.item.column} IS NOT NULL"
+        if isinstance(self.item, (And, Or)):
+            return f"NOT ({self.item.describe()})"
+        return f"NOT {self.item.describe()}"
+
+    def source(self, ref, const):
+        return f"(not {self.item.source(ref, const)})"
+
+
+class Connective(Predicate):
+    word = None
+
+    def __init__(self, items):
+        self.items = items
+
+    def columns(self):
+        return list(dict.fromkeys(col for item in self.items for col in item.columns()))
+
+    def map(self, column=None, value=None):
+        return type(self)([item.map(column, value) for item in self.items])
+
+    def source(self, ref, const):
+        return "(" + f" {self.word} ".join(item.source(ref, const) for item in self.items) + ")"
+
+
+class And(Connective):
+    word = "and"
+
+    def describe(self):
+        return " AND ".join(f"({item.describe()})" if isinstance(item, Or) else item.describe()
+                            for item in self.items)
+
+
+class Or(Connective):
+    word = "or"
+
+    def describe(self):
+        return " OR ".join(item.describe() for item in self.items)
+
+
+def conjuncts(node):
+    # the conditions of a top-level AND (nested ANDs flattened)
+    if node is None:
+        return []
+    if isinstance(node, And):
+        return [c for item in node.items for c in conjuncts(item)]
+    return [node]
+
+
+def conjoin(items):
+    if not items:
+        return None
+    return items[0] if len(items) == 1 else And(items)
+
+
+# ----------------- COMPILATION -----------------
+def compile_predicate(node, arg="row"):
+    # arg "row": function(row dict) -> bool; arg "value": function(value) -> bool
+    # for a condition on one column. Literals are passed in as v0, v1, ...
+    consts = []
+
+    def const(value):
+        consts.append(value)
+        return f"v{len(consts) - 1}"
+
+    ref = (lambda col: f"row.get({col!r})") if arg == "row" else (lambda col: "value")
+    source = node.source(ref, const)
+    key = (arg, len(consts), source)
+    with _factories_lock:
+        factory = _factories.get(key)
+        if factory is not None:
+            _factories.move_to_end(key)
+    if factory is None:
+        unpack = "".join(f"    v{i} = v[{i}]\n" for i in range(len(consts)))
+        namespace = {}
+        exec(f"def factory(v):\n{unpack}    return lambda {arg}: {source}\n", namespace)
+        factory = namespace["factory"]
+        with _factories_lock:
+            _factories[key] = factory
+            if len(_factories) > FACTORY_CACHE_SIZE:
+                _factories.popitem(last=False)
+    return factory(consts)
+
+
+# ----------------- SELECTIVITY -----------------
+def estimate_rows(table, node):
+    # rows a key map or index lookup of one condition returns, None when no
+    # key map or index can answer it (or the literal is not comparable)
+    col = getattr(node, "column", None)
+    try:
+        if isinstance(node, Compare) and node.value is not None:
+            if node.op == "=" and col in table.keys:
+                return 1 if node.value in table.keys[col] else 0
+            idx = table.indexes.get(col)
+            if idx is not None and node.op in idx.ops:
+                return idx.estimate(node.op, node.value)
+        elif isinstance(node, In) and None not in node.values:
+            values = set(node.values)
+            if col in table.keys:
+                return sum(1 for v in values if v in table.keys[col])
+            idx = table.indexes.get(col)
+            if idx is not None:
+                return sum(idx.estimate("=", v) for v in values)
+        elif isinstance(node, Between) and node.low is not None and node.high is not None:
+            idx = table.indexes.get(col)
+            if idx is not None and "BETWEEN" in idx.ops:
+                return idx.estimate("BETWEEN", (node.low, node.high))
+    except TypeError:
+        pass
+    return None
+
+
+def selectivity(node, table=None):
+    # expected share of rows that satisfy node, from the key maps and indexes
+    # of table where they apply, from DEFAULT_SELECTIVITY otherwise
+    if isinstance(node, Or):
+        miss = 1.0
+        for item in node.items:
+            miss *= 1 - selectivity(item, table)
+        return 1 - miss
+    if isinstance(node, And):
+        share = 1.0
+        for item in node.items:
+            share *= selectivity(item, table)
+        return share
+    if isinstance(node, Not):
+        return 1 - selectivity(node.item, table)
+    if table is not None and len(table):
+        rows = estimate_rows(table, node)
+        if rows is not None:
+            return min(1.0, rows / len(table))
+    if isinstance(node, Compare):
+        return DEFAULT_SELECTIVITY[node.op]
+    if isinstance(node, In):
+        return min(1.0, DEFAULT_SELECTIVITY["IN"] * len(node.values))
+    if isinstance(node, Like):
+        return DEFAULT_SELECTIVITY["=" if node.pattern is not None and node.shape()[0] == "equal" else "LIKE"]
+    return DEFAULT_SELECTIVITY["BETWEEN" if isinstance(node, Between) else "NULL"]
+
+
+def cost(node):
+    # relative cost of evaluating node on one row
+    if isinstance(node, Connective):
+        return sum(cost(item) for item in node.items)
+    if isinstance(node, Not):
+        return cost(node.item)
+    if isinstance(node, Between):
+        return 1.5
+    if isinstance(node, Like):
+        return 4 if node.pattern is not None and node.shape()[0] == "regex" else 2
+    return 1
+
+
+def order(node, table=None):
+    # AND checks the conditions most likely to reject a row, per unit of cost,
+    # first; OR the ones most likely to accept it
+    if isinstance(node, Or):
+        items = [order(item, table) for item in node.items]
+        items.sort(key=lambda item: cost(item) / max(selectivity(item, table), 1e-9))
+        return Or(items)
+    if isinstance(node, And):
+        items = [order(item, table) for item in node.items]
+        items.sort(key=lambda item: cost(item) / max(1 - selectivity(item, table), 1e-9))
+        return And(items)
+    if isinstance(node, Not):
+        return Not(order(node.item, table))
+    return node
@@ -0,0 +1,158 @@
+# sort.py
+# ORDER BY. With a LIMIT only the first offset+limit rows are kept, in a
+# bounded heap. Otherwise the rows are sorted in memory as long as they fit in
+# the memory budget; beyond it, sorted runs are spilled to temporary files in
+# the data directory and merged. NULLs sort after every value (before them
+# with DESC).
+import heapq
+import pickle
+import tempfile
+from itertools import islice
+
+from .cache import result_size
+
+SORT_MEMORY_BYTES = 64 * 1024 * 1024  # rows held in memory before a sorted run is written to disk
+SAMPLE_ROWS = 100  # rows measured to estimate the memory one row takes, also the smallest run
+RUN_BATCH = 1024  # rows pickled together in a run file
+MERGE_WIDTH = 64  # run files merged at once; more are first merged into bigger runs
+
+
+class Descending:
+    # inverts a sort key, for DESC columns mixed with ASC ones
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def column_key(col):
+    return lambda row: ((v := row.get(col)) is None, v)
+
+
+def sort_key(order_by):
+    # (key function, reverse) ordering rows by [(column, descending), ...]
+    columns = [col for col, _ in order_by]
+    if len({desc for _, desc in order_by}) == 1:
+        if len(columns) == 1:
+            return column_key(columns[0]), order_by[0][1]
+        return (lambda row: tuple(((v := row.get(c)) is None, v) for c in columns)), order_by[0][1]
+
+    def key(row):
+        keys = []
+        for col, desc in order_by:
+            value = row.get(col)
+            keys.append(Descending((value is None, value)) if desc else (value is None, value))
+        return tuple(keys)
+    return key, False
+
+
+def describe_order(order_by):
+    return ", ".join(col + (" DESC" if desc else "") for col, desc in order_by)
+
+
+def _not_comparable(order_by):
+    return ValueError(f"Cannot compare the values in ORDER BY {describe_order(order_by)}")
+
+
+class Sorter:
+    def __init__(self, order_by, memory_bytes=SORT_MEMORY_BYTES, temp_dir=None):
+        self.order_by = order_by
+        self.key, self.reverse = sort_key(order_by)
+        self.mixed = len({desc for _, desc in order_by}) > 1  # ASC and DESC columns
+        self.memory_bytes = memory_bytes
+        self.temp_dir = temp_dir  # where runs are spilled, the system default when None
+        self.method = None
+        self.rows = 0  # rows returned
+        self.runs = 0  # sorted runs written to disk
+
+    def top(self, rows, count):
+        # the first count rows in order, holding at most count rows at a time
+        self.method = f"top-{count} heap"
+        select = heapq.nlargest if self.reverse else heapq.nsmallest
+        try:
+            rows = select(count, rows, key=self.key)
+        except TypeError:
+            raise _not_comparable(self.order_by)
+        self.rows = len(rows)
+        return rows
+
+    def sort(self, rows):
+        # an iterator over all rows in order
+        rows = iter(rows)
+        buffer = list(islice(rows, SAMPLE_ROWS))
+        capacity = SAMPLE_ROWS
+        if buffer:
+            capacity = max(SAMPLE_ROWS, self.memory_bytes * len(buffer) // result_size(buffer))
+        buffer.extend(islice(rows, capacity - len(buffer)))
+        runs = []
+        for row in rows:
+            # more rows than fit in memory: spill the ones held so far
+            self.rows += len(buffer)
+            runs.append(self._spill(self._sorted(buffer)))
+            if len(runs) == MERGE_WIDTH:
+                runs = [self._spill(self._merge(runs))]
+            buffer = [row]
+            buffer.extend(islice(rows, capacity - 1))
+        self.rows += len(buffer)
+        buffer = self._sorted(buffer)
+        if not runs:
+            self.method = "in-memory sort"
+            return iter(buffer)
+        self.method = f"external merge sort of {self.runs} runs"
+        return self._merge(runs + [iter(buffer)])
+
+    def describe(self):
+        return f"{self.method} by {describe_order(self.order_by)}"
+
+    def _sorted(self, rows):
+        try:
+            if self.mixed:
+                # one stable sort per column, last column first, is much
+                # cheaper than comparing through Descending
+                for col, desc in reversed(self.order_by):
+                    rows.sort(key=column_key(col), reverse=desc)
+            else:
+                rows.sort(key=self.key, reverse=self.reverse)
+        except TypeError:
+            raise _not_comparable(self.order_by)
+        return rows
+
+    def _merge(self, runs):
+        try:
+            yield from heapq.merge(*runs, key=self.key, reverse=self.reverse)
+        except TypeError:
+            raise _not_comparable(self.order_by)
+
+    def _spill(self, rows):
+        # write sorted rows to an unnamed temporary file, deleted once it is
+        # closed; returns an iterator reading them back
+        file = tempfile.TemporaryFile(prefix="sort-", dir=self.temp_dir)
+        try:
+            rows = iter(rows)
+            while True:
+                batch = list(islice(rows, RUN_BATCH))
+                if not batch:
+                    break
+                pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+            file.seek(0)
+        except Exception:
+            file.close()
+            raise
+        self.runs += 1
+        return _read_run(file)
+
+
+def _read_run(file):
+    with file:
+        while True:
+            try:
+                batch = pickle.load(file)
+            except EOFError:
+                return
+            yield from batch
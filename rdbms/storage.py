@@ -0,0 +1,454 @@
+# storage.py
+# Storage engines behind Table. Rows are addressed by their position (row id).
+# A deleted row stays in place as a tombstone (its position is in dead) until
+# compact() drops it, so deletes do not shift positions or copy the store.
+# Both engines keep their data in chunked containers: copy() shares the chunks
+# with the copy, and a write only copies the chunk it changes.
+#   RowStore    - one dict per row, the original layout
+#   ColumnStore - one typed buffer per column driven by the declared types:
+#                 array('q') for INT, array('d') for FLOAT, dictionary-encoded
+#                 TEXT (array of codes into a list of distinct strings) and a
+#                 null mask per column (one byte per row, 1 = NULL)
+import operator
+from array import array
+
+from .chunked import ChunkedSequence, ChunkedDict, ChunkedSet
+from .predicate import Compare, And, Or, Not
+
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1  # typed INT columns hold 64-bit integers
+
+OPS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+def match(value, op, val):
+    # NULL equals only NULL and never satisfies an ordering comparison
+    if value is None or val is None:
+        if op == "=":
+            return value is val
+        if op == "!=":
+            return value is not val
+        return False
+    return OPS[op](value, val)
+
+
+def coerce(columns, col, val):
+    # convert a value to the declared type of its column
+    if val is None:
+        return None
+    typ = columns[col]
+    try:
+        if typ == "INT":
+            if isinstance(val, float) and not val.is_integer():
+                raise ValueError
+            val = int(val)
+        elif typ == "FLOAT":
+            return float(val)
+        elif typ == "TEXT":
+            return str(val)
+        else:
+            return val
+    except (ValueError, OverflowError):
+        raise ValueError(f"Invalid {typ} value '{val}' for column '{col}'")
+    if not INT_MIN <= val <= INT_MAX:
+        raise ValueError(f"INT value '{val}' out of range for column '{col}'")
+    return val
+
+
+def normalize_row(columns, row):
+    # a row with every column, values converted to the declared types
+    for col in row:
+        if col not in columns:
+            raise ValueError(f"Column '{col}' does not exist")
+    return {col: coerce(columns, col, row.get(col)) for col in columns}
+
+
+def normalize_values(columns, values):
+    for col in values:
+        if col not in columns:
+            raise ValueError(f"Column '{col}' does not exist")
+    return {col: coerce(columns, col, val) for col, val in values.items()}
+
+
+def _not_comparable(where):
+    return ValueError(f"Cannot compare the values in WHERE {where.describe()}")
+
+
+class RowStore:
+    kind = "ROW"
+
+    def __init__(self, columns, typed=False):
+        self.columns = columns
+        self.typed = typed  # convert values to the declared column types
+        self.rows = ChunkedSequence([])
+        self.dead = ChunkedSet()  # tombstoned positions
+
+    def __len__(self):
+        # physical length, tombstones included
+        return len(self.rows)
+
+    def live_count(self):
+        return len(self.rows) - len(self.dead)
+
+    def live_positions(self):
+        if not self.dead:
+            return range(len(self.rows))
+        dead = set(self.dead)
+        return [pos for pos in range(len(self.rows)) if pos not in dead]
+
+    def normalize(self, row):
+        return normalize_row(self.columns, row) if self.typed else row
+
+    def normalize_values(self, values):
+        return normalize_values(self.columns, values) if self.typed else values
+
+    def append(self, row):
+        self.rows.append(row)
+
+    def extend(self, rows):
+        self.rows.extend(rows)
+
+    def get(self, pos, columns=None):
+        row = self.rows[pos]
+        if columns is None:
+            return row
+        return {col: row.get(col) for col in columns}
+
+    def value(self, pos, col):
+        return self.rows[pos].get(col)
+
+    def column(self, col):
+        # one value per position, None for tombstones
+        if self.dead:
+            dead = set(self.dead)
+            return [None if pos in dead else row.get(col) for pos, row in enumerate(self.rows)]
+        return [row.get(col) for row in self.rows]
+
+    def column_values(self, col, positions):
+        return [row.get(col) for row in self.rows.take(positions)]
+
+    # rows are replaced rather than changed in place, so a copy of the store
+    # keeps seeing the old versions
+    def update(self, pos, values):
+        self.rows[pos] = {**self.rows[pos], **values}
+
+    def replace(self, pos, row):
+        self.rows[pos] = dict(row)
+
+    def truncate(self, length):
+        self.rows.truncate(length)
+        self.dead = ChunkedSet(pos for pos in self.dead if pos < length)
+
+    def tombstone(self, positions):
+        self.dead.update(positions)
+
+    def revive(self, positions):
+        self.dead.difference_update(positions)
+
+    def delete(self, positions):
+        # drops rows and shifts the ones after them
+        dropped = set(positions)
+        self.rows = ChunkedSequence([], (row for i, row in enumerate(self.rows) if i not in dropped))
+
+    def compact(self):
+        if self.dead:
+            self.delete(self.dead)
+            self.dead = ChunkedSet()
+
+    def filter(self, where, positions=None):
+        # where is a predicate tree, checked by its generated function
+        test = where.compiled()
+        try:
+            if positions is None:
+                if self.dead:
+                    positions = self.live_positions()
+                else:
+                    return [pos for pos, row in enumerate(self.rows) if test(row)]
+            return [pos for pos, row in zip(positions, self.rows.take(positions)) if test(row)]
+        except TypeError:
+            raise _not_comparable(where)
+
+    def to_rows(self):
+        if self.dead:
+            dead = set(self.dead)
+            return [row for pos, row in enumerate(self.rows) if pos not in dead]
+        return list(self.rows)
+
+    def copy(self):
+        other = RowStore(self.columns, self.typed)
+        other.rows = self.rows.copy()
+        other.dead = self.dead.copy()
+        return other
+
+
+class ColumnStore:
+    kind = "COLUMN"
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.length = 0
+        self.data = {}  # col -> chunked array / list of values
+        self.nulls = {}  # col -> chunked bytearray null mask
+        self.dicts = {}  # TEXT col -> [distinct strings]
+        self.codes = {}  # TEXT col -> {string: code}
+        self.dead = ChunkedSet()  # tombstoned positions
+        for col, typ in columns.items():
+            if typ == "INT":
+                self.data[col] = ChunkedSequence(array("q"))
+            elif typ == "FLOAT":
+                self.data[col] = ChunkedSequence(array("d"))
+            elif typ == "TEXT":
+                self.data[col] = ChunkedSequence(array("l"))
+                self.dicts[col] = ChunkedSequence([])
+                self.codes[col] = ChunkedDict()
+            else:
+                self.data[col] = ChunkedSequence([])
+            self.nulls[col] = ChunkedSequence(bytearray())
+
+    def __len__(self):
+        # physical length, tombstones included
+        return self.length
+
+    def live_count(self):
+        return self.length - len(self.dead)
+
+    def live_positions(self):
+        if not self.dead:
+            return range(self.length)
+        dead = set(self.dead)
+        return [pos for pos in range(self.length) if pos not in dead]
+
+    # ----------------- ENCODING -----------------
+    def normalize(self, row):
+        return normalize_row(self.columns, row)
+
+    def normalize_values(self, values):
+        return normalize_values(self.columns, values)
+
+    def _encode(self, col, val):
+        if val is None:
+            return 0
+        if col in self.codes:
+            codes = self.codes[col]
+            code = codes.get(val)
+            if code is None:
+                code = codes[val] = len(self.dicts[col])
+                self.dicts[col].append(val)
+            return code
+        return val
+
+    def _encode_many(self, col, values):
+        if col not in self.codes:
+            return [0 if val is None else val for val in values]
+        codes, strings = self.codes[col], self.dicts[col]
+        known = {None: 0}  # codes looked up or added for this batch
+        added = []
+        encoded = []
+        for val in values:
+            code = known.get(val)
+            if code is None:
+                code = codes.get(val)
+                if code is None:
+                    code = len(strings) + len(added)
+                    added.append(val)
+                known[val] = code
+            encoded.append(code)
+        codes.update((val, code) for code, val in enumerate(added, len(strings)))
+        strings.extend(added)
+        return encoded
+
+    def _decode(self, col, raw):
+        return self.dicts[col][raw] if col in self.dicts else raw
+
+    # ----------------- ROW ACCESS -----------------
+    def append(self, row):
+        for col in self.columns:
+            val = row.get(col)
+            try:
+                self.data[col].append(self._encode(col, val))
+            except OverflowError:
+                raise ValueError(f"Value '{val}' out of range for column '{col}'")
+            self.nulls[col].append(val is None)
+        self.length += 1
+
+    def extend(self, rows):
+        # column by column, each in one go
+        rows = list(rows)
+        for col in self.columns:
+            values = [row.get(col) for row in rows]
+            try:
+                self.data[col].extend(self._encode_many(col, values))
+            except OverflowError:
+                raise ValueError(f"Value out of range for column '{col}'")
+            self.nulls[col].extend([val is None for val in values])
+        self.length += len(rows)
+
+    def value(self, pos, col):
+        if self.nulls[col][pos]:
+            return None
+        return self._decode(col, self.data[col][pos])
+
+    def get(self, pos, columns=None):
+        return {col: self.value(pos, col) for col in (columns or self.columns)}
+
+    def column(self, col):
+        # one value per position, None for tombstones
+        data, nulls = self.data[col], self.nulls[col]
+        if col in self.dicts:
+            data = self._strings(col, data)
+        if not any(nulls):
+            values = list(data)
+        else:
+            values = [None if n else v for v, n in zip(data, nulls)]
+        for pos in self.dead:
+            values[pos] = None
+        return values
+
+    def column_values(self, col, positions):
+        # values of one column for a batch of positions; a contiguous run of a
+        # numeric column without NULLs is returned as an array slice
+        if col not in self.columns:
+            return [None] * len(positions)
+        data, nulls = self.data[col].take(positions), self.nulls[col].take(positions)
+        if col in self.dicts:
+            data = self._strings(col, data)
+        elif isinstance(data, array) and 1 not in nulls:
+            return data
+        return [None if n else v for v, n in zip(data, nulls)]
+
+    def _strings(self, col, codes):
+        # decoded TEXT values; NULLs are stored as code 0, which an all-NULL column has no string for
+        strings = self.dicts[col]
+        if not len(strings):
+            return [None] * len(codes)
+        return strings.take(codes)
+
+    def update(self, pos, values):
+        old = {col: (self.data[col][pos], self.nulls[col][pos]) for col in values}
+        try:
+            for col, val in values.items():
+                self.data[col][pos] = self._encode(col, val)
+                self.nulls[col][pos] = val is None
+        except OverflowError:
+            # put back the columns already changed, so the row stays whole
+            for col, (raw, null) in old.items():
+                self.data[col][pos] = raw
+                self.nulls[col][pos] = null
+            raise ValueError(f"Value '{val}' out of range for column '{col}'")
+
+    def replace(self, pos, row):
+        self.update(pos, {col: row.get(col) for col in self.columns})
+
+    def truncate(self, length):
+        for col in self.columns:
+            self.data[col].truncate(length)
+            self.nulls[col].truncate(length)
+        self.length = min(self.length, length)
+        self.dead = ChunkedSet(pos for pos in self.dead if pos < length)
+
+    def tombstone(self, positions):
+        self.dead.update(positions)
+
+    def revive(self, positions):
+        self.dead.difference_update(positions)
+
+    def compact(self):
+        if self.dead:
+            self.delete(self.dead)
+            self.dead = ChunkedSet()
+
+    def delete(self, positions):
+        # drops rows and shifts the ones after them
+        dropped = set(positions)
+        keep = [i for i in range(self.length) if i not in dropped]
+        for col in self.columns:
+            data, nulls = self.data[col], self.nulls[col]
+            self.data[col] = ChunkedSequence(data.empty, data.take(keep))
+            self.nulls[col] = ChunkedSequence(nulls.empty, nulls.take(keep))
+        self.length = len(keep)
+
+    # ----------------- SCANS -----------------
+    def filter(self, where, positions=None):
+        # evaluate one condition at a time over a whole column, narrowing the
+        # positions in the order the planner put the conditions in
+        positions = self.live_positions() if positions is None else positions
+        return list(self._select(where, positions))
+
+    def _select(self, node, positions):
+        if isinstance(node, And):
+            for item in node.items:
+                if not len(positions):
+                    break
+                positions = self._select(item, positions)
+            return positions
+        if isinstance(node, Or):
+            hits = set()
+            rest = positions
+            for item in node.items:
+                hits.update(self._select(item, rest))
+                rest = [i for i in rest if i not in hits]
+                if not rest:
+                    break
+            return [i for i in positions if i in hits]
+        if isinstance(node, Not):
+            hits = set(self._select(node.item, positions))
+            return [i for i in positions if i not in hits]
+        col = node.column
+        if col not in self.columns:
+            # unknown columns are always NULL
+            return positions if node.value_test()(None) else []
+        if isinstance(node, Compare):
+            return self._filter_column(col, node.op, node.value, positions)
+        test = node.value_test()
+        data, nulls = self.data[col].take(positions), self.nulls[col].take(positions)
+        try:
+            if col in self.dicts:
+                # test every distinct string once, then compare codes
+                codes = {code for code, string in enumerate(self.dicts[col]) if test(string)}
+                keep_nulls = test(None)
+                return [i for i, c, n in zip(positions, data, nulls) if (keep_nulls if n else c in codes)]
+            return [i for i, v, n in zip(positions, data, nulls) if test(None if n else v)]
+        except TypeError:
+            raise _not_comparable(node)
+
+    def _filter_column(self, col, op, val, candidates):
+        if val is None or op not in OPS:
+            return [i for i in candidates if match(self.value(i, col), op, val)]
+        data, nulls = self.data[col].take(candidates), self.nulls[col].take(candidates)
+        keep_nulls = op == "!="
+        if col in self.codes and op in ("=", "!="):
+            # compare dictionary codes instead of strings
+            code = self.codes[col].get(val, -1)
+            if op == "=":
+                return [i for i, c, n in zip(candidates, data, nulls) if c == code and not n]
+            return [i for i, c, n in zip(candidates, data, nulls) if n or c != code]
+        compare = OPS[op]
+        if col in self.dicts:
+            data = self._strings(col, data)
+        try:
+            return [i for i, v, n in zip(candidates, data, nulls) if (keep_nulls if n else compare(v, val))]
+        except TypeError:
+            raise ValueError(f"Cannot compare {self.columns[col]} column '{col}' with {val!r}")
+
+    def to_rows(self):
+        return [self.get(pos) for pos in self.live_positions()]
+
+    def copy(self):
+        other = ColumnStore.__new__(ColumnStore)
+        other.columns = self.columns
+        other.length = self.length
+        other.data = {col: data.copy() for col, data in self.data.items()}
+        other.nulls = {col: nulls.copy() for col, nulls in self.nulls.items()}
+        other.dicts = {col: strings.copy() for col, strings in self.dicts.items()}
+        other.codes = {col: codes.copy() for col, codes in self.codes.items()}
+        other.dead = self.dead.copy()
+        return other
+
+
+STORAGE_ENGINES = {"ROW": RowStore, "COLUMN": ColumnStore}
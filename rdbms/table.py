@@ -1,101 +1,583 @@
 # table.py
+import copy
+import itertools
 import json
 import os
+import threading
+import time
+
+from .chunked import ChunkedDict
+from .index import INDEX_TYPES
+from .planner import choose_access_path, describe_where
+from . import operators
+from .storage import STORAGE_ENGINES, RowStore
+from .pagefile import PageFile, write_pages
+from .locks import RWLock
 
 DATA_DIR = "data"
+# the base file is rewritten once the log outgrows this share of it, so a
+# checkpoint costs about as much as the writes it folds in
+CHECKPOINT_RATIO = 0.5
+CHECKPOINT_MIN_BYTES = 1024 * 1024  # a smaller log is left to grow whatever the table size
+COMPACT_RATIO = 0.25  # share of tombstoned rows that triggers a compaction
+FILE_FORMATS = {"JSON": ".json", "PAGED": ".pages"}
+VERSIONS = itertools.count(1)  # shared by all tables, so a re-created table never reuses a version
 
 class Table:
-    def __init__(self, name, columns, primary_key=None, unique=None):
+    def __init__(self, name, columns, primary_key=None, unique=None, storage="ROW", file_format="JSON"):
+        if storage not in STORAGE_ENGINES:
+            raise ValueError(f"Unknown storage engine '{storage}'")
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"Unknown file format '{file_format}'")
         self.name = name
         self.columns = columns  # {'col_name': 'type'}
         self.primary_key = primary_key
         self.unique = unique or []
-        self.rows = []
-        self.indexes = {}  # column_name -> {value: row}
+        self.storage = storage
+        self.file_format = file_format
+        self._store = self._new_store()
+        self._indexes = {}  # column_name -> HashIndex / OrderedIndex
+        self._keys = {}  # primary key / unique column -> {value: position}
+        self._pages = None  # PageFile whose rows have not been decoded yet
+        self._log = None
+        self._log_bytes = 0
+        self._base_bytes = 0  # size of the base file the log applies to
+        self._txn = None  # (buffered log records, undo records) while a transaction is open
+        self.version = next(VERSIONS)  # changes with every write, for the result cache
+        self.io_stats = {"log_writes": 0, "log_bytes": 0, "log_seconds": 0.0,
+                         "checkpoints": 0, "checkpoint_bytes": 0, "checkpoint_seconds": 0.0}
+        self.lock = RWLock()  # shared while a snapshot is taken, exclusive for writes
+        self._snapshot_mutex = threading.Lock()
+        self._generation = 0  # bumped whenever writers stop sharing the store with snapshots
+        self._shared = 0  # snapshots still sharing the current store, keys and indexes
+        self._origin = None  # the live table, on a snapshot
+        self._pinned = False
         self.load()
 
     @property
     def file_path(self):
-        return os.path.join(DATA_DIR, f"{self.name}.json")
+        return os.path.join(DATA_DIR, self.name + FILE_FORMATS[self.file_format])
+
+    # A paged table only maps its file in load(); the rows are decoded the
+    # first time the store, keys or indexes are needed.
+    @property
+    def store(self):
+        if self._pages is not None:
+            self._materialize()
+        return self._store
+
+    @property
+    def keys(self):
+        if self._pages is not None:
+            self._materialize()
+        return self._keys
+
+    @property
+    def indexes(self):
+        if self._pages is not None:
+            self._materialize()
+        return self._indexes
+
+    def _new_store(self):
+        # rows written to a paged file must match the declared column types
+        if self.storage == "ROW":
+            return RowStore(self.columns, typed=self.file_format == "PAGED")
+        return STORAGE_ENGINES[self.storage](self.columns)
+
+    @property
+    def log_path(self):
+        return os.path.join(DATA_DIR, f"{self.name}.log")
+
+    @property
+    def old_log_path(self):
+        # the log a checkpoint has folded into the new base file, until it is in place
+        return self.log_path + ".old"
+
+    @property
+    def rows(self):
+        # every row as a dict; column-stored tables build them on each access
+        return self.store.to_rows()
+
+    def __len__(self):
+        if self._pages is not None and not os.path.exists(self.log_path):
+            return self._pages.row_count
+        return self.store.live_count()
+
+    def row(self, pos, columns=None):
+        return self.store.get(pos, columns)
 
     def load(self):
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR)
+        self._recover_checkpoint()
+        self._base_bytes = os.path.getsize(self.file_path) if os.path.exists(self.file_path) else 0
+        self._store = self._new_store()
+        if self._pages is not None:
+            self._pages.close()
+            self._pages = None
+        if self.file_format == "PAGED" and os.path.exists(self.file_path):
+            self._pages = PageFile(self.file_path)
+            return
         if os.path.exists(self.file_path):
             with open(self.file_path, "r") as f:
-                self.rows = json.load(f)
-        else:
-            self.rows = []
+                self._store.extend(self._store.normalize(row) for row in json.load(f))
+        self._finish_load()
+
+    def _materialize(self):
+        if self._origin is not None:
+            # a snapshot taken before the rows were decoded reads them through its table
+            self.__dict__.update(self._origin.snapshot(decoded=True).__dict__)
+            return
+        pages, self._pages = self._pages, None
+        for number in range(pages.page_count):
+            self._store.extend(pages.page(number))
+        pages.close()
+        self._finish_load()
+
+    def _finish_load(self):
+        self._replay_log()
+        self._build_keys()
+        for idx in self._indexes.values():
+            idx.build(self._store.column(idx.column))
+        if self._log_full():
+            self.checkpoint()
 
     def save(self):
-        with open(self.file_path, "w") as f:
-            json.dump(self.rows, f, indent=2)
+        self.checkpoint()
+
+    # ----------------- WRITE-AHEAD LOG -----------------
+    # The base JSON file is only rewritten at checkpoints; in between, every
+    # mutation appends one change record to <name>.log, which load() replays.
+    def _replay_log(self):
+        self._log_bytes = 0
+        if not os.path.exists(self.log_path):
+            return
+        good_offset = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn write from a crash, drop the tail
+                self._apply(record)
+                good_offset += len(line)
+        if good_offset < os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(good_offset)
+        self._log_bytes = good_offset
+
+    def _apply(self, record):
+        op = record["op"]
+        if op == "insert":
+            self.store.append(record["row"])
+        elif op == "insert_many":
+            self.store.extend(record["rows"])
+        elif op == "update":
+            for pos in record["positions"]:
+                self.store.update(pos, record["values"])
+        elif op == "tombstone":
+            self.store.tombstone(record["positions"])
+        elif op == "delete":
+            self.store.delete(record["positions"])  # logs written before deletes left tombstones
+        else:
+            raise ValueError(f"Unknown log record '{op}' in '{self.log_path}'")
+
+    def _append_log(self, record, undo):
+        # inside a transaction the record is held back until commit()
+        if self._txn is not None:
+            self._txn[0].append(record)
+            self._txn[1].append(undo)
+            return
+        self._write_log([record])
+
+    def _write_log(self, records):
+        start = time.perf_counter()
+        if self._log is None:
+            self._log = open(self.log_path, "a")
+        data = "".join(json.dumps(record) + "\n" for record in records)
+        self._log.write(data)
+        self._log.flush()
+        self._log_bytes += len(data)  # records are ASCII: json.dumps escapes the rest
+        self.io_stats["log_writes"] += 1
+        self.io_stats["log_bytes"] += len(data)
+        self.io_stats["log_seconds"] += time.perf_counter() - start
+        if self._log_full():
+            self.checkpoint()
+
+    def _log_full(self):
+        return self._log_bytes > max(CHECKPOINT_MIN_BYTES, self._base_bytes * CHECKPOINT_RATIO)
+
+    def checkpoint(self):
+        # the base file only holds committed rows, and no tombstones: positions
+        # in the log that follows refer to the compacted table
+        if self._txn is not None:
+            return
+        start = time.perf_counter()
+        if self.store.dead:
+            self._compact()
+        tmp_path = self.file_path + ".tmp"
+        if self.file_format == "PAGED":
+            write_pages(tmp_path, self.columns, self.store.to_rows())
+        else:
+            with open(tmp_path, "w") as f:
+                json.dump(self.store.to_rows(), f)
+        size = os.path.getsize(tmp_path)
+        # the log is set aside before the base file is replaced, and only
+        # deleted after: a crash at any step leaves either the old base file
+        # with its log, or the new one (see _recover_checkpoint)
+        self.close()
+        if os.path.exists(self.log_path):
+            os.replace(self.log_path, self.old_log_path)
+        try:
+            os.replace(tmp_path, self.file_path)
+        except OSError:
+            if os.path.exists(self.old_log_path):
+                os.replace(self.old_log_path, self.log_path)
+            raise
+        if os.path.exists(self.old_log_path):
+            os.remove(self.old_log_path)
+        self._log_bytes = 0
+        self._base_bytes = size
+        self.io_stats["checkpoints"] += 1
+        self.io_stats["checkpoint_bytes"] += size
+        self.io_stats["checkpoint_seconds"] += time.perf_counter() - start
+
+    def _recover_checkpoint(self):
+        # finish or undo a checkpoint a crash interrupted
+        tmp_path = self.file_path + ".tmp"
+        if os.path.exists(self.old_log_path):
+            if os.path.exists(tmp_path):
+                os.replace(self.old_log_path, self.log_path)  # the base file was not replaced yet
+            else:
+                os.remove(self.old_log_path)  # the new base file already holds these changes
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def _compact(self):
+        # drop tombstoned rows; positions shift, so keys and indexes are rebuilt
+        self.store.compact()
+        self._build_keys()
+        self._rebuild_indexes()
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    # ----------------- SNAPSHOTS -----------------
+    # SELECTs read a snapshot: a shallow copy of the table sharing its store,
+    # keys and indexes. A writer copies them first while any snapshot still
+    # shares them, so readers neither wait for writers nor see their changes.
+    # The copies share their chunks, and each write then copies only the
+    # chunks it changes.
+    def snapshot(self, decoded=False):
+        origin = self._origin
+        if origin is not None and self._pinned:
+            # a snapshot of a snapshot shares its rows, and holds them too as
+            # long as they are still the live table's
+            snap = copy.copy(self)
+            with origin._snapshot_mutex:
+                snap._pinned = self._generation == origin._generation
+                if snap._pinned:
+                    origin._shared += 1
+            return snap
+        if self._pages is not None:
+            if not decoded:
+                snap = copy.copy(self)  # COUNT(*) can still come from the page header
+                snap._origin = self
+                return snap
+            with self.lock.write():
+                self.store
+        with self.lock.read():
+            with self._snapshot_mutex:
+                self._shared += 1
+            snap = copy.copy(self)
+        snap._origin, snap._pinned = self, True
+        return snap
+
+    def __copy__(self):
+        # a snapshot shares everything with its table, locks included
+        snap = Table.__new__(Table)
+        snap.__dict__.update(self.__dict__)
+        return snap
+
+    # A decoded snapshot is pickled for the worker processes of parallel.py:
+    # without its files, locks or live table, and holding nothing there.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_log=None, _txn=None, _origin=None, _pinned=False, lock=None, _snapshot_mutex=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = RWLock()
+        self._snapshot_mutex = threading.Lock()
+
+    def release(self):
+        origin = self._origin
+        if origin is None or not self._pinned:
+            return
+        self._pinned = False
+        with origin._snapshot_mutex:
+            if self._generation == origin._generation and origin._shared:
+                origin._shared -= 1
+
+    def _before_write(self):
+        # called by writers, holding the write lock, before they change anything
+        self.version = next(VERSIONS)
+        with self._snapshot_mutex:
+            if not self._shared:
+                return
+            self._shared = 0
+            self._generation += 1
+        self._store = self._store.copy()
+        self._keys = {col: keys.copy() for col, keys in self._keys.items()}
+        self._indexes = {col: idx.copy() for col, idx in self._indexes.items()}
+
+    # ----------------- TRANSACTIONS -----------------
+    def begin(self):
+        if self._txn is None:
+            self._txn = ([], [])
+
+    def commit(self):
+        if self._txn is None:
+            return
+        records, _ = self._txn
+        self._txn = None
+        if records:
+            self._write_log(records)
+
+    def rollback(self):
+        if self._txn is None:
+            return
+        _, undo = self._txn
+        self._txn = None
+        self._before_write()
+        for op, data in reversed(undo):
+            if op == "truncate":
+                self.store.truncate(data)
+            elif op == "update":
+                for pos, old in data:
+                    self.store.replace(pos, old)
+            elif op == "revive":
+                self.store.revive(data)
+        self._build_keys()
+        self._rebuild_indexes()
+
+    # ----------------- KEY CONSTRAINTS -----------------
+    def _key_columns(self):
+        cols = [self.primary_key] if self.primary_key else []
+        return cols + [col for col in self.unique if col != self.primary_key]
+
+    def _build_keys(self):
+        self._keys = {}
+        for col in self._key_columns():
+            self._keys[col] = ChunkedDict((val, pos) for pos, val in enumerate(self.store.column(col))
+                                          if val is not None)
+
+    def _add_keys(self, row, pos):
+        for col, keys in self.keys.items():
+            val = row.get(col)
+            if val is not None:
+                keys[val] = pos
+
+    def _check_keys(self, row, pos=None):
+        # pos is the row's own position when it is being updated in place
+        for col, keys in self.keys.items():
+            val = row.get(col)
+            if val is None:
+                if col == self.primary_key:
+                    raise ValueError(f"Primary key '{col}' cannot be NULL")
+                continue
+            if keys.get(val, pos) != pos:
+                raise self._key_violation(col)
+
+    def _check_keys_many(self, rows):
+        for col, keys in self.keys.items():
+            seen = set()
+            for row in rows:
+                val = row.get(col)
+                if val is None:
+                    if col == self.primary_key:
+                        raise ValueError(f"Primary key '{col}' cannot be NULL")
+                    continue
+                if val in keys or val in seen:
+                    raise self._key_violation(col)
+                seen.add(val)
+
+    def _key_violation(self, col):
+        if col == self.primary_key:
+            return ValueError("Primary key violation")
+        return ValueError(f"Unique constraint violation on '{col}'")
 
     def insert(self, row):
-        # Check primary key
-        if self.primary_key and any(r[self.primary_key] == row[self.primary_key] for r in self.rows):
-            raise ValueError("Primary key violation")
-        # Check unique constraints
-        for col in self.unique:
-            if any(r[col] == row[col] for r in self.rows):
-                raise ValueError(f"Unique constraint violation on '{col}'")
-        self.rows.append(row)
-        self.update_indexes(row)
-        self.save()
+        self._before_write()
+        row = self.store.normalize(row)
+        self._check_keys(row)
+        self._check_indexes([row])
+        pos = len(self.store)
+        self.store.append(row)
+        self._add_keys(row, pos)
+        self.update_indexes(row, pos)
+        self._append_log({"op": "insert", "row": row}, ("truncate", pos))
         return f"Row inserted into '{self.name}'."
 
-    def update_indexes(self, row):
+    def insert_many(self, rows):
+        self._before_write()
+        rows = [self.store.normalize(row) for row in rows]
+        self._check_keys_many(rows)
+        self._check_indexes(rows)
+        start = len(self.store)
+        self.store.extend(rows)
+        for col, keys in self.keys.items():
+            keys.update((row.get(col), pos) for pos, row in enumerate(rows, start) if row.get(col) is not None)
         for col, idx in self.indexes.items():
-            idx[row[col]] = row
+            idx.add_many((row.get(col), pos) for pos, row in enumerate(rows, start))
+        if self._txn is None and rows and len(rows) > start * CHECKPOINT_RATIO:
+            # the batch would fill the log anyway: one rewrite is cheaper than logging it first
+            self.checkpoint()
+        elif rows:
+            self._append_log({"op": "insert_many", "rows": rows}, ("truncate", start))
+        return f"{len(rows)} rows inserted into '{self.name}'."
 
-    def create_index(self, column):
+    def _check_indexes(self, rows):
+        for col, idx in self.indexes.items():
+            idx.check(row.get(col) for row in rows)
+
+    def update_indexes(self, row, pos):
+        for col, idx in self.indexes.items():
+            idx.add(row.get(col), pos)
+
+    def _rebuild_indexes(self):
+        for col, idx in self.indexes.items():
+            idx.build(self.store.column(col))
+
+    def create_index(self, column, kind="HASH"):
         if column not in self.columns:
             raise ValueError(f"Column '{column}' does not exist")
-        idx = {}
-        for row in self.rows:
-            idx[row[column]] = row
-        self.indexes[column] = idx
-        return f"Index on '{column}' created."
-
-    def select(self, columns=None, where=None):
-        result = self.rows
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{kind}'")
+        idx = INDEX_TYPES[kind](column)
+        self._before_write()
+        if self._pages is None:
+            idx.build(self.store.column(column))
+        self._indexes[column] = idx  # a paged table builds it once its rows are decoded
+        return f"{kind.capitalize()} index on '{column}' created."
+
+    def index_definitions(self):
+        return {col: idx.kind for col, idx in self._indexes.items()}
+
+    def select(self, columns=None, where=None, path=None, profile=None):
+        return list(self.scan(columns, where, path, profile=profile))
+
+    def scan(self, columns=None, where=None, path=None, limit=None, offset=0, profile=None):
+        # lazily yields the matching rows, stopping once limit rows were produced
+        if columns == ["*"]:
+            columns = None
         if where:
-            result = [row for row in result if self._match_where(row, where)]
-        if columns is None or columns == ["*"]:
-            return result
-        return [{col: row[col] for col in columns} for row in result]
+            path = path or choose_access_path(self, where)
+        batches = operators.scan(self, path)
+        if profile is not None:
+            batches = profile.scan(batches, f"{self.name} by {path.describe() if path else 'full scan'}")
+        residual = path.residual if path else None
+        positions = operators.filter_positions(self, batches, residual)
+        if profile is not None and residual:
+            positions = profile.track(positions, "filter", describe_where(residual))
+        positions = operators.limit(positions, limit, offset)
+        if profile is not None and (limit is not None or offset):
+            positions = profile.track(positions, "limit", f"LIMIT {limit} OFFSET {offset}")
+        rows = operators.project(self, positions, columns)
+        if profile is not None:
+            rows = profile.track(rows, "project", ", ".join(columns or self.columns))
+        return rows
+
+    def _filter(self, path):
+        # positions fetched through the access path that satisfy its residual predicates
+        positions = path.positions(self)
+        if not path.residual:
+            return self.store.live_positions() if positions is None else positions
+        return self.store.filter(path.residual, positions)
+
+    def _matching_positions(self, where, profile=None):
+        if not where and profile is None:
+            return list(self.store.live_positions())
+        start = time.perf_counter()
+        path = choose_access_path(self, where)
+        positions = list(self._filter(path))
+        if profile is not None:
+            # key and index estimates are exact, so they are the rows read
+            seconds = time.perf_counter() - start if profile.timed else None
+            profile.stage("scan", f"{self.name} by {path.describe()}", path.estimate, seconds)
+            if path.residual:
+                profile.stage("filter", describe_where(path.residual), len(positions), seconds)
+            profile.scanned += path.estimate
+        return positions
 
     def _match_where(self, row, where):
-        # where is a dict of column -> (operator, value)
-        for col, (op, val) in where.items():
-            if op == "=" and row.get(col) != val:
-                return False
-            if op == "!=" and row.get(col) == val:
-                return False
-            if op == ">" and row.get(col) <= val:
-                return False
-            if op == "<" and row.get(col) >= val:
-                return False
-            if op == ">=" and row.get(col) < val:
-                return False
-            if op == "<=" and row.get(col) > val:
-                return False
-        return True
-
-    def update(self, set_values, where=None):
-        count = 0
-        for row in self.rows:
-            if not where or self._match_where(row, where):
-                for col, val in set_values.items():
-                    row[col] = val
-                count += 1
-        self.save()
-        return f"Updated {count} rows in '{self.name}'."
-
-    def delete(self, where=None):
-        original_len = len(self.rows)
-        self.rows = [row for row in self.rows if not (where and self._match_where(row, where))]
-        deleted_count = original_len - len(self.rows)
-        self.save()
-        return f"Deleted {deleted_count} rows from '{self.name}'."
+        return where.compiled()(row)
+
+    def update(self, set_values, where=None, profile=None):
+        return f"Updated {self._update_rows(set_values, where, profile)} rows in '{self.name}'."
+
+    def _update_rows(self, set_values, where=None, profile=None):
+        start = time.perf_counter()
+        self._before_write()
+        set_values = self.store.normalize_values(set_values)
+        positions = self._matching_positions(where, profile)
+        changed_keys = [col for col in self.keys if col in set_values]
+        if changed_keys and positions:
+            if len(positions) > 1 and any(set_values[col] is not None for col in changed_keys):
+                raise ValueError(f"Unique constraint violation on '{changed_keys[0]}'")
+            self._check_keys({**self.store.get(positions[0]), **set_values}, positions[0])
+        changed_indexes = [idx for col, idx in self.indexes.items() if col in set_values]
+        if positions:
+            self._check_indexes([set_values])
+        undo = [(pos, dict(self.store.get(pos))) for pos in positions] if self._txn is not None else None
+        watched = changed_keys + [idx.column for idx in changed_indexes]
+        for pos in positions:
+            # the row changes first: if the store rejects a value, keys and
+            # indexes still describe it
+            old = self.store.get(pos, watched) if watched else None
+            self.store.update(pos, set_values)
+            for col in changed_keys:
+                self.keys[col].pop(old[col], None)
+                if set_values[col] is not None:
+                    self.keys[col][set_values[col]] = pos
+            for idx in changed_indexes:
+                idx.remove(old[idx.column], pos)
+                idx.add(set_values[idx.column], pos)
+        if positions:
+            self._append_log({"op": "update", "positions": positions, "values": set_values}, ("update", undo))
+        if profile is not None:
+            profile.written += len(positions)
+            profile.stage("update", ", ".join(set_values), len(positions),
+                          time.perf_counter() - start if profile.timed else None)
+        return len(positions)
+
+    def delete(self, where=None, profile=None):
+        return f"Deleted {self._delete_rows(where, profile)} rows from '{self.name}'."
 
+    def _delete_rows(self, where=None, profile=None):
+        start = time.perf_counter()
+        self._before_write()
+        positions = self._matching_positions(where, profile)
+        if positions:
+            dead = len(self.store.dead) + len(positions)
+            compact = self._txn is None and dead > len(self.store) * COMPACT_RATIO
+            if not compact:
+                # take the rows out of the keys and indexes; compaction rebuilds them instead
+                for pos in positions:
+                    for col, keys in self.keys.items():
+                        val = self.store.value(pos, col)
+                        if val is not None and keys.get(val) == pos:
+                            del keys[val]
+                    for col, idx in self.indexes.items():
+                        idx.remove(self.store.value(pos, col), pos)
+            self.store.tombstone(positions)
+            self._append_log({"op": "tombstone", "positions": positions}, ("revive", positions))
+            if compact and self.store.dead:
+                self.checkpoint()
+        if profile is not None:
+            profile.written += len(positions)
+            profile.stage("delete", self.name, len(positions), time.perf_counter() - start if profile.timed else None)
+        return len(positions)
@@ -1,16 +1,24 @@
 from rdbms.executor import Executor
 
-# Initialize executor
+# Initialize executor, and the session BEGIN ... COMMIT runs in
 executor = Executor()
+session = executor.session()
 
 HELP_TEXT = """
 MiniRDBMS REPL Commands:
 
-CREATE TABLE table_name column1:type1 column2:type2 [PRIMARY_KEY=column] [UNIQUE=col1,col2]
+CREATE TABLE table_name column1:type1 column2:type2 [PRIMARY_KEY=column] [UNIQUE=col1,col2] [STORAGE=ROW|COLUMN] [FORMAT=JSON|PAGED] [PARTITION=HASH(col,n)|RANGE(col,b1,b2,...)]
+CREATE INDEX ON table_name(column) [USING HASH|ORDERED]
 INSERT table_name col1=val1 col2=val2 ...
-SELECT * FROM table_name [WHERE column=value | column>value]
+SELECT * FROM table_name [WHERE column=value | column>value] [ORDER BY col [ASC|DESC], ...] [LIMIT n] [OFFSET m]
+  WHERE conditions: col<op>value, col [NOT] IN (v1, v2), col [NOT] BETWEEN a AND b, col IS [NOT] NULL,
+                    col [NOT] LIKE 'A%', combined with AND, OR, NOT and parentheses
+SELECT col, COUNT(*), SUM(col), AVG(col), MIN(col), MAX(col) FROM table_name [WHERE ...] [GROUP BY col] [ORDER BY COUNT(*) DESC]
 UPDATE table_name SET col=val WHERE column=value
 DELETE FROM table_name WHERE column=value
+COPY table_name FROM 'file.csv' | 'file.jsonl'
+BEGIN | COMMIT | ROLLBACK
+EXPLAIN [ANALYZE] SELECT ... | UPDATE ... | DELETE ...
 EXIT
 HELP
 """
@@ -30,12 +38,15 @@ def main():
             break
 
         try:
-            result = executor.execute(cmd)
-            if isinstance(result, list):
-                for row in result:
+            cursor = session.cursor(cmd)
+            if cursor.is_query:
+                for row in cursor:
+                    print(row)
+            elif isinstance(cursor.result, list):
+                for row in cursor.result:  # EXPLAIN
                     print(row)
             else:
-                print(result)
+                print(cursor.result)
         except Exception as e:
             print(f"Error: {e}")
 
@@ -0,0 +1,55 @@
+# conftest.py
+# Every test runs against an empty data directory of its own.
+import pytest
+
+from rdbms import table as table_module
+from rdbms.executor import Executor
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    path = tmp_path / "data"
+    path.mkdir()
+    monkeypatch.setattr(table_module, "DATA_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def executor(data_dir):
+    executor = Executor()
+    yield executor
+    executor.tables.close()
+
+
+def reopen(executor):
+    # what a restart sees: a new executor reading the same data directory
+    executor.tables.close()
+    return Executor()
+
+
+def null_last(value):
+    # the ORDER BY position of a value: NULLs after every other value
+    return value is None, value
+
+
+@pytest.fixture(params=["ROW", "COLUMN"])
+def keyed_table(request, executor):
+    # t with a primary key, a unique column and an ordered index, in both layouts
+    executor.execute(f"CREATE TABLE t id:INT name:TEXT v:INT PRIMARY_KEY=id UNIQUE=name STORAGE={request.param}")
+    executor.execute("CREATE INDEX ON t(v) USING ORDERED")
+    for i in range(5):
+        executor.execute(f"INSERT t id={i} name=n{i} v={i * 10}")
+    return "t"
+
+
+def state(executor):
+    return sorted((r["id"], r["name"], r.get("v")) for r in executor.execute("SELECT * FROM t"))
+
+
+def check_keys_and_indexes(executor, expected):
+    # every row is found through its key, its unique column and its index
+    for id_, name, v in expected:
+        assert executor.execute(f"SELECT id FROM t WHERE id={id_}") == [{"id": id_}]
+        assert executor.execute(f"SELECT id FROM t WHERE name={name}") == [{"id": id_}]
+        assert {"id": id_} in executor.execute(f"SELECT id FROM t WHERE v={v}")
+    assert len(executor.execute("SELECT * FROM t WHERE v>=0")) == len(expected)
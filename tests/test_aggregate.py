@@ -0,0 +1,58 @@
+# test_aggregate.py
+# Aggregates answered from table metadata instead of a scan.
+import pytest
+
+
+def stages(executor, sql):
+    return [(step["stage"], step["detail"]) for step in executor.execute("EXPLAIN " + sql)]
+
+
+@pytest.mark.parametrize("storage", ["ROW", "COLUMN"])
+def test_min_max_come_from_ordered_indexes_only(executor, storage):
+    executor.execute(f"CREATE TABLE t id:INT a:INT b:INT STORAGE={storage}")
+    executor.execute("CREATE INDEX ON t(a) USING ORDERED")
+    executor.execute("CREATE INDEX ON t(b) USING HASH")
+    rows = [{"id": i, "a": (i * 7) % 53, "b": (i * 13) % 41 - 5} for i in range(100)]
+    executor.insert_many("t", rows)
+    executor.execute("DELETE FROM t WHERE id=0")
+    rows = rows[1:]
+    a, b = [r["a"] for r in rows], [r["b"] for r in rows]
+
+    assert executor.execute("SELECT MIN(a), MAX(a) FROM t") == [{"MIN(a)": min(a), "MAX(a)": max(a)}]
+    assert ("aggregate", "from table metadata") in stages(executor, "SELECT MIN(a), MAX(a) FROM t")
+    # a hash index keeps its values unordered: MIN/MAX over it scan the table
+    assert executor.execute("SELECT MIN(b), MAX(b) FROM t") == [{"MIN(b)": min(b), "MAX(b)": max(b)}]
+    assert ("aggregate", "from table metadata") not in stages(executor, "SELECT MIN(b), MAX(b) FROM t")
+    assert ("aggregate", "from table metadata") not in stages(executor, "SELECT MIN(a), MAX(b) FROM t")
+
+
+@pytest.fixture
+def shop(executor):
+    executor.execute("CREATE TABLE users id:INT city:TEXT PRIMARY_KEY=id")
+    executor.execute("CREATE TABLE orders id:INT user_id:INT total:FLOAT PRIMARY_KEY=id")
+    executor.insert_many("users", [{"id": i, "city": f"c{i % 3}"} for i in range(9)])
+    executor.insert_many("orders", [{"id": i, "user_id": i % 9, "total": i + 0.5} for i in range(40)])
+    return {i: f"c{i % 3}" for i in range(9)}, [(i % 9, i + 0.5) for i in range(40)]
+
+
+def test_join_group_by_resolves_unqualified_columns(executor, shop):
+    cities, orders = shop
+    expected = {}
+    for user_id, total in orders:
+        expected[cities[user_id]] = expected.get(cities[user_id], 0) + total
+    for city_col, total_col in [("city", "total"), ("users.city", "orders.total"), ("city", "orders.total")]:
+        result = executor.execute(f"SELECT {city_col}, SUM({total_col}) FROM users JOIN orders "
+                                  f"ON users.id=orders.user_id GROUP BY {city_col}")
+        assert {r[city_col]: r[f"SUM({total_col})"] for r in result} == expected
+
+
+def test_join_aggregate_rejects_unknown_and_ambiguous_columns(executor, shop):
+    join = "FROM users JOIN orders ON users.id=orders.user_id"
+    with pytest.raises(ValueError, match="does not exist"):
+        executor.execute(f"SELECT cty, COUNT(*) {join} GROUP BY cty")
+    with pytest.raises(ValueError, match="does not exist"):
+        executor.execute(f"SELECT SUM(totl) {join}")
+    with pytest.raises(ValueError, match="does not exist"):
+        executor.execute(f"SELECT users.nope, COUNT(*) {join} GROUP BY users.nope")
+    with pytest.raises(ValueError, match="ambiguous"):
+        executor.execute(f"SELECT id, COUNT(*) {join} GROUP BY id")
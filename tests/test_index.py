@@ -0,0 +1,90 @@
+# test_index.py
+# Index-aware SELECT: the access path the planner picks, index results checked
+# against a full scan, and index maintenance when a write is rejected.
+import random
+
+import pytest
+
+from conftest import reopen
+
+LAYOUTS = [("ROW", "JSON"), ("COLUMN", "JSON")]
+QUERIES = {  # WHERE -> the same condition in Python
+    "a=2": lambda r: r["a"] == 2,
+    "a=7": lambda r: r["a"] == 7,
+    "b>40": lambda r: r["b"] > 40,
+    "b>=40": lambda r: r["b"] >= 40,
+    "b<3": lambda r: r["b"] < 3,
+    "b<=3": lambda r: r["b"] <= 3,
+    "b=17": lambda r: r["b"] == 17,
+    "b BETWEEN 10 AND 20": lambda r: 10 <= r["b"] <= 20,
+    "b BETWEEN 30 AND 35 AND a=1": lambda r: 30 <= r["b"] <= 35 and r["a"] == 1,
+    "a=3 AND c=x13": lambda r: r["a"] == 3 and r["c"] == "x13",
+    "a=1 OR b<3": lambda r: r["a"] == 1 or r["b"] < 3,
+}
+
+
+@pytest.fixture(params=LAYOUTS, ids="-".join)
+def table(request, executor):
+    storage, file_format = request.param
+    executor.execute(f"CREATE TABLE t id:INT a:INT b:INT c:TEXT PRIMARY_KEY=id "
+                     f"STORAGE={storage} FORMAT={file_format}")
+    executor.execute("CREATE INDEX ON t(a)")
+    executor.execute("CREATE INDEX ON t(b) USING ORDERED")
+    rng = random.Random(3)
+    executor.insert_many("t", [{"id": i, "a": i % 5, "b": rng.randrange(50), "c": f"x{i}"} for i in range(60)])
+    executor.execute("DELETE FROM t WHERE id=7")
+    executor.execute("UPDATE t SET b=17 WHERE id=8")
+    return "t"
+
+
+def scan_detail(executor, where):
+    return executor.execute(f"EXPLAIN SELECT * FROM t WHERE {where}")[0]["detail"]
+
+
+def test_planner_picks_key_index_or_scan(executor, table):
+    assert scan_detail(executor, "id=3").startswith("t by key id = 3")
+    assert scan_detail(executor, "a=2").startswith("t by index a = 2")
+    assert scan_detail(executor, "b>40").startswith("t by index b > 40")
+    assert scan_detail(executor, "b BETWEEN 3 AND 6 AND a=1").startswith("t by index")
+    assert scan_detail(executor, "c=x1") == "t by full scan"
+    assert scan_detail(executor, "a=1 OR b<3") == "t by full scan"
+
+
+def test_index_lookups_match_a_full_scan(executor, table):
+    rows = executor.execute("SELECT * FROM t")
+    for where, test in QUERIES.items():
+        result = sorted(r["id"] for r in executor.execute(f"SELECT * FROM t WHERE {where}"))
+        assert result == sorted(r["id"] for r in rows if test(r)), where
+
+
+def test_indexes_follow_updates_and_deletes(executor, table):
+    executor.execute("UPDATE t SET a=9 WHERE id=10")
+    executor.execute("DELETE FROM t WHERE a=4")
+    assert executor.execute("SELECT id FROM t WHERE a=9") == [{"id": 10}]
+    assert executor.execute("SELECT id FROM t WHERE a=4") == []
+    assert [r["id"] for r in executor.execute("SELECT id FROM t WHERE b=17")] == \
+        sorted(r["id"] for r in executor.execute("SELECT * FROM t") if r["b"] == 17)
+
+
+def test_value_an_ordered_index_cannot_compare_is_rejected_before_any_change(executor):
+    # the untyped ROW store keeps values as written, so 5 and 'x' meet in one index
+    executor.execute("CREATE TABLE t id:INT v:TEXT PRIMARY_KEY=id")
+    executor.execute("CREATE INDEX ON t(v) USING ORDERED")
+    executor.execute("CREATE INDEX ON t(id) USING ORDERED")
+    executor.execute("INSERT t id=1 v=x")
+    executor.execute("INSERT t id=3 v=y")
+    for statement in ["INSERT t id=2 v=5", "UPDATE t SET v=5 WHERE id=1", "UPDATE t SET v=5"]:
+        with pytest.raises(ValueError, match="ordered index"):
+            executor.execute(statement)
+    with pytest.raises(ValueError, match="ordered index"):
+        executor.insert_many("t", [{"id": 4, "v": "z"}, {"id": 5, "v": 6}])
+
+    expected = [{"id": 1, "v": "x"}, {"id": 3, "v": "y"}]
+    assert executor.execute("SELECT * FROM t") == expected
+    assert executor.execute("SELECT id FROM t WHERE id=2") == []
+    assert executor.execute("SELECT id FROM t WHERE v=x") == [{"id": 1}]
+    assert executor.execute("SELECT id FROM t WHERE id>=1") == [{"id": 1}, {"id": 3}]
+    executor.execute("INSERT t id=2 v=w")  # its key was never taken
+    executor.execute("INSERT t id=4 v=z")
+    executor = reopen(executor)
+    assert [r["id"] for r in executor.execute("SELECT * FROM t ORDER BY v")] == [2, 1, 3, 4]
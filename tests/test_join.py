@@ -0,0 +1,76 @@
+# test_join.py
+# Join strategies: the one chosen for the keys and indexes each side has, and
+# the rows of every strategy checked against a nested loop.
+import random
+
+import pytest
+
+
+@pytest.fixture(params=["ROW", "COLUMN"])
+def shop(request, executor):
+    storage = request.param
+    executor.execute(f"CREATE TABLE users id:INT name:TEXT city:TEXT PRIMARY_KEY=id STORAGE={storage}")
+    executor.execute(f"CREATE TABLE orders id:INT user_id:INT city:TEXT total:INT PRIMARY_KEY=id STORAGE={storage}")
+    rng = random.Random(4)
+    executor.insert_many("users", [{"id": i, "name": f"u{i}", "city": f"c{i % 3}"} for i in range(30)])
+    executor.insert_many("orders", [{"id": i, "user_id": rng.randrange(35) if i % 9 else None,
+                                     "city": f"c{i % 4}", "total": rng.randrange(100)} for i in range(80)])
+    return executor
+
+
+def join(executor, on, where=None):
+    # (strategy EXPLAIN reports, sorted (users.id, orders.id) pairs)
+    sql = f"SELECT users.id, orders.id FROM users JOIN orders ON {on}" + (f" WHERE {where}" if where else "")
+    stage = next(s for s in executor.execute("EXPLAIN " + sql) if s["stage"] == "join")
+    return stage["detail"].split()[0], sorted((r["users.id"], r["orders.id"]) for r in executor.execute(sql))
+
+
+def nested_loop(executor, left_col, right_col, test=lambda user, order: True):
+    users = executor.execute("SELECT * FROM users")
+    orders = executor.execute("SELECT * FROM orders")
+    return sorted((u["id"], o["id"]) for u in users for o in orders
+                  if u.get(left_col) is not None and u.get(left_col) == o.get(right_col) and test(u, o))
+
+
+def test_strategy_follows_keys_and_indexes(shop):
+    by_user = nested_loop(shop, "id", "user_id")
+    assert join(shop, "users.id=orders.user_id") == ("index:left", by_user)  # users by its primary key
+    shop.execute("CREATE INDEX ON orders(user_id)")
+    # both sides can be probed: the smaller one, after WHERE, is read
+    assert join(shop, "users.id=orders.user_id") == ("index:right", by_user)
+    assert join(shop, "users.id=orders.user_id", "orders.total < 5") == \
+        ("index:left", nested_loop(shop, "id", "user_id", lambda u, o: o["total"] < 5))
+    assert join(shop, "users.id=orders.user_id", "users.id < 3 AND orders.total > 50") == \
+        ("index:right", nested_loop(shop, "id", "user_id", lambda u, o: u["id"] < 3 and o["total"] > 50))
+
+    by_city = nested_loop(shop, "city", "city")
+    assert join(shop, "users.city=orders.city") == ("hash", by_city)
+    shop.execute("CREATE INDEX ON users(city) USING ORDERED")
+    assert join(shop, "users.city=orders.city") == ("index:left", by_city)
+    shop.execute("CREATE INDEX ON orders(city) USING ORDERED")
+    assert join(shop, "users.city=orders.city") == ("merge", by_city)
+    # WHERE rules out a merge of the whole indexes
+    assert join(shop, "users.city=orders.city", "orders.total >= 90") == \
+        ("index:left", nested_loop(shop, "city", "city", lambda u, o: o["total"] >= 90))
+
+
+def test_joins_on_values_of_other_types_match_nothing(executor):
+    # the untyped ROW layout keeps values as given, so join keys can be of any type
+    executor.execute("CREATE TABLE users id:INT code:INT PRIMARY_KEY=id")
+    executor.execute("CREATE TABLE orders id:INT code:INT PRIMARY_KEY=id")
+    executor.execute("CREATE INDEX ON users(code) USING ORDERED")
+    executor.insert_many("users", [{"id": i, "code": i % 4} for i in range(8)])
+    executor.insert_many("orders", [{"id": i, "code": [1, "1", 2, "x", None, 3.0][i]} for i in range(6)])
+    expected = [(1, 0), (2, 2), (3, 5), (5, 0), (6, 2), (7, 5)]
+    assert nested_loop(executor, "code", "code") == expected
+    # orders' codes probe the ordered index on users.code
+    assert join(executor, "users.code=orders.code") == ("index:left", expected)
+
+    executor.execute("CREATE TABLE labels id:INT code:TEXT PRIMARY_KEY=id")
+    executor.execute("CREATE INDEX ON labels(code) USING ORDERED")
+    executor.insert_many("labels", [{"id": 1, "code": "1"}, {"id": 2, "code": "x"}])
+    # ordered indexes on both sides, but of types that cannot be merged
+    rows = executor.execute("SELECT users.id, labels.id FROM users JOIN labels ON users.code=labels.code")
+    assert rows == []
+    analyze = executor.execute("EXPLAIN ANALYZE SELECT users.id FROM users JOIN labels ON users.code=labels.code")
+    assert any(stage["detail"].startswith("hash ") for stage in analyze)
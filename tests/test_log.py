@@ -0,0 +1,166 @@
+# test_log.py
+# The write-ahead log: every change is replayed after a restart, a torn last
+# record is dropped, and checkpoints fold the log into the base file, even
+# when the process dies in the middle of one.
+import os
+
+import pytest
+
+from conftest import reopen
+from rdbms import table as table_module
+
+LAYOUTS = [("ROW", "JSON"), ("COLUMN", "JSON"), ("ROW", "PAGED"), ("COLUMN", "PAGED")]
+
+
+def create(executor, storage, file_format):
+    executor.execute(f"CREATE TABLE t id:INT name:TEXT score:FLOAT PRIMARY_KEY=id UNIQUE=name "
+                     f"STORAGE={storage} FORMAT={file_format}")
+    executor.execute("CREATE INDEX ON t(score) USING ORDERED")
+
+
+def rows(executor):
+    return sorted((r["id"], r["name"], r["score"]) for r in executor.execute("SELECT * FROM t"))
+
+
+@pytest.mark.parametrize("storage, file_format", LAYOUTS)
+def test_changes_are_replayed_after_restart(executor, data_dir, storage, file_format):
+    create(executor, storage, file_format)
+    for i in range(6):
+        executor.execute(f"INSERT t id={i} name=n{i} score={i * 1.5}")
+    executor.execute("UPDATE t SET score=100.0 WHERE id=2")
+    executor.execute("DELETE FROM t WHERE id=4")
+    expected = rows(executor)
+    assert os.path.exists(data_dir / "t.log")
+
+    executor = reopen(executor)
+    assert rows(executor) == expected
+    assert executor.execute("SELECT id FROM t WHERE score>50") == [{"id": 2}]
+    assert executor.execute("SELECT * FROM t WHERE id=4") == []
+    executor.execute("INSERT t id=4 name=n4 score=1.0")  # the deleted key is free again
+    with pytest.raises(ValueError, match="Primary key violation"):
+        executor.execute("INSERT t id=3 name=other score=1.0")
+
+
+@pytest.mark.parametrize("storage, file_format", LAYOUTS)
+def test_checkpoint_folds_the_log_into_the_base_file(executor, data_dir, storage, file_format):
+    create(executor, storage, file_format)
+    for i in range(5):
+        executor.execute(f"INSERT t id={i} name=n{i} score={float(i)}")
+    executor.execute("DELETE FROM t WHERE id=1")
+    expected = rows(executor)
+    executor.tables["t"].checkpoint()
+    assert not os.path.exists(data_dir / "t.log")
+
+    executor = reopen(executor)
+    assert rows(executor) == expected
+    executor.execute("INSERT t id=9 name=n9 score=9.0")
+    executor = reopen(executor)
+    assert rows(executor) == expected + [(9, "n9", 9.0)]
+
+
+def test_checkpoint_waits_for_the_log_to_outgrow_half_the_base_file(executor, data_dir, monkeypatch):
+    monkeypatch.setattr(table_module, "CHECKPOINT_MIN_BYTES", 0)
+    create(executor, "ROW", "JSON")
+    executor.insert_many("t", [{"id": i, "name": f"n{i}", "score": float(i)} for i in range(200)])
+    base = os.path.getsize(data_dir / "t.json")
+    assert not os.path.exists(data_dir / "t.log")
+    assert b"\n" not in (data_dir / "t.json").read_bytes()  # written without indentation
+
+    log = data_dir / "t.log"
+    executor.execute("INSERT t id=200 name=n200 score=1.0")
+    i = 201
+    while log.exists():  # until an insert makes the log too long
+        assert os.path.getsize(log) <= base * table_module.CHECKPOINT_RATIO
+        executor.execute(f"INSERT t id={i} name=n{i} score=1.0")
+        i += 1
+    assert i > 210
+    assert os.path.getsize(data_dir / "t.json") > base
+    assert executor.tables["t"].io_stats["checkpoints"] == 2
+    executor = reopen(executor)
+    assert len(rows(executor)) == i
+
+
+def test_torn_last_record_is_dropped(executor, data_dir):
+    create(executor, "ROW", "JSON")
+    executor.execute("INSERT t id=1 name=a score=1.0")
+    executor.execute("INSERT t id=2 name=b score=2.0")
+    executor.tables.close()
+    log = data_dir / "t.log"
+    good = log.read_bytes()
+    with open(log, "ab") as f:
+        f.write(b'{"op": "insert", "row": {"id": 3, "na')  # the process died mid-write
+
+    executor = reopen(executor)
+    assert rows(executor) == [(1, "a", 1.0), (2, "b", 2.0)]
+    assert log.read_bytes() == good
+    executor.execute("INSERT t id=3 name=c score=3.0")
+    executor = reopen(executor)
+    assert [r[0] for r in rows(executor)] == [1, 2, 3]
+
+
+def test_tombstones_are_replayed_at_their_positions(executor):
+    create(executor, "COLUMN", "JSON")
+    executor.insert_many("t", [{"id": i, "name": f"n{i}", "score": float(i)} for i in range(20)])
+    executor.execute("DELETE FROM t WHERE id=3")
+    executor.execute("DELETE FROM t WHERE id IN (7, 8)")
+    executor.execute("UPDATE t SET name=changed WHERE id=9")
+    expected = rows(executor)
+
+    executor = reopen(executor)
+    assert rows(executor) == expected
+    assert executor.execute("SELECT id FROM t WHERE name=changed") == [{"id": 9}]
+    assert executor.execute("SELECT id FROM t WHERE score BETWEEN 2 AND 8") == [
+        {"id": 2}, {"id": 4}, {"id": 5}, {"id": 6}]
+
+
+class Crash(BaseException):
+    # the process dies: no exception handler runs
+    pass
+
+
+def crash_at(monkeypatch, step):
+    # step 0 dies before the log is set aside, 1 before the base file is
+    # replaced, 2 before the old log is deleted; every later call fails too
+    calls = []
+    real_replace, real_remove = os.replace, os.remove
+
+    def replace(src, dst):
+        calls.append(dst)
+        if len(calls) > step:
+            raise Crash()
+        real_replace(src, dst)
+
+    def remove(path):
+        if path.endswith(".old"):
+            raise Crash()
+        real_remove(path)
+
+    monkeypatch.setattr(os, "replace", replace)
+    monkeypatch.setattr(os, "remove", remove)
+
+
+@pytest.mark.parametrize("storage, file_format", LAYOUTS)
+@pytest.mark.parametrize("step", [0, 1, 2])
+def test_crash_during_checkpoint_loses_and_repeats_nothing(executor, data_dir, monkeypatch,
+                                                          storage, file_format, step):
+    create(executor, storage, file_format)
+    for i in range(6):
+        executor.execute(f"INSERT t id={i} name=n{i} score={float(i)}")
+    executor.tables["t"].checkpoint()
+    executor.execute("INSERT t id=10 name=n10 score=10.0")
+    executor.execute("UPDATE t SET score=50.0 WHERE id=2")
+    executor.execute("DELETE FROM t WHERE id=1")
+    expected = rows(executor)
+
+    with monkeypatch.context() as patch:
+        crash_at(patch, step)
+        with pytest.raises(Crash):
+            executor.tables["t"].checkpoint()
+    executor = reopen(executor)
+    assert rows(executor) == expected
+    assert not [name for name in os.listdir(data_dir) if name.endswith((".tmp", ".old"))]
+    executor.execute("INSERT t id=1 name=n1 score=1.0")  # the deleted key is free once
+    with pytest.raises(ValueError, match="Primary key violation"):
+        executor.execute("INSERT t id=10 name=other score=1.0")
+    executor = reopen(executor)
+    assert rows(executor) == sorted(expected + [(1, "n1", 1.0)])
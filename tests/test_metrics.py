@@ -0,0 +1,78 @@
+# test_metrics.py
+# Prepared statements of every kind, EXPLAIN [ANALYZE], and the counters and
+# slow-query log behind /metrics.
+import json
+
+import pytest
+
+from rdbms.executor import Executor
+
+
+@pytest.fixture
+def table(executor):
+    executor.execute("CREATE TABLE t id:INT v:INT PRIMARY_KEY=id")
+    executor.execute("CREATE INDEX ON t(v)")
+    executor.insert_many("t", [{"id": i, "v": i % 4} for i in range(20)])
+    return "t"
+
+
+def counters(executor):
+    report = executor.metrics_report()
+    return report["rows_scanned"], report["rows_returned"], report["rows_written"]
+
+
+def test_explain_takes_parameters(executor, table):
+    handle = executor.prepare("EXPLAIN SELECT * FROM t WHERE id = ?")
+    assert handle.param_count == 1
+    assert executor.execute(handle, [3])[0]["detail"].startswith("t by key id = 3")
+    assert executor.execute("EXPLAIN SELECT * FROM t WHERE v = ? AND id > ?", [1, 10])[0]["detail"].startswith(
+        "t by index v = 1")
+    for params in [None, [1, 2]]:
+        with pytest.raises(ValueError, match="expects 1 parameters"):
+            executor.execute(handle, params)
+    analyze = executor.execute("EXPLAIN ANALYZE UPDATE t SET v = ? WHERE id = ?", [9, 2])
+    assert analyze[-1]["detail"] == "Updated 1 rows in 't'."
+    assert executor.execute("SELECT v FROM t WHERE id=2") == [{"v": 9}]
+    assert executor.prepare("COPY t FROM 'rows.csv'").param_count == 0
+
+
+def test_counters_cover_every_write_and_explain_analyze(executor, data_dir, table):
+    assert counters(executor) == (0, 0, 20)  # insert_many is counted too
+    executor.execute("INSERT t id=100 v=1")
+    (data_dir / "rows.csv").write_text("id,v\n200,1\n201,2\n")
+    executor.execute("COPY t FROM 'rows.csv'")
+    assert counters(executor) == (0, 0, 23)
+
+    executor.execute("UPDATE t SET v=3 WHERE v=1")  # ids 1, 5, 9, 13, 17, 100 and 200 through the index
+    executor.execute("DELETE FROM t WHERE id=0")
+    assert counters(executor) == (8, 0, 31)
+    assert executor.execute("SELECT * FROM t WHERE v=2") == [{"id": i, "v": 2} for i in (2, 6, 10, 14, 18, 201)]
+    assert counters(executor) == (14, 6, 31)
+
+    analyze = executor.execute("EXPLAIN ANALYZE DELETE FROM t WHERE v=2")
+    assert [stage["rows"] for stage in analyze[:-1]] == [6, 6]
+    assert counters(executor) == (20, 6, 37)
+    executor.execute("EXPLAIN ANALYZE SELECT * FROM t WHERE v=3")
+    assert counters(executor)[0] == 32  # the five rows of v=3 and the seven updated to it
+    assert executor.metrics_report()["statements"] == {"CreateTable": 1, "CreateIndex": 1, "InsertMany": 1,
+                                                       "Insert": 1, "Copy": 1, "Update": 1, "Delete": 1,
+                                                       "Select": 1, "Explain": 2}
+
+
+def test_slow_query_log(data_dir, tmp_path):
+    log = tmp_path / "slow" / "queries.log"
+    executor = Executor(slow_query_ms=0, slow_query_log=str(log))
+    executor.execute("CREATE TABLE t id:INT v:INT PRIMARY_KEY=id")
+    executor.insert_many("t", [{"id": i, "v": i} for i in range(5)])
+    executor.execute("SELECT * FROM t WHERE v > ?", [2])
+    with pytest.raises(ValueError):
+        executor.execute("SELECT * FROM missing")
+    entries = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [entry["sql"] for entry in entries] == ["CREATE TABLE t id:INT v:INT PRIMARY_KEY=id",
+                                                   "insert_many(t)", "SELECT * FROM t WHERE v > ?",
+                                                   "SELECT * FROM missing"]
+    assert entries[1]["rows_written"] == 5
+    assert (entries[2]["rows_scanned"], entries[2]["rows_returned"]) == (5, 2)
+    assert entries[2]["plan"][0] == "scan: t by full scan"
+    assert executor.metrics_report()["errors"] == 1
+    executor.tables.close()
@@ -0,0 +1,104 @@
+# test_order_by.py
+# ORDER BY against a brute-force reference, through every sort method: top-N
+# heap, in-memory sort, external merge sort and ordered index walks.
+import os
+import random
+
+import pytest
+
+from rdbms.executor import Executor
+from conftest import null_last
+
+TABLES = {"r": "", "c": " STORAGE=COLUMN", "h": " PARTITION=HASH(id,4)", "g": " PARTITION=RANGE(a,10,20)"}
+WHERES = [
+    ("", lambda r: True),
+    ("WHERE a > 10", lambda r: r["a"] is not None and r["a"] > 10),
+    ("WHERE a BETWEEN 5 AND 12", lambda r: r["a"] is not None and 5 <= r["a"] <= 12),
+    ("WHERE s LIKE 'q%'", lambda r: r["s"] is not None and r["s"].startswith("q")),
+    ("WHERE a IN (3, 4) OR b < 10", lambda r: r["a"] in (3, 4) or (r["b"] is not None and r["b"] < 10)),
+]
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    rnd = random.Random(7)
+    return [{"id": i, "a": rnd.choice([None] + list(range(30))), "b": rnd.choice([None, rnd.random() * 100]),
+             "s": rnd.choice([None, "x", "y", "abc", f"q{rnd.randint(0, 40)}"])} for i in range(1500)]
+
+
+@pytest.fixture
+def db(data_dir, dataset):
+    # a small sort budget, so sorts without LIMIT spill runs to disk
+    executor = Executor(sort_memory_bytes=10000)
+    for name, extra in TABLES.items():
+        executor.execute(f"CREATE TABLE {name} id:INT a:INT b:FLOAT s:TEXT PRIMARY_KEY=id{extra}")
+        if not extra.startswith(" PARTITION"):
+            executor.execute(f"CREATE INDEX ON {name}(a) USING ORDERED")
+        executor.insert_many(name, [dict(row) for row in dataset])
+        executor.execute(f"DELETE FROM {name} WHERE id < 40")
+    yield executor
+    executor.tables.close()
+
+
+def reference(rows, order_by, where, limit, offset):
+    rows = [r for r in rows if r["id"] >= 40 and where(r)]
+    for col, desc in reversed(order_by):
+        rows.sort(key=lambda r: null_last(r[col]), reverse=desc)
+    rows = rows[offset:]
+    return rows if limit is None else rows[:limit]
+
+
+@pytest.mark.parametrize("name", sorted(TABLES))
+def test_matches_reference(db, dataset, name):
+    rnd = random.Random(name)
+    for _ in range(60):
+        order_by = [(col, rnd.random() < 0.5) for col in rnd.sample(["a", "b", "s"], rnd.randint(1, 2))]
+        order_by.append(("id", rnd.random() < 0.5))  # a total order, so the expected rows are unique
+        where_sql, where = rnd.choice(WHERES)
+        limit, offset = rnd.choice([None, 0, 1, 25]), rnd.choice([0, 7])
+        sql = f"SELECT * FROM {name} {where_sql} ORDER BY " + ", ".join(
+            col + (" DESC" if desc else " ASC") for col, desc in order_by)
+        sql += (f" LIMIT {limit}" if limit is not None else "") + (f" OFFSET {offset}" if offset else "")
+        assert db.execute(sql) == reference(dataset, order_by, where, limit, offset), sql
+
+
+@pytest.mark.parametrize("desc", [False, True])
+def test_index_order_places_nulls(db, dataset, desc):
+    got = db.execute(f"SELECT id, a FROM r ORDER BY a{' DESC' if desc else ''}")
+    values = [r["a"] for r in got]
+    assert values == sorted((r["a"] for r in dataset if r["id"] >= 40), key=null_last, reverse=desc)
+    plan = db.execute(f"EXPLAIN SELECT id FROM r ORDER BY a{' DESC' if desc else ''} LIMIT 5")
+    assert "index order on a" in plan[0]["detail"]
+
+
+def test_sort_methods(db, data_dir):
+    report = db.execute("EXPLAIN ANALYZE SELECT * FROM c ORDER BY b, id")
+    assert any(s["stage"] == "sort" and s["detail"].startswith("external merge sort") for s in report)
+    report = db.execute("EXPLAIN ANALYZE SELECT * FROM c ORDER BY b LIMIT 3")
+    assert any(s["stage"] == "sort" and s["detail"].startswith("top-3 heap") for s in report)
+    assert not [f for f in os.listdir(data_dir) if f.startswith("sort-")]  # runs are deleted
+
+
+def test_aggregates_and_joins(db, dataset):
+    live = [r for r in dataset if r["id"] >= 40]
+    counts = {}
+    for r in live:
+        counts[r["a"]] = counts.get(r["a"], 0) + 1
+    got = db.execute("SELECT a, COUNT(*) FROM r GROUP BY a ORDER BY COUNT(*) DESC, a LIMIT 5")
+    expected = sorted(counts.items(), key=lambda kv: (-kv[1], null_last(kv[0])))[:5]
+    assert [(r["a"], r["COUNT(*)"]) for r in got] == expected
+
+    got = db.execute("SELECT r.id FROM r JOIN c ON r.id=c.id WHERE r.a < 3 ORDER BY c.b DESC, r.id LIMIT 10")
+    expected = sorted((r for r in live if r["a"] is not None and r["a"] < 3), key=lambda r: r["id"])
+    expected.sort(key=lambda r: null_last(r["b"]), reverse=True)
+    assert got == [{"r.id": r["id"]} for r in expected[:10]]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM r ORDER BY missing",
+    "SELECT a, COUNT(*) FROM r GROUP BY a ORDER BY b",
+    "SELECT * FROM r JOIN c ON r.id=c.id ORDER BY id",
+])
+def test_invalid_order_by(db, sql):
+    with pytest.raises(ValueError):
+        db.execute(sql)
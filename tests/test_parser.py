@@ -0,0 +1,104 @@
+# test_parser.py
+# Keywords used as names, normalized statements, the plan cache and the
+# binding of parameters to prepared statements.
+import pytest
+
+from rdbms import executor as executor_module
+from rdbms.parser import tokenize, normalize, parse, USER_PARAM, Select
+
+
+def test_keywords_name_tables_and_columns(executor):
+    executor.execute("CREATE TABLE order id:INT desc:TEXT index:INT limit:INT group:TEXT format:TEXT "
+                     "PRIMARY_KEY=id UNIQUE=desc FORMAT=JSON")
+    executor.execute("CREATE INDEX ON order(index) USING ORDERED")
+    for i in range(6):
+        executor.execute(f"INSERT INTO order id={i} desc=d{i} index={i * 10} limit={i % 3} group=g{i % 2} format=f")
+    assert executor.execute("SELECT desc, index FROM order WHERE index >= 30 AND limit = 0 ORDER BY index DESC") \
+        == [{"desc": "d3", "index": 30}]
+    assert executor.execute("SELECT group, COUNT(*) FROM order GROUP BY group ORDER BY group LIMIT 1") \
+        == [{"group": "g0", "COUNT(*)": 3}]
+    assert executor.execute("SELECT id FROM order WHERE desc IN (d1, d2) ORDER BY id") == [{"id": 1}, {"id": 2}]
+    executor.execute("UPDATE order SET format=x WHERE index < 20")
+    executor.execute("DELETE FROM order WHERE group = g1")
+    assert executor.execute("SELECT id, format FROM order ORDER BY id") \
+        == [{"id": 0, "format": "x"}, {"id": 2, "format": "f"}, {"id": 4, "format": "f"}]
+
+
+def test_keyword_case_is_kept_in_names(executor):
+    executor.execute("CREATE TABLE t id:INT Order:INT order:INT PRIMARY_KEY=id")
+    executor.execute("INSERT t id=1 Order=2 order=3")
+    assert executor.execute("SELECT Order FROM t") == [{"Order": 2}]
+    assert executor.execute("SELECT order FROM t") == [{"order": 3}]
+
+
+@pytest.mark.parametrize("sql", [
+    "CREATE TABLE where id:INT",
+    "CREATE TABLE t from:INT",
+    "SELECT and FROM t",
+    "UPDATE t SET null=1",
+])
+def test_reserved_words_are_not_names(executor, sql):
+    with pytest.raises(ValueError, match="Syntax"):
+        executor.execute(sql)
+
+
+def test_normalize_replaces_literals():
+    key, tokens, literals = normalize(tokenize("select * FROM t WHERE id=5 AND name='Al Smith' OR v IN (1.5, ?) "
+                                               "AND w=bob AND x IS NULL LIMIT 3"))
+    assert key == "select * FROM t WHERE id = ? AND name = ? OR v IN ( ? , ? ) AND w = ? AND x IS NULL LIMIT ?"
+    assert literals == [5, "Al Smith", 1.5, USER_PARAM, "bob", 3]
+    assert [tok for tok in tokens if tok[0] == "PARAM"] == [("PARAM", "?", None)] * 6
+    stmt, params = parse(tokens)
+    assert isinstance(stmt, Select) and params == 6
+
+
+def test_join_columns_are_not_literals():
+    key, _, literals = normalize(tokenize("SELECT * FROM a JOIN b ON a.id=b.a_id"))
+    assert key == "SELECT * FROM a JOIN b ON a.id = b.a_id"
+    assert literals == []
+
+
+def test_plan_cache_shares_plans_between_literals(executor):
+    executor.execute("CREATE TABLE t id:INT name:TEXT PRIMARY_KEY=id")
+    first = executor.prepare("INSERT t id=1 name=a")
+    second = executor.prepare("INSERT t id=2 name='b c'")
+    assert first.stmt is second.stmt and first.key == second.key
+    executor.execute(first)
+    executor.execute(second)
+    assert executor.execute("SELECT name FROM t WHERE id=2") == [{"name": "b c"}]
+    assert executor.prepare("SELECT name FROM t WHERE id=1").stmt is executor.prepare("SELECT name FROM t WHERE id=7").stmt
+    assert executor.prepare("SELECT id FROM t WHERE id=1").stmt is not executor.prepare("SELECT name FROM t WHERE id=1").stmt
+
+
+def test_plan_cache_evicts_least_recently_used(executor, monkeypatch):
+    monkeypatch.setattr(executor_module, "PLAN_CACHE_SIZE", 2)
+    executor.execute("CREATE TABLE t id:INT a:INT b:INT c:INT PRIMARY_KEY=id")
+    plan_a = executor.prepare("SELECT a FROM t").stmt
+    executor.prepare("SELECT b FROM t")
+    assert executor.prepare("SELECT a FROM t").stmt is plan_a
+    executor.prepare("SELECT c FROM t")  # evicts SELECT b
+    assert list(executor._plan_cache) == ["SELECT a FROM t", "SELECT c FROM t"]
+    assert executor.prepare("SELECT a FROM t").stmt is plan_a
+
+
+def test_prepared_statement_binds_parameters(executor):
+    executor.execute("CREATE TABLE t id:INT name:TEXT v:INT PRIMARY_KEY=id")
+    insert = executor.prepare("INSERT t id=? name=? v=7")
+    assert insert.param_count == 2
+    for i in range(4):
+        executor.execute(insert, [i, f"n{i}"])
+    select = executor.prepare("SELECT id FROM t WHERE v=7 AND id BETWEEN ? AND ? ORDER BY id LIMIT ?")
+    assert select.param_count == 3
+    assert executor.execute(select, [1, 3, 2]) == [{"id": 1}, {"id": 2}]
+    assert executor.execute(select, (0, 0, 5)) == [{"id": 0}]
+    with pytest.raises(ValueError, match="expects 3 parameters, got 1"):
+        executor.execute(select, [1])
+    with pytest.raises(ValueError, match="expects 0 parameters, got 1"):
+        executor.execute("SELECT * FROM t", [1])
+
+
+def test_parameters_of_statements_that_are_not_cached(executor):
+    executor.execute("CREATE TABLE t id:INT day:INT PRIMARY_KEY=id")
+    stmt = executor.prepare("EXPLAIN SELECT * FROM t WHERE day=?")
+    assert stmt.key is None and stmt.param_count == 1
+    assert executor.execute(stmt, [5])
@@ -0,0 +1,133 @@
+# test_partition.py
+# Partition pruning, and partitioned tables returning the same rows as an
+# ordinary table for the same statements.
+import math
+import random
+import threading
+
+import pytest
+
+from rdbms.parallel import workers_for
+from rdbms.parser import parse, tokenize
+from rdbms import parallel
+from conftest import null_last
+
+WHERES = [
+    "day = 150", "day < 100", "day <= 100", "day >= 200 AND day < 300", "day BETWEEN 120 AND 250",
+    "day IN (5, 205, 305)", "day = 150 OR day = 350", "day IS NULL", "NOT day = 5", "v > 0.5",
+    "day > 100 AND v < 0.2", "id = 17", "id IN (1, 2, 3) OR day > 390",
+]
+
+
+@pytest.fixture
+def db(executor):
+    rnd = random.Random(3)
+    rows = [{"id": i, "day": rnd.choice([None] + list(range(400))), "v": rnd.random()} for i in range(2000)]
+    executor.execute("CREATE TABLE plain id:INT day:INT v:FLOAT PRIMARY_KEY=id")
+    executor.execute("CREATE TABLE ranged id:INT day:INT v:FLOAT PRIMARY_KEY=id PARTITION=RANGE(day,100,200,300)")
+    executor.execute("CREATE TABLE hashed id:INT day:INT v:FLOAT PRIMARY_KEY=id PARTITION=HASH(day,4)")
+    for name in ("plain", "ranged", "hashed"):
+        executor.insert_many(name, [dict(row) for row in rows])
+    return executor
+
+
+def partitions(executor, table, where):
+    table = executor.tables[table]
+    stmt, _ = parse(tokenize(f"SELECT * FROM {table.name} WHERE {where}"))
+    return [table.partitions.index(part) for part in table.prune(stmt.where)]
+
+
+@pytest.mark.parametrize("where, ranged, hashed", [
+    ("day = 150", [1], [150 % 4]),
+    ("day < 100", [0], [0, 1, 2, 3]),
+    ("day <= 100", [0, 1], [0, 1, 2, 3]),
+    ("day >= 200 AND day < 300", [2], [0, 1, 2, 3]),
+    ("day BETWEEN 120 AND 250", [1, 2], [0, 1, 2, 3]),
+    ("day IN (5, 205)", [0, 2], [1]),
+    ("day = 150 OR day = 350", [1, 3], [2]),
+    ("day IS NULL", [0], [0]),
+    ("v > 0.5", [0, 1, 2, 3], [0, 1, 2, 3]),
+])
+def test_pruning(db, where, ranged, hashed):
+    assert partitions(db, "ranged", where) == ranged
+    assert partitions(db, "hashed", where) == hashed
+
+
+def rows(executor, sql):
+    return sorted((tuple(row.values()) for row in executor.execute(sql)),
+                  key=lambda row: [null_last(value) for value in row])
+
+
+@pytest.mark.parametrize("where", WHERES)
+def test_same_rows_as_a_plain_table(db, where):
+    expected = rows(db, f"SELECT * FROM plain WHERE {where}")
+    for name in ("ranged", "hashed"):
+        assert rows(db, f"SELECT * FROM {name} WHERE {where}") == expected
+
+
+@pytest.mark.parametrize("where", ["", "WHERE day > 100", "WHERE v < 0.3 OR day IS NULL"])
+def test_same_aggregates_as_a_plain_table(db, where):
+    sql = "SELECT day, COUNT(*), SUM(v), MIN(v), MAX(v) FROM {} " + where + " GROUP BY day"
+    expected = rows(db, sql.format("plain"))
+    for name in ("ranged", "hashed"):
+        got = rows(db, sql.format(name))
+        assert [r[:2] for r in got] == [r[:2] for r in expected]
+        assert all(math.isclose(a, b) for g, e in zip(got, expected) for a, b in zip(g[2:], e[2:]))
+
+
+def test_writes_route_to_partitions(db):
+    db.execute("UPDATE ranged SET v=2.0 WHERE day=150")
+    db.execute("DELETE FROM hashed WHERE day < 100")
+    assert rows(db, "SELECT id FROM ranged WHERE v=2.0") == rows(db, "SELECT id FROM plain WHERE day=150")
+    assert rows(db, "SELECT * FROM hashed WHERE day < 100") == []
+    with pytest.raises(ValueError, match="partition column"):
+        db.execute("UPDATE ranged SET day=1 WHERE id=1")
+    with pytest.raises(ValueError, match="Primary key violation"):
+        db.execute("INSERT hashed id=1500 day=7 v=0.1")  # id 1500 is in another partition
+
+
+def test_runs_in_process_below_the_threshold(db):
+    table = db.tables["ranged"]
+    assert workers_for(table.partitions, len(table)) == 1
+    assert len(table) < parallel.PARALLEL_MIN_ROWS
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    monkeypatch.setattr(parallel, "PROCESSES", 2)
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_ROWS", 10)
+    yield
+    parallel._stop_workers()
+
+
+def on_processes(executor, sql):
+    return [stage["detail"] for stage in executor.execute("EXPLAIN ANALYZE " + sql) if stage["stage"] == "scan"]
+
+
+def test_workers_return_the_same_rows_while_other_threads_run(db, workers):
+    # spawned workers share no locks with the threads of the caller
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        table = db.tables["ranged"]
+        assert workers_for(table.partitions, len(table)) == 2
+        for where in ("day > 5", "v < 0.5 OR day IS NULL"):
+            assert rows(db, f"SELECT * FROM ranged WHERE {where}") == rows(db, f"SELECT * FROM plain WHERE {where}")
+        sql = "SELECT day, COUNT(*) FROM {} WHERE v > 0.2 GROUP BY day"
+        assert rows(db, sql.format("hashed")) == rows(db, sql.format("plain"))
+        assert on_processes(db, "SELECT * FROM hashed WHERE v > 0.5") == ["4 partitions on 2 processes"]
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_workers_see_writes_between_queries(db, workers):
+    sql = "SELECT * FROM {} WHERE v > 0.5"
+    assert rows(db, sql.format("hashed")) == rows(db, sql.format("plain"))
+    for name in ("plain", "hashed"):
+        db.execute(f"UPDATE {name} SET v=0.9 WHERE day=7")
+        db.execute(f"DELETE FROM {name} WHERE day=8")
+        db.execute(f"INSERT {name} id=5000 day=9 v=0.7")
+    assert rows(db, sql.format("hashed")) == rows(db, sql.format("plain"))
+    assert on_processes(db, sql.format("hashed")) == ["4 partitions on 2 processes"]
@@ -0,0 +1,126 @@
+# test_predicate.py
+# Generated WHERE functions against a plain interpreter of the same trees,
+# and SELECT on row and column tables against filtering the rows in Python.
+import random
+
+import pytest
+
+from rdbms import predicate
+from rdbms.parser import parse, tokenize
+from rdbms.predicate import Compare, In, Between, IsNull, Like, Not, And, Or
+
+OPS = ["=", "!=", "<", ">", "<=", ">="]
+TEXTS = ["", "a", "ab", "abc", "b_c", "ba", "a%b", "cab", None]
+PATTERNS = ["a%", "%b", "%a%", "a_", "_b%", "a%b", "", "%", "b\\_c", "%_%", "a.c", "abc", None]
+
+
+def like(text, pattern):
+    # % any text, _ one character
+    if not pattern:
+        return not text
+    if pattern[0] == "%":
+        return any(like(text[i:], pattern[1:]) for i in range(len(text) + 1))
+    return bool(text) and (pattern[0] == "_" or pattern[0] == text[0]) and like(text[1:], pattern[1:])
+
+
+def interpret(node, row):
+    # NULL equals only NULL and never satisfies an ordering comparison
+    if isinstance(node, And):
+        return all(interpret(item, row) for item in node.items)
+    if isinstance(node, Or):
+        return any(interpret(item, row) for item in node.items)
+    if isinstance(node, Not):
+        return not interpret(node.item, row)
+    value = row.get(node.column)
+    if isinstance(node, IsNull):
+        return value is None
+    if isinstance(node, In):
+        return any(value == v if v is not None else value is None for v in node.values)
+    if isinstance(node, Like):
+        return value is not None and node.pattern is not None and like(str(value), str(node.pattern))
+    if isinstance(node, Between):
+        return None not in (value, node.low, node.high) and node.low <= value <= node.high
+    if node.value is None or value is None:
+        return {"=": value is node.value, "!=": value is not node.value}.get(node.op, False)
+    return {"=": value == node.value, "!=": value != node.value, "<": value < node.value,
+            ">": value > node.value, "<=": value <= node.value, ">=": value >= node.value}[node.op]
+
+
+def condition(rnd):
+    column = rnd.choice(["n", "s"])
+    values = [None] + list(range(-2, 6)) if column == "n" else TEXTS
+    kind = rnd.randrange(5)
+    if kind == 0:
+        return Compare(column, rnd.choice(OPS), rnd.choice(values))
+    if kind == 1:
+        return In(column, rnd.sample(values, rnd.randint(1, 4)))
+    if kind == 2:
+        return Between(column, rnd.choice(values), rnd.choice(values))
+    if kind == 3:
+        return IsNull(column)
+    return Like(column, rnd.choice(PATTERNS + ["1%", "%2"]))
+
+
+def tree(rnd, depth=3):
+    if depth == 0 or rnd.random() < 0.3:
+        return condition(rnd)
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return Not(tree(rnd, depth - 1))
+    items = [tree(rnd, depth - 1) for _ in range(rnd.randint(2, 3))]
+    return And(items) if kind == 1 else Or(items)
+
+
+def sample_rows(rnd, count):
+    return [{"id": i, "n": rnd.choice([None] + list(range(-2, 6))), "s": rnd.choice(TEXTS)} for i in range(count)]
+
+
+def test_compiled_trees_match_the_interpreter():
+    rnd = random.Random(7)
+    rows = sample_rows(rnd, 60) + [{"id": 99}]  # a row without the columns reads them as NULL
+    for _ in range(400):
+        node = tree(rnd)
+        test = node.compiled()
+        for row in rows:
+            assert test(row) == interpret(node, row), (node, row)
+
+
+def test_value_tests_match_the_interpreter():
+    rnd = random.Random(8)
+    for _ in range(300):
+        node = condition(rnd)
+        if rnd.random() < 0.3:
+            node = Not(node)
+        test = node.value_test()
+        for value in ([None] + list(range(-2, 6)) if node.columns() == ["n"] else TEXTS):
+            assert test(value) == interpret(node, {node.columns()[0]: value}), (node, value)
+
+
+def test_trees_of_one_shape_share_generated_code():
+    first = Or([In("n", [1, 2]), Like("s", "a%")])
+    first.compiled()
+    count = len(predicate._factories)
+    second = Or([In("n", [4, 5]), Like("s", "b%")])
+    assert second.compiled()({"n": 5}) and not first.compiled()({"n": 5})
+    assert len(predicate._factories) == count
+
+
+WHERES = [
+    "n = 3", "n != 3", "n = NULL", "n != NULL", "n < 2", "n >= NULL", "n IS NULL", "n IS NOT NULL",
+    "n IN (1, 3, NULL)", "n NOT IN (1, 3)", "s IN ('', ab, NULL)", "s NOT IN (a, ba)",
+    "n BETWEEN 1 AND 3", "n NOT BETWEEN 0 AND 2", "n BETWEEN 1 AND NULL",
+    "s LIKE 'a%'", "s LIKE '%b'", "s LIKE '_b%'", "s NOT LIKE '%a%'", "s LIKE ''", "n LIKE '1%'",
+    "s = ab OR n IS NULL", "NOT (n > 2 AND s LIKE 'a%')", "(n < 1 OR n > 4) AND s IS NOT NULL",
+]
+
+
+@pytest.mark.parametrize("storage", ["ROW", "COLUMN"])
+def test_select_matches_filtering_in_python(executor, storage):
+    rows = sample_rows(random.Random(9), 200)
+    executor.execute(f"CREATE TABLE t id:INT n:INT s:TEXT PRIMARY_KEY=id STORAGE={storage}")
+    executor.insert_many("t", [dict(row) for row in rows])
+    for where in WHERES:
+        node, _ = parse(tokenize(f"SELECT * FROM t WHERE {where}"))
+        expected = [row["id"] for row in rows if interpret(node.where, row)]
+        got = sorted(row["id"] for row in executor.execute(f"SELECT id FROM t WHERE {where}"))
+        assert got == expected, where
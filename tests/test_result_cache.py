@@ -0,0 +1,110 @@
+# test_result_cache.py
+# Cached SELECT results are served until a write gives a table read by the
+# statement a new version, and never afterwards.
+import pytest
+
+from rdbms.executor import Executor
+
+QUERY = "SELECT id, v FROM t WHERE v >= 20 ORDER BY id"
+
+
+@pytest.fixture
+def cached(data_dir):
+    executor = Executor(result_cache_bytes=1024 * 1024)
+    executor.execute("CREATE TABLE t id:INT v:INT PRIMARY_KEY=id")
+    executor.execute("CREATE TABLE u id:INT t_id:INT PRIMARY_KEY=id")
+    for i in range(5):
+        executor.execute(f"INSERT t id={i} v={i * 10}")
+        executor.execute(f"INSERT u id={i} t_id={i % 2}")
+    yield executor
+    executor.tables.close()
+
+
+def stats(executor):
+    found = executor.cache_stats()
+    return found["hits"], found["misses"]
+
+
+def test_repeated_select_is_served_from_the_cache(cached):
+    first = cached.execute(QUERY)
+    first[0]["v"] = -1  # callers get copies
+    assert cached.execute(QUERY) == [{"id": 2, "v": 20}, {"id": 3, "v": 30}, {"id": 4, "v": 40}]
+    assert stats(cached) == (1, 1)
+    assert cached.execute("SELECT id, v FROM t WHERE v >= 30 ORDER BY id") == [{"id": 3, "v": 30}, {"id": 4, "v": 40}]
+    assert stats(cached) == (1, 2)  # other literals, other entry
+
+
+def write_copy(executor, data_dir):
+    (data_dir / "more.csv").write_text("id,v\n7,70\n")
+    executor.execute("COPY t FROM 'more.csv'")
+
+
+@pytest.mark.parametrize("write, expected", [
+    (lambda e, d: e.execute("INSERT t id=9 v=90"), [2, 3, 4, 9]),
+    (lambda e, d: e.insert_many("t", [{"id": 8, "v": 80}]), [2, 3, 4, 8]),
+    (lambda e, d: e.execute("UPDATE t SET v=0 WHERE id=3"), [2, 4]),
+    (lambda e, d: e.execute("DELETE FROM t WHERE id=2"), [3, 4]),
+    (write_copy, [2, 3, 4, 7]),
+    (lambda e, d: e.execute("CREATE INDEX ON t(v) USING ORDERED"), [2, 3, 4]),
+], ids=["insert", "insert_many", "update", "delete", "copy", "create_index"])
+def test_writes_invalidate_cached_results(cached, data_dir, write, expected):
+    cached.execute(QUERY)
+    write(cached, data_dir)
+    assert [row["id"] for row in cached.execute(QUERY)] == expected
+    assert stats(cached) == (0, 2)
+    cached.execute(QUERY)
+    assert stats(cached) == (1, 2)
+
+
+def test_writes_to_other_tables_keep_cached_results(cached):
+    cached.execute(QUERY)
+    cached.execute("INSERT u id=9 t_id=4")
+    cached.execute(QUERY)
+    assert stats(cached) == (1, 1)
+
+
+def test_a_write_to_either_side_invalidates_a_join(cached):
+    sql = "SELECT t.id, u.id FROM t JOIN u ON t.id=u.t_id WHERE t.v < 20"
+    assert len(cached.execute(sql)) == 5
+    cached.execute("INSERT u id=9 t_id=1")
+    assert len(cached.execute(sql)) == 6
+    cached.execute("UPDATE t SET v=50 WHERE id=1")
+    assert len(cached.execute(sql)) == 3
+    assert stats(cached) == (0, 3)
+
+
+def test_transactions_and_rollback(cached):
+    session, other = cached.session(), cached.session()
+    committed = cached.execute(QUERY)
+    cached.execute("BEGIN", session=session)
+    cached.execute("DELETE FROM t WHERE id=4", session=session)
+    assert cached.execute(QUERY, session=other) == committed  # the committed version, from the cache
+    assert [row["id"] for row in cached.execute(QUERY, session=session)] == [2, 3]
+    cached.execute("ROLLBACK", session=session)
+    assert cached.execute(QUERY, session=session) == committed
+    cached.execute("BEGIN", session=session)
+    cached.execute("DELETE FROM t WHERE id=4", session=session)
+    cached.execute("COMMIT", session=session)
+    assert [row["id"] for row in cached.execute(QUERY, session=other)] == [2, 3]
+
+
+def test_reset_and_recreated_tables_miss(cached):
+    cached.execute(QUERY)
+    cached.reset()
+    assert cached.cache_stats()["entries"] == 0
+    cached.execute("CREATE TABLE t id:INT v:INT PRIMARY_KEY=id")
+    assert cached.execute(QUERY) == []
+    cached.execute("INSERT t id=5 v=50")
+    assert cached.execute(QUERY) == [{"id": 5, "v": 50}]
+
+
+def test_least_recently_used_results_are_evicted(data_dir):
+    executor = Executor(result_cache_bytes=2000)
+    executor.execute("CREATE TABLE t id:INT v:INT PRIMARY_KEY=id")
+    for i in range(5):
+        executor.execute(f"INSERT t id={i} v={i}")
+    for i in range(10):
+        executor.execute(f"SELECT * FROM t WHERE v >= {i % 5}")
+    found = executor.cache_stats()
+    assert found["evictions"] > 0 and found["bytes"] <= 2000
+    executor.tables.close()
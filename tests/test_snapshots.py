@@ -0,0 +1,201 @@
+# test_snapshots.py
+# The snapshots SELECT reads while writers go on, and the sessions that hold
+# them through a transaction.
+import random
+import threading
+
+import pytest
+
+from conftest import state, check_keys_and_indexes
+from rdbms.chunked import CHUNK, ChunkedBag, ChunkedDict, ChunkedSequence
+from rdbms.index import HashIndex, OrderedIndex
+
+
+def test_cursor_reads_the_snapshot_it_started_with(executor, keyed_table):
+    cursor = executor.cursor("SELECT id FROM t")
+    assert cursor.fetchone() == {"id": 0}
+    executor.execute("DELETE FROM t WHERE id=3")
+    executor.execute("INSERT t id=20 name=late v=1")
+    assert [r["id"] for r in cursor.fetchall()] == [1, 2, 3, 4]
+    assert [r[0] for r in state(executor)] == [0, 1, 2, 4, 20]
+
+
+def test_other_sessions_read_committed_rows_and_cannot_write(executor, keyed_table):
+    before = state(executor)
+    writer, other = executor.session(), executor.session()
+    writer.execute("BEGIN")
+    writer.execute("INSERT t id=10 name=new v=5")
+    writer.execute("DELETE FROM t WHERE id=0")
+    assert [r[0] for r in state(writer)] == [1, 2, 3, 4, 10]
+    assert state(other) == before
+    assert state(executor) == before
+    assert executor.execute("SELECT id FROM t WHERE id=10") == []
+    for statement in ["INSERT t id=11 name=x v=1", "UPDATE t SET v=1 WHERE id=1", "DELETE FROM t WHERE id=1"]:
+        with pytest.raises(ValueError, match="another transaction"):
+            other.execute(statement)
+        with pytest.raises(ValueError, match="another transaction"):
+            executor.execute(statement)
+    with pytest.raises(ValueError, match="No transaction"):
+        other.execute("COMMIT")
+
+    writer.execute("COMMIT")
+    assert [r[0] for r in state(other)] == [1, 2, 3, 4, 10]
+    other.execute("UPDATE t SET v=1 WHERE id=1")  # the table is free again
+    check_keys_and_indexes(executor, state(executor))
+
+
+def test_begin_needs_a_session(executor, keyed_table):
+    with pytest.raises(ValueError, match="session"):
+        executor.execute("BEGIN")
+    with pytest.raises(ValueError, match="No transaction"):
+        executor.execute("COMMIT")
+
+
+def test_closing_a_session_rolls_back(executor, keyed_table):
+    before = state(executor)
+    session = executor.session()
+    session.execute("BEGIN")
+    session.execute("UPDATE t SET v=99 WHERE id=1")
+    session.close()
+    assert session.transaction is None
+    assert state(executor) == before
+    executor.execute("UPDATE t SET v=98 WHERE id=1")
+
+
+def test_sessions_in_threads_keep_their_own_transactions(executor, keyed_table):
+    executor.execute("CREATE TABLE u id:INT v:INT PRIMARY_KEY=id")
+    errors = []
+
+    def work(name, rows, action):
+        try:
+            session = executor.session()
+            session.execute("BEGIN")
+            for i in rows:
+                session.execute(f"INSERT {name} id={i} name=w{i} v=0" if name == "t" else f"INSERT {name} id={i} v=0")
+            session.execute(action)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=("t", range(100, 150), "COMMIT")),
+               threading.Thread(target=work, args=("u", range(50), "ROLLBACK"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(state(executor)) == 55
+    assert executor.execute("SELECT * FROM u") == []
+
+
+# ----------------- COPY ON WRITE -----------------
+BIG = 3 * CHUNK + 100  # rows spread over several chunks
+BIG_QUERIES = {  # WHERE -> the same condition in Python
+    "id=5": lambda r: r["id"] == 5,
+    f"id={BIG - 1}": lambda r: r["id"] == BIG - 1,
+    "name=n2000": lambda r: r["name"] == "n2000",
+    "g=3": lambda r: r["g"] == 3,
+    "v>=3000": lambda r: r["v"] >= 3000,
+    "v BETWEEN 100 AND 140": lambda r: 100 <= r["v"] <= 140,
+    "v<0": lambda r: r["v"] < 0,
+    "name=n10 OR g=100": lambda r: r["name"] == "n10" or r["g"] == 100,
+}
+
+
+@pytest.fixture(params=["ROW", "COLUMN"])
+def big(request, executor):
+    executor.execute(f"CREATE TABLE big id:INT name:TEXT g:INT v:INT PRIMARY_KEY=id UNIQUE=name "
+                     f"STORAGE={request.param}")
+    executor.execute("CREATE INDEX ON big(g)")
+    executor.execute("CREATE INDEX ON big(v) USING ORDERED")
+    executor.insert_many("big", [{"id": i, "name": f"n{i}", "g": i % 7, "v": i} for i in range(BIG)])
+    return "big"
+
+
+def answers(reader):
+    return {where: sorted(r["id"] for r in reader.execute(f"SELECT id FROM big WHERE {where}"))
+            for where in BIG_QUERIES}
+
+
+def write_everywhere(session):
+    # changes rows, keys and index entries in every chunk, and adds a chunk
+    session.execute("UPDATE big SET v=-1 WHERE g=3")
+    session.execute("UPDATE big SET name=renamed, g=100 WHERE id=2000")
+    session.execute("DELETE FROM big WHERE v BETWEEN 100 AND 120")
+    session.execute("UPDATE big SET name=n2000 WHERE id=5")
+    session.insert_many("big", [{"id": BIG + i, "name": f"new{i}", "g": 3, "v": 5000 + i} for i in range(CHUNK)])
+
+
+def test_snapshot_is_unchanged_by_writes_to_every_chunk(executor, big):
+    rows = executor.execute("SELECT * FROM big")
+    before = answers(executor)
+    assert before == {where: sorted(r["id"] for r in rows if test(r)) for where, test in BIG_QUERIES.items()}
+    writer, other = executor.session(), executor.session()
+    cursor = executor.cursor("SELECT * FROM big")
+    writer.execute("BEGIN")
+    write_everywhere(writer)
+    # other sessions read the table as it was at BEGIN, through its keys and indexes too
+    assert answers(other) == before
+    assert cursor.fetchall() == rows
+    writer.execute("COMMIT")
+
+    rows = executor.execute("SELECT * FROM big")
+    assert len(rows) == BIG - 18 + CHUNK  # v 100 to 120, but for the three rows of g=3 set to -1
+    assert answers(other) == {where: sorted(r["id"] for r in rows if test(r)) for where, test in BIG_QUERIES.items()}
+
+
+def test_rollback_after_a_snapshot_restores_every_chunk(executor, big):
+    before = answers(executor)
+    rows = executor.execute("SELECT * FROM big")
+    session = executor.session()
+    cursor = executor.cursor("SELECT * FROM big")
+    session.execute("BEGIN")
+    write_everywhere(session)
+    session.execute("ROLLBACK")
+    assert cursor.fetchall() == rows
+    assert executor.execute("SELECT * FROM big") == rows
+    assert answers(executor) == before
+
+
+def test_chunked_copies_share_nothing_they_change():
+    rng = random.Random(5)
+    items = [rng.randrange(1000) for _ in range(3 * CHUNK + 7)]
+    sequence = ChunkedSequence([], items)
+    mapping = ChunkedDict((i, value) for i, value in enumerate(items))
+    bag = ChunkedBag(items)
+    copies = sequence.copy(), mapping.copy(), bag.copy()
+    for pos in range(0, len(items), 500):
+        sequence[pos] = -1
+        mapping[pos] = -1
+        mapping[-pos - 1] = pos
+        bag.remove(items[pos])
+    sequence.extend(range(CHUNK))
+    sequence.truncate(2 * CHUNK + 1)
+    assert list(copies[0]) == items
+    assert copies[0].take(range(CHUNK - 3, CHUNK + 3)) == items[CHUNK - 3:CHUNK + 3]
+    assert dict(copies[1].items()) == dict(enumerate(items))
+    assert sorted(copies[2]) == sorted(items)
+    assert list(sequence) == [-1 if pos % 500 == 0 else item for pos, item in enumerate(items)][:2 * CHUNK + 1]
+    assert len(mapping) == len(items) + len(range(0, len(items), 500))
+    assert len(bag) == len(items) - len(range(0, len(items), 500))
+
+
+@pytest.mark.parametrize("kind", [HashIndex, OrderedIndex])
+def test_index_copies_keep_their_entries(kind):
+    rng = random.Random(7)
+    values = [rng.randrange(40) for _ in range(4 * CHUNK)]
+    index = kind("v")
+    index.build(values)
+    copy = index.copy()
+    for pos in range(0, len(values), 3):
+        index.remove(values[pos], pos)
+    for pos in range(len(values), len(values) + 2 * CHUNK):
+        index.add(20, pos)  # enough equal values to split parts and outgrow a chunk
+    for value in range(40):
+        assert copy.lookup("=", value) == [pos for pos, v in enumerate(values) if v == value]
+        expected = [pos for pos, v in enumerate(values) if v == value and pos % 3]
+        expected += list(range(len(values), len(values) + 2 * CHUNK)) if value == 20 else []
+        assert index.lookup("=", value) == expected
+    if kind is OrderedIndex:
+        assert len(copy) == len(values)
+        assert list(copy.ordered(">", 37, descending=True)) == \
+            [pos for v, pos in sorted(((v, pos) for pos, v in enumerate(values) if v > 37), reverse=True)]
@@ -0,0 +1,104 @@
+# test_transactions.py
+# BEGIN / COMMIT / ROLLBACK, and bulk loads through insert_many and COPY.
+import json
+import os
+
+import pytest
+
+from conftest import reopen, state, check_keys_and_indexes
+from rdbms.executor import Executor
+
+
+def test_rollback_undoes_insert_update_and_delete(executor, keyed_table):
+    before = state(executor)
+    session = executor.session()
+    session.execute("BEGIN")
+    session.execute("INSERT t id=10 name=new v=5")
+    session.execute("UPDATE t SET v=99 WHERE id=1")
+    session.execute("UPDATE t SET name=renamed WHERE id=2")
+    session.execute("DELETE FROM t WHERE id=3")
+    assert len(state(session)) == 5
+    session.execute("ROLLBACK")
+
+    assert state(executor) == before
+    check_keys_and_indexes(executor, before)
+    assert executor.execute("SELECT * FROM t WHERE id=10") == []
+    executor.execute("INSERT t id=10 name=new v=5")  # the rolled back keys are free again
+    with pytest.raises(ValueError):
+        executor.execute("INSERT t id=11 name=n3 v=0")  # and the restored ones are taken
+
+
+def test_commit_is_written_and_rollback_is_not(executor, keyed_table):
+    session = executor.session()
+    session.execute("BEGIN")
+    session.execute("INSERT t id=10 name=kept v=1")
+    session.execute("COMMIT")
+    session.execute("BEGIN")
+    session.execute("INSERT t id=11 name=dropped v=1")
+    session.execute("ROLLBACK")
+    expected = state(executor)
+
+    executor = reopen(executor)
+    assert state(executor) == expected
+    assert [r[0] for r in expected] == [0, 1, 2, 3, 4, 10]
+
+
+# ----------------- COPY -----------------
+def write(path, text):
+    path.write_text(text)
+    return path
+
+
+def test_copy_loads_csv_and_jsonl(executor, data_dir, keyed_table):
+    write(data_dir / "more.csv", "id,name,v\n10,a,1\n11,b,\n")
+    write(data_dir / "more.jsonl", json.dumps({"id": 12, "name": "c", "v": "3"}) + "\n\n"
+          + json.dumps({"id": 13, "name": "d"}) + "\n")
+    executor.execute("COPY t FROM 'more.csv'")
+    executor.execute("COPY t FROM 'more.jsonl'")
+    expected = state(executor)
+    assert expected[5:] == [(10, "a", 1), (11, "b", None), (12, "c", 3), (13, "d", None)]
+    assert state(reopen(executor)) == expected
+
+
+def test_copy_checks_keys_for_the_whole_file(executor, data_dir, keyed_table):
+    before = state(executor)
+    write(data_dir / "dup.csv", "id,name,v\n10,a,1\n11,n2,2\n")
+    with pytest.raises(ValueError, match="Unique constraint violation on 'name'"):
+        executor.execute("COPY t FROM 'dup.csv'")
+    assert state(executor) == before
+    check_keys_and_indexes(executor, before)
+
+
+def test_copy_reads_only_the_import_directory(executor, data_dir, tmp_path, keyed_table):
+    secret = write(tmp_path / "secret.csv", "id,name,v\n99,secret,1\n")
+    os.symlink(secret, data_dir / "link.csv")
+    for path in ["../secret.csv", str(secret), "link.csv"]:
+        with pytest.raises(ValueError, match="import directory"):
+            executor.execute(f"COPY t FROM '{path}'")
+    with pytest.raises(ValueError, match="does not exist"):
+        executor.execute("COPY t FROM 'missing.csv'")
+
+    imports = tmp_path / "imports"
+    imports.mkdir()
+    write(imports / "rows.csv", "id,name,v\n20,x,1\n")
+    executor = Executor(import_dir=str(imports))
+    executor.execute("COPY t FROM 'rows.csv'")
+    assert executor.execute("SELECT id FROM t WHERE name=x") == [{"id": 20}]
+    with pytest.raises(ValueError, match="import directory"):
+        executor.execute("COPY t FROM '../secret.csv'")
+
+
+@pytest.mark.parametrize("name, text, error", [
+    ("bad.csv", "id,name,v\n10,a,1\n11,b,SECRET\n", "Invalid INT value for column 'v' on line 3"),
+    ("bad.jsonl", '{"id": 10, "name": "a"}\n{"id": "SECRET", "name": "b"}\n',
+     "Invalid INT value for column 'id' on line 2"),
+    ("bad.jsonl", '{"id": 10, "name": "a"}\nSECRET\n', "Invalid JSON on line 2"),
+    ("bad.jsonl", '["SECRET"]\n', "Line 1 is not a JSON object"),
+])
+def test_copy_errors_name_the_line_not_the_content(executor, data_dir, keyed_table, name, text, error):
+    before = state(executor)
+    write(data_dir / name, text)
+    with pytest.raises(ValueError) as info:
+        executor.execute(f"COPY t FROM '{name}'")
+    assert str(info.value) == error
+    assert state(executor) == before
@@ -0,0 +1,88 @@
+# test_writes.py
+# Rejected writes: values outside the column types change nothing, and keys
+# and indexes keep finding every row.
+import os
+
+import pytest
+
+from conftest import reopen
+from rdbms.storage import ColumnStore
+
+TYPED_LAYOUTS = [("COLUMN", "JSON"), ("COLUMN", "PAGED"), ("ROW", "PAGED")]
+
+
+@pytest.fixture(params=TYPED_LAYOUTS, ids="-".join)
+def table(request, executor):
+    storage, file_format = request.param
+    executor.execute(f"CREATE TABLE t id:INT name:TEXT v:INT PRIMARY_KEY=id UNIQUE=name "
+                     f"STORAGE={storage} FORMAT={file_format}")
+    executor.execute("CREATE INDEX ON t(v) USING ORDERED")
+    for i in range(5):
+        executor.execute(f"INSERT t id={i} name=n{i} v={i * 10}")
+    return "t"
+
+
+def state(executor):
+    return sorted((r["id"], r["name"], r["v"]) for r in executor.execute("SELECT * FROM t"))
+
+
+def check_keys_and_indexes(executor, expected):
+    for id_, name, v in expected:
+        assert executor.execute(f"SELECT id FROM t WHERE id={id_}") == [{"id": id_}]
+        assert executor.execute(f"SELECT id FROM t WHERE name={name}") == [{"id": id_}]
+        assert {"id": id_} in executor.execute(f"SELECT id FROM t WHERE v={v}")
+
+
+@pytest.mark.parametrize("value", [2 ** 63, -2 ** 63 - 1, 10 ** 30])
+def test_int_outside_64_bits_is_rejected(executor, table, value):
+    before = state(executor)
+    with pytest.raises(ValueError, match="out of range"):
+        executor.execute(f"INSERT t id=9 name=x v={value}")
+    with pytest.raises(ValueError, match="out of range"):
+        executor.execute(f"UPDATE t SET v={value} WHERE id=1")
+    with pytest.raises(ValueError, match="out of range"):
+        executor.insert_many("t", [{"id": 9, "name": "x", "v": value}])
+    assert state(executor) == before
+    check_keys_and_indexes(executor, before)
+    executor.execute(f"INSERT t id=9 name=x v={2 ** 63 - 1}")  # the largest one fits
+    executor.execute(f"UPDATE t SET v={-2 ** 63} WHERE id=1")
+    expected = state(executor)
+
+    executor = reopen(executor)
+    assert state(executor) == expected
+    check_keys_and_indexes(executor, expected)
+
+
+def test_failed_update_keeps_keys_and_indexes(executor, table):
+    before = state(executor)
+    with pytest.raises(ValueError, match="violation"):
+        executor.execute("UPDATE t SET name=n2 WHERE id=1")
+    with pytest.raises(ValueError, match="Invalid INT"):
+        executor.execute("UPDATE t SET v=abc WHERE id=1")
+    assert state(executor) == before
+    check_keys_and_indexes(executor, before)
+    executor.execute("UPDATE t SET name=renamed, v=7 WHERE id=1")
+    check_keys_and_indexes(executor, state(executor))
+
+
+def test_paged_table_still_checkpoints_after_a_rejected_int(executor, data_dir, table):
+    # a value the page format cannot hold never reaches the log, so it cannot
+    # make every later checkpoint fail
+    with pytest.raises(ValueError, match="out of range"):
+        executor.execute(f"INSERT t id=9 name=x v={2 ** 64}")
+    executor.execute("INSERT t id=9 name=x v=90")
+    expected = state(executor)
+    executor.tables["t"].checkpoint()
+    assert not os.path.exists(data_dir / "t.log")
+
+    executor = reopen(executor)
+    assert state(executor) == expected
+    check_keys_and_indexes(executor, expected)
+
+
+def test_column_store_update_leaves_the_row_whole_on_overflow():
+    store = ColumnStore({"a": "INT", "b": "INT"})
+    store.append({"a": 1, "b": 2})
+    with pytest.raises(ValueError, match="out of range"):
+        store.update(0, {"a": 5, "b": 2 ** 64})
+    assert store.get(0) == {"a": 1, "b": 2}